@@ -0,0 +1,125 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import Employee, Project, Task
+
+LOAD_PREFIX = "[load] "
+
+LEVELS = ["Analyst", "Consultant", "Senior Consultant", "Manager", "Senior Manager"]
+DEPARTMENTS = ["AI and Data", "Cloud", "Fullstack", "Cyber Security", "Data Engineering"]
+TASK_VERBS = ["Design", "Implement", "Review", "Test", "Document", "Deploy", "Refactor", "Monitor"]
+TASK_OBJECTS = ["the ingestion pipeline", "the REST API", "the dashboard", "the data model",
+                "the CI workflow", "the access controls", "the reporting module", "the search index"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-insert synthetic employees, projects and tasks for load testing the board APIs, "
+        "e.g. --employees 50000 --projects 10000 --tasks 1000000. Generated rows are marked "
+        f"with a '{LOAD_PREFIX.strip()}' name prefix and can be removed with --clear."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--employees", type=int, default=1000)
+        parser.add_argument("--projects", type=int, default=200)
+        parser.add_argument("--tasks", type=int, default=10000, help="Total tasks, spread over the projects")
+        parser.add_argument("--team-size", type=int, default=8, help="Employees linked to each project")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--clear", action="store_true", help="Delete previously generated load data first")
+
+    def handle(self, *args, **options):
+        if options["employees"] < 1 and (options["projects"] or options["tasks"]):
+            raise CommandError("At least one employee is needed to build project teams.")
+        if options["tasks"] and options["projects"] < 1:
+            raise CommandError("Tasks need at least one project.")
+
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+        start = time.perf_counter()
+
+        if options["clear"]:
+            self.clear()
+
+        employee_ids = self.create_employees(options["employees"], batch_size, rng)
+        teams = self.create_projects(options["projects"], employee_ids, options["team_size"], batch_size, rng)
+        self.create_tasks(options["tasks"], teams, batch_size, rng)
+
+        elapsed = time.perf_counter() - start
+        rows = options["employees"] + options["projects"] + options["tasks"]
+        self.stdout.write(self.style.SUCCESS(
+            f"Inserted {options['employees']} employees, {options['projects']} projects and "
+            f"{options['tasks']} tasks in {elapsed:.1f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)."
+        ))
+
+    def clear(self):
+        projects = Project.objects.filter(name__startswith=LOAD_PREFIX)
+        deleted_tasks, _ = Task.objects.filter(project__in=projects).delete()
+        deleted_projects, _ = projects.delete()
+        deleted_employees, _ = Employee.objects.filter(name__startswith=LOAD_PREFIX).delete()
+        self.stdout.write(f"Cleared previous load data ({deleted_tasks + deleted_projects + deleted_employees} rows).")
+
+    def batches(self, total, batch_size):
+        for offset in range(0, total, batch_size):
+            yield offset, min(batch_size, total - offset)
+
+    def create_employees(self, count, batch_size, rng):
+        employee_ids = []
+        for offset, size in self.batches(count, batch_size):
+            employees = [
+                Employee(
+                    name=f"{LOAD_PREFIX}Employee {offset + index}",
+                    level=rng.choice(LEVELS),
+                    department=rng.choice(DEPARTMENTS),
+                )
+                for index in range(size)
+            ]
+            with transaction.atomic():
+                employee_ids.extend(employee.pk for employee in Employee.objects.bulk_create(employees))
+            self.stdout.write(f"Employees: {offset + size}/{count}")
+        return employee_ids
+
+    def create_projects(self, count, employee_ids, team_size, batch_size, rng):
+        """
+        Create projects with their team memberships; returns {project_id: [employee ids]}.
+        """
+        teams = {}
+        Membership = Project.employees.through
+        for offset, size in self.batches(count, batch_size):
+            projects = [
+                Project(
+                    name=f"{LOAD_PREFIX}Project {offset + index}",
+                    description=f"Synthetic project {offset + index} generated for load testing.",
+                )
+                for index in range(size)
+            ]
+            memberships = []
+            with transaction.atomic():
+                for project in Project.objects.bulk_create(projects):
+                    team = rng.sample(employee_ids, min(team_size, len(employee_ids)))
+                    teams[project.pk] = team
+                    memberships.extend(Membership(project_id=project.pk, employee_id=employee_id) for employee_id in team)
+                Membership.objects.bulk_create(memberships, batch_size=batch_size)
+            self.stdout.write(f"Projects: {offset + size}/{count}")
+        return teams
+
+    def create_tasks(self, count, teams, batch_size, rng):
+        project_ids = list(teams)
+        statuses = [status for status, _ in Task.STATUS_CHOICES]
+        for offset, size in self.batches(count, batch_size):
+            tasks = []
+            for index in range(offset, offset + size):
+                # Round-robin keeps the per-project task count even (tasks / projects)
+                project_id = project_ids[index % len(project_ids)]
+                tasks.append(Task(
+                    project_id=project_id,
+                    employee_id=rng.choice(teams[project_id]) if teams[project_id] else None,
+                    description=f"{rng.choice(TASK_VERBS)} {rng.choice(TASK_OBJECTS)} (task {index})",
+                    status=rng.choice(statuses),
+                ))
+            with transaction.atomic():
+                Task.objects.bulk_create(tasks)
+            self.stdout.write(f"Tasks: {offset + size}/{count}")
@@ -0,0 +1,167 @@
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .utils.log_utils import set_request_id
+from .utils.metrics import DB_QUERIES_PER_REQUEST, HTTP_REQUEST_DURATION
+from .utils.model_scheduler import set_tenant
+from .utils.profiling import PROFILE_MODES, get_profile_store, profile_interval, run_profiled
+from .utils.tracing import format_traceparent, get_tracer
+
+
+class RequestIdMiddleware:
+    """
+    Bind a request id to each request so log records from every layer can be correlated.
+    Honours a well-formed incoming X-Request-ID header (up to 64 letters, digits, ".", "_" or
+    "-"; anything else is replaced) and echoes the id back on the response. Also sets
+    the tenant the request's model calls are fair-queued under: the X-Kage-Tenant header,
+    else the client address.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.request_id = set_request_id(request.headers.get("X-Request-ID"))
+        set_tenant(request.headers.get("X-Kage-Tenant") or request.META.get("REMOTE_ADDR"))
+        response = self.get_response(request)
+        response["X-Request-ID"] = request.request_id
+        return response
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting the queries run while it is installed.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """
+    Record view latency per route and the number of DB queries each request runs.
+    Routes are labelled by their URL pattern (e.g. "project/<int:project_id>/") to keep
+    the label set bounded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, "resolver_match", None)
+        route = match.route if match else "unmatched"
+        HTTP_REQUEST_DURATION.observe(elapsed, route=route, method=request.method, status=response.status_code)
+        DB_QUERIES_PER_REQUEST.observe(queries.count, route=route)
+        return response
+
+
+class QueryTracer:
+    """
+    Database execute wrapper opening a child span for every query.
+    """
+
+    def __init__(self, tracer, max_statement_length: int = 500):
+        self.tracer = tracer
+        self.max_statement_length = max_statement_length
+
+    def __call__(self, execute, sql, params, many, context):
+        attributes = {
+            "db.system": connection.vendor,
+            "db.statement": sql[:self.max_statement_length],
+            "db.executemany": many,
+        }
+        with self.tracer.start_as_current_span("db.query", attributes=attributes):
+            return execute(sql, params, many, context)
+
+
+class TracingMiddleware:
+    """
+    Open a root span per request, continuing the caller's trace when a W3C traceparent
+    header is sent. Spans opened further down (DB queries, GitHub stages, model calls)
+    become its children; the span is renamed to the matched route once the view has run.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        tracer = get_tracer()
+        attributes = {
+            "http.method": request.method,
+            "http.target": request.path,
+            "kage.request_id": getattr(request, "request_id", None) or "",
+        }
+        trace_parent = request.headers.get("traceparent")
+
+        with tracer.start_as_current_span(f"HTTP {request.method}", attributes=attributes, trace_parent=trace_parent) as span:
+            with connection.execute_wrapper(QueryTracer(tracer)):
+                response = self.get_response(request)
+
+            match = getattr(request, "resolver_match", None)
+            route = match.route if match else "unmatched"
+            span.update_name(f"HTTP {request.method} {route}")
+            span.set_attribute("http.route", route)
+            span.set_attribute("http.status_code", response.status_code)
+            response["traceparent"] = format_traceparent(span)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Run selected requests under cProfile or the sampling profiler and keep the result in the
+    profile store. A request is profiled when it sends `X-Kage-Profile: cprofile|sample` and
+    PROFILING_ENABLED is on, or when it is picked by PROFILING_SAMPLE_RATE. The stored profile
+    id is returned in the X-Kage-Profile-Id response header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _profile_mode(self, request):
+        if request.path.startswith("/profiles/"):
+            return None
+        requested = request.headers.get("X-Kage-Profile")
+        if requested and settings.PROFILING_ENABLED:
+            return requested if requested in PROFILE_MODES else settings.PROFILING_DEFAULT_MODE
+        if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+            return settings.PROFILING_DEFAULT_MODE
+        return None
+
+    def __call__(self, request):
+        mode = self._profile_mode(request)
+        if mode is None:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        response, content, mode = run_profiled(mode, self.get_response, request, interval=profile_interval())
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if content is None:
+            # The profiler failed; the request itself was served normally
+            return response
+
+        match = getattr(request, "resolver_match", None)
+        profile_id = get_profile_store().add(
+            mode=mode,
+            method=request.method,
+            path=request.path,
+            route=match.route if match else "unmatched",
+            status=response.status_code,
+            duration_ms=elapsed_ms,
+            content=content,
+            request_id=getattr(request, "request_id", None),
+        )
+        response["X-Kage-Profile-Id"] = str(profile_id)
+        return response
@@ -46,6 +46,10 @@ class Task(models.Model):
     
     status = models.CharField(max_length=50, choices=STATUS_CHOICES, default='pending') 
 
+    department = models.CharField(max_length=255, null=True, blank=True)  # Department the task requires (two-phase plans)
+
+    level = models.CharField(max_length=255, null=True, blank=True)  # Experience level the task requires (two-phase plans)
+
     def __str__(self):
         return self.description
 
@@ -73,6 +77,148 @@ class GitHubRepository(models.Model):
         return self.name
 
 
+class Artifact(models.Model):
+    """Index entry for a blob written by the artifact store (plans, repo snapshots, model responses)."""
+
+    kind = models.CharField(max_length=64, db_index=True)
+
+    key = models.CharField(max_length=512)  # Object name inside the backend
+
+    backend = models.CharField(max_length=32)
+
+    project_name = models.CharField(max_length=255, null=True, blank=True, db_index=True)
+
+    job_id = models.CharField(max_length=64, null=True, blank=True, db_index=True)  # Request id that produced it
+
+    size = models.PositiveIntegerField(default=0)  # Uncompressed size in bytes
+
+    compressed = models.BooleanField(default=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind}: {self.key}"
+
+
+class FileSummary(models.Model):
+    """Model-written summary of one file version, reused by map-reduce repository analysis."""
+
+    blob_sha = models.CharField(max_length=64)  # Git blob SHA, so unchanged files hit the cache in any repo or branch
+
+    model_name = models.CharField(max_length=128)
+
+    path = models.CharField(max_length=1024)  # Path the summary was written for, for reference
+
+    summary = models.TextField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("blob_sha", "model_name")
+
+    def __str__(self):
+        return f"{self.path} ({self.blob_sha[:7]})"
+
+
+class RepositoryAnalysis(models.Model):
+    """Latest AI Assist analysis of a repository branch, the base for incremental re-analysis."""
+
+    repo_url = models.CharField(max_length=500)
+
+    branch = models.CharField(max_length=255)
+
+    commit_sha = models.CharField(max_length=64)  # Head commit the result describes
+
+    mode = models.CharField(max_length=32)  # full, map_reduce or incremental
+
+    model_name = models.CharField(max_length=128)
+
+    result = models.TextField()  # Tasks and refactors JSON
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("repo_url", "branch")
+
+    def __str__(self):
+        return f"{self.repo_url}@{self.branch} ({self.commit_sha[:7]})"
+
+
+class InFlightRequest(models.Model):
+    """Cross-process single-flight lease for an AI request, holding its result for late duplicates."""
+
+    STATUS_CHOICES = [
+        ('running', 'running'),
+        ('done', 'done'),
+        ('failed', 'failed'),
+    ]
+
+    key = models.CharField(max_length=64, unique=True)  # SHA-256 of the normalized request inputs
+
+    owner = models.CharField(max_length=64)  # Process (host:pid) running the request
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='running')
+
+    result = models.TextField(null=True, blank=True)  # JSON result once done
+
+    error = models.TextField(null=True, blank=True)
+
+    expires_at = models.DateTimeField(db_index=True)  # End of the lease, or of the result's reuse window
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key[:12]} ({self.status})"
+
+
+class ModelQuotaWindow(models.Model):
+    """Model requests and tokens used in one minute, shared by every worker (scheduler database limiter)."""
+
+    name = models.CharField(max_length=64)  # Quota the window belongs to, e.g. the model name
+
+    window = models.BigIntegerField()  # Minutes since the epoch
+
+    requests = models.PositiveIntegerField(default=0)
+
+    tokens = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("name", "window")
+
+    def __str__(self):
+        return f"{self.name}@{self.window}: {self.requests} requests, {self.tokens} tokens"
+
+
+class PlanSignature(models.Model):
+    """MinHash signature of a generated plan's description and team, for near-duplicate plan reuse."""
+
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='plan_signatures', null=True)
+
+    description = models.TextField()
+
+    team = models.TextField()  # JSON team roles the plan was made for
+
+    plan = models.TextField()  # JSON tasks of the plan
+
+    minhash = models.TextField()  # JSON list of the MinHash values
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Plan signature of project {self.project_id}"
+
+
+class PlanSignatureBand(models.Model):
+    """One LSH band of a PlanSignature; plans sharing a bucket are candidate near duplicates."""
+
+    signature = models.ForeignKey(PlanSignature, on_delete=models.CASCADE, related_name='bands')
+
+    bucket = models.CharField(max_length=40, db_index=True)  # Band number and hash of its MinHash values
+
+    def __str__(self):
+        return self.bucket
+
+
 # Signal to delete repositories and unlink projects when a GitHubToken is deleted
 @receiver(post_delete, sender=GitHubToken)
 def delete_repositories_and_unlink_projects(sender, instance, **kwargs):
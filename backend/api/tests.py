@@ -1,6 +1,12 @@
-from django.test import TestCase
+import os
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.test import TestCase, SimpleTestCase
 from django.db import connections
-from .models import Employee, Project, Task
+from .models import Artifact, Employee, Project, Task
 
 
 class SampleDataTestCase(TestCase):
@@ -51,4 +57,1421 @@ class SampleDataTestCase(TestCase):
         # Verify that data is saved
         self.assertEqual(Employee.objects.using('default').count(), 2)
         self.assertEqual(Project.objects.using('default').count(), 1)
-        self.assertEqual(Task.objects.using('default').count(), 2)
\ No newline at end of file
+        self.assertEqual(Task.objects.using('default').count(), 2)
+
+
+class ColdStartImportTestCase(SimpleTestCase):
+
+    def test_boot_does_not_import_ai_sdks(self):
+        """
+        Booting Django and importing every view module must stay under the cold-start budget
+        and must not load the Vertex AI, GenAI, LangChain, GCP or PyGithub SDKs.
+        """
+        from benchmarks.import_time import measure_cold_start
+
+        budget_ms = float(os.getenv("KAGE_COLD_START_BUDGET_MS", "1500"))
+        report = measure_cold_start()
+
+        self.assertEqual(report["heavy_modules_loaded"], [])
+        self.assertLess(report["total_import_ms"], budget_ms)
+
+
+class KagePromptParsingTestCase(SimpleTestCase):
+
+    def setUp(self):
+        from unittest import mock
+        from .utils.kage import Kage
+
+        env = {"KAGE_GOOGLE_APPLICATION_CREDENTIALS": "credentials.json", "KAGE_GCP_PROJECT_ID": "test-project"}
+        with mock.patch.dict(os.environ, env):
+            self.kage = Kage()
+        self.logger = logging.getLogger("kage_project_planner.tests")
+
+    def test_prompt_includes_schema_and_roles(self):
+        prompt = self.kage.create_kage_prompt(
+            "Build a contract comparison tool.",
+            [{"name": "Alice", "level": "Analyst", "department": "AI and Data"}],
+            self.logger,
+        )
+        self.assertIn("Build a contract comparison tool.", prompt)
+        self.assertIn("- Alice (Level: Analyst, Department: AI and Data)", prompt)
+        self.assertIn('"employee_name"', prompt)
+
+    def test_parse_fenced_response(self):
+        response = '```json\n{"tasks": [{"task_id": 1, "description": "Set up repo", "employee_name": "Alice"}]}\n```'
+        plan = self.kage.parse_kage_response(response, self.logger)
+        self.assertEqual(plan.tasks[0].employee_name, "Alice")
+
+    def test_parse_rejects_empty_plan(self):
+        with self.assertRaises(ValueError):
+            self.kage.parse_kage_response('{"tasks": []}', self.logger)
+
+    def test_response_schema_is_inlined(self):
+        from .utils.kage import PROJECT_PLAN_RESPONSE_SCHEMA
+
+        schema_text = json.dumps(PROJECT_PLAN_RESPONSE_SCHEMA)
+        self.assertNotIn("$ref", schema_text)
+        self.assertNotIn('"title"', schema_text)
+        self.assertEqual(PROJECT_PLAN_RESPONSE_SCHEMA["properties"]["tasks"]["items"]["type"], "object")
+
+    def test_structured_mode_validates_bare_json(self):
+        self.kage.STRUCTURED_OUTPUT = True
+        prompt = self.kage.create_kage_prompt("Build a dashboard.", [], self.logger)
+        self.assertNotIn("Here is the output schema", prompt)
+
+        plan = self.kage.parse_kage_response(
+            '{"tasks": [{"task_id": 1, "description": "Design widgets", "employee_name": "Bob"}]}', self.logger
+        )
+        self.assertEqual(len(plan.tasks), 1)
+
+
+class FakeModelHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for a model endpoint. /flaky answers 429 until `failures` requests
+    have been seen, /slow-then-fast sleeps on its first request only, /bad-request always 400s.
+    """
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            hit = server.hits[self.path]
+
+        if self.path == "/flaky" and hit <= server.failures:
+            self.send_response(429)
+        elif self.path == "/bad-request":
+            self.send_response(400)
+        else:
+            if self.path == "/slow" or (self.path == "/slow-then-fast" and hit == 1):
+                time.sleep(0.5)
+            self.send_response(200)
+        self.end_headers()
+        self.wfile.write(json.dumps({"text": "ok", "hit": hit}).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class ModelCallPolicyTestCase(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeModelHandler)
+        cls.server.lock = threading.Lock()
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        from .utils.model_calls import reset_call_state
+
+        reset_call_state()
+        self.server.hits = {}
+        self.server.failures = 2
+
+    def post(self, path):
+        from urllib.request import urlopen
+
+        with urlopen(f"{self.base_url}{path}", data=b"{}", timeout=5) as response:
+            return json.loads(response.read())
+
+    def test_retries_rate_limited_calls(self):
+        from .utils.model_calls import CallPolicy, call_model
+
+        policy = CallPolicy(timeout=2, max_attempts=3, backoff_base=0.01)
+        self.assertEqual(call_model("test.flaky", self.post, "/flaky", policy=policy)["hit"], 3)
+
+    def test_does_not_retry_client_errors(self):
+        from urllib.error import HTTPError
+        from .utils.model_calls import CallPolicy, call_model
+
+        with self.assertRaises(HTTPError):
+            call_model("test.bad", self.post, "/bad-request", policy=CallPolicy(timeout=2, backoff_base=0.01))
+        self.assertEqual(self.server.hits["/bad-request"], 1)
+
+    def test_times_out_slow_calls(self):
+        from .utils.model_calls import CallPolicy, ModelCallTimeout, call_model
+
+        with self.assertRaises(ModelCallTimeout):
+            call_model("test.slow", self.post, "/slow", policy=CallPolicy(timeout=0.1, max_attempts=1))
+
+    def test_hedged_request_wins(self):
+        from .utils.model_calls import CallPolicy, call_model
+
+        policy = CallPolicy(timeout=2, max_attempts=1, hedge=True, hedge_after=0.05)
+        started = time.monotonic()
+        result = call_model("test.hedge", self.post, "/slow-then-fast", policy=policy)
+        self.assertEqual(result["hit"], 2)
+        self.assertLess(time.monotonic() - started, 0.4)
+
+    def test_background_requests_keep_their_scheduler_slot_and_the_caller_context(self):
+        from unittest import mock
+        from .utils.log_utils import get_request_id, set_request_id
+        from .utils.model_calls import CallPolicy, ModelCallTimeout, call_model
+        from .utils.model_scheduler import ModelScheduler
+        from .utils.tracing import get_current_span
+
+        scheduler = ModelScheduler(max_concurrency=1, max_wait=0.05)
+        unblock, calls = threading.Event(), []
+
+        def model(prompt):
+            calls.append((get_request_id(), get_current_span().name))
+            unblock.wait(5)
+            return prompt
+
+        set_request_id("caller-request")
+        policy = CallPolicy(timeout=0.1, max_attempts=1, hedge=True, hedge_after=0.02)
+        with mock.patch("api.utils.model_calls.get_model_scheduler", return_value=scheduler):
+            with self.assertRaises(ModelCallTimeout):
+                call_model("test.background", model, "x", policy=policy)
+            # The timed out request still runs, so it still holds the only slot, and no hedge was sent
+            self.assertEqual(scheduler.in_flight, 1)
+            self.assertEqual(calls, [("caller-request", "model_call test.background")])
+
+            unblock.set()
+            deadline = time.monotonic() + 2
+            while scheduler.in_flight and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(scheduler.in_flight, 0)
+            self.assertEqual(call_model("test.background", model, "y", policy=policy), "y")
+
+    def test_circuit_opens_after_repeated_failures(self):
+        from .utils.model_calls import CallPolicy, CircuitOpenError, call_model
+
+        self.server.failures = 100
+        policy = CallPolicy(timeout=2, max_attempts=1, failure_threshold=2, reset_timeout=60)
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                call_model("test.breaker", self.post, "/flaky", policy=policy)
+        with self.assertRaises(CircuitOpenError):
+            call_model("test.breaker", self.post, "/flaky", policy=policy)
+        self.assertEqual(self.server.hits["/flaky"], 2)
+
+
+class RequestLoggingTestCase(SimpleTestCase):
+
+    def test_handlers_are_configured_once_and_records_tagged(self):
+        from .utils.log_utils import configure_logging, get_request_logger, set_request_id
+
+        records = []
+        capture = logging.Handler()
+        capture.emit = records.append
+        logger = configure_logging("kage_project_planner.tests.logging")
+        logger.addHandler(capture)
+
+        set_request_id("request-a")
+        get_request_logger("kage_project_planner.tests.logging").info("first")
+        set_request_id("request-b")
+        get_request_logger("kage_project_planner.tests.logging").info("second")
+
+        handler_count = len(configure_logging("kage_project_planner.tests.logging").handlers)
+        logger.removeHandler(capture)
+
+        self.assertEqual(handler_count, 2)
+        self.assertEqual([record.request_id for record in records], ["request-a", "request-b"])
+
+    def test_malformed_request_ids_are_replaced(self):
+        from .utils.log_utils import set_request_id
+
+        self.assertEqual(set_request_id("job-42.retry_1"), "job-42.retry_1")
+        for request_id in ["a" * 65, "id\r\nX-Injected: 1", "../../etc", "id with spaces", ""]:
+            replaced = set_request_id(request_id)
+            self.assertNotEqual(replaced, request_id)
+            self.assertRegex(replaced, r"^[0-9a-f]{12}$")
+
+
+class DatabaseSettingsTestCase(SimpleTestCase):
+
+    def load_settings(self, **env):
+        import importlib
+        import runpy
+        from unittest import mock
+        from django.conf import settings
+
+        names = ["DB_ENGINE", "DB_POOL", "DB_POOL_MIN_SIZE", "DB_POOL_MAX_SIZE", "DB_POOL_TIMEOUT",
+                 "DB_CONN_MAX_AGE", "DB_CONN_HEALTH_CHECKS"]
+        with mock.patch.dict(os.environ, env), mock.patch("dotenv.load_dotenv"):
+            for name in set(names) - set(env):
+                os.environ.pop(name, None)
+            return runpy.run_path(importlib.import_module(settings.SETTINGS_MODULE).__file__)
+
+    def test_env_bool_parses_accepted_values(self):
+        from unittest import mock
+        from backend.settings import env_bool
+
+        for value in ["1", "true", "Yes", " ON "]:
+            with mock.patch.dict(os.environ, {"KAGE_TEST_FLAG": value}):
+                self.assertTrue(env_bool("KAGE_TEST_FLAG"), value)
+        for value in ["0", "false", "no", "off", "", "enabled"]:
+            with mock.patch.dict(os.environ, {"KAGE_TEST_FLAG": value}):
+                self.assertFalse(env_bool("KAGE_TEST_FLAG", True), value)
+        os.environ.pop("KAGE_TEST_FLAG", None)
+        self.assertTrue(env_bool("KAGE_TEST_FLAG", True))
+        self.assertFalse(env_bool("KAGE_TEST_FLAG"))
+
+    def test_persistent_connections_by_default(self):
+        database = self.load_settings(DB_ENGINE="postgresql")["DATABASES"]["default"]
+
+        self.assertEqual(database["CONN_MAX_AGE"], 60)
+        self.assertTrue(database["CONN_HEALTH_CHECKS"])
+        self.assertNotIn("pool", database.get("OPTIONS", {}))
+
+        database = self.load_settings(DB_ENGINE="postgresql", DB_CONN_MAX_AGE="0", DB_CONN_HEALTH_CHECKS="off")["DATABASES"]["default"]
+        self.assertEqual(database["CONN_MAX_AGE"], 0)
+        self.assertFalse(database["CONN_HEALTH_CHECKS"])
+
+    def test_db_pool_enables_the_pool_and_disables_persistent_connections(self):
+        database = self.load_settings(DB_ENGINE="postgresql", DB_POOL="1", DB_POOL_MAX_SIZE="5")["DATABASES"]["default"]
+
+        self.assertEqual(database["OPTIONS"]["pool"], {"min_size": 2, "max_size": 5, "timeout": 10.0})
+        self.assertEqual(database["CONN_MAX_AGE"], 0)
+
+        # The pool is built by psycopg 3's pool extra (requirements.txt); it opens no connection here
+        from django.db.utils import ConnectionHandler
+
+        wrapper = ConnectionHandler({"default": database})["default"]
+        self.addCleanup(wrapper.close_pool)
+        self.assertEqual(type(wrapper.pool).__module__.split(".")[0], "psycopg_pool")
+        self.assertEqual(wrapper.pool.max_size, 5)
+
+        # SQLite has no pool support; the flag is ignored
+        database = self.load_settings(DB_ENGINE="sqlite", DB_POOL="1")["DATABASES"]["default"]
+        self.assertNotIn("pool", database.get("OPTIONS", {}))
+        self.assertEqual(database["CONN_MAX_AGE"], 60)
+
+
+class ArtifactStoreTestCase(TestCase):
+
+    def setUp(self):
+        from .utils.artifact_store import ArtifactStore, MemoryArtifactBackend
+
+        self.backend = MemoryArtifactBackend()
+        self.store = ArtifactStore(self.backend, compress=True, max_per_kind=2)
+
+    def test_save_compresses_and_indexes(self):
+        artifact = self.store.save("plan", "plan_Sample Project", {"tasks": []}, project_name="Sample Project", job_id="job-1")
+        self.store.flush()
+
+        self.assertTrue(artifact.key.endswith(".json.gz"))
+        self.assertEqual(json.loads(self.store.read(artifact)), {"tasks": []})
+        self.assertEqual(list(self.store.find(project_name="Sample Project")), [artifact])
+        self.assertEqual(list(self.store.find(job_id="job-1")), [artifact])
+
+    def test_retention_prunes_oldest_per_kind(self):
+        saved = [self.store.save("model_response", "response", f"response {i}") for i in range(4)]
+        self.store.save("plan", "plan", {"tasks": []})
+        self.store.flush()
+
+        self.assertEqual(list(self.store.find(kind="model_response")), [saved[3], saved[2]])
+        self.assertNotIn(saved[0].key, self.backend.blobs)
+        self.assertEqual(len(self.backend.blobs), 3)
+
+    def test_sampling_drops_artifacts(self):
+        self.store.kind_sample_rates = {"repo_snapshot": 0.0}
+        self.assertIsNone(self.store.save("repo_snapshot", "repo", "contents"))
+        self.assertEqual(Artifact.objects.count(), 0)
+
+    def test_artifact_endpoints_require_admin_and_404_without_a_store(self):
+        from unittest import mock
+        from django.test import override_settings
+        from .utils.artifact_store import NullArtifactStore
+
+        artifact = self.store.save("plan", "plan", {"tasks": []})
+        self.store.flush()
+        with override_settings(DEBUG=False, PROFILING_ADMIN_TOKEN="secret"):
+            self.assertEqual(self.client.get("/artifacts/").status_code, 403)
+            self.assertEqual(self.client.get(f"/artifacts/{artifact.id}/").status_code, 403)
+            with mock.patch("api.utils.artifact_store._store", self.store):
+                response = self.client.get(f"/artifacts/{artifact.id}/", HTTP_AUTHORIZATION="Bearer secret")
+            with mock.patch("api.utils.artifact_store._store", NullArtifactStore()):
+                missing = self.client.get(f"/artifacts/{artifact.id}/", HTTP_AUTHORIZATION="Bearer secret")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {"tasks": []})
+        self.assertEqual(missing.status_code, 404)
+
+
+class MetricsTestCase(TestCase):
+
+    def test_metrics_endpoint_reports_route_latency_and_queries(self):
+        from .utils.metrics import DB_QUERIES_PER_REQUEST, HTTP_REQUEST_DURATION
+
+        project = Project.objects.create(name="Metrics Project", description="")
+        before = HTTP_REQUEST_DURATION.count(route="project/<int:project_id>/tasks/", method="GET", status=200)
+
+        self.client.get(f"/project/{project.id}/tasks/")
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            HTTP_REQUEST_DURATION.count(route="project/<int:project_id>/tasks/", method="GET", status=200), before + 1
+        )
+        self.assertGreater(DB_QUERIES_PER_REQUEST.count(route="project/<int:project_id>/tasks/"), 0)
+        self.assertIn('kage_http_request_duration_seconds_bucket{route="project/<int:project_id>/tasks/"', response.content.decode())
+
+    def test_instrument_github_tracks_calls_and_rate_limit(self):
+        from types import SimpleNamespace
+        from .utils.metrics import GITHUB_API_CALLS, GITHUB_RATE_LIMIT_REMAINING, instrument_github
+
+        requester = SimpleNamespace(
+            requestJson=lambda verb, url, *args, **kwargs: (200, {"X-RateLimit-Remaining": "4999"}, "{}"),
+            requestMultipart=None,
+            requestBlob=None,
+        )
+        client = instrument_github(SimpleNamespace(requester=requester))
+        before = GITHUB_API_CALLS.value(method="GET", status=200)
+
+        client.requester.requestJson("GET", "/user")
+
+        self.assertEqual(GITHUB_API_CALLS.value(method="GET", status=200), before + 1)
+        self.assertEqual(GITHUB_RATE_LIMIT_REMAINING.value(resource="core"), 4999)
+
+
+class TracingTestCase(TestCase):
+
+    def test_request_trace_contains_db_spans_and_continues_traceparent(self):
+        from django.test import override_settings
+
+        project = Project.objects.create(name="Tracing Project", description="")
+        trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+        response = self.client.get(
+            f"/project/{project.id}/tasks/", HTTP_TRACEPARENT=f"00-{trace_id}-00f067aa0ba902b7-01"
+        )
+        self.assertTrue(response["traceparent"].startswith(f"00-{trace_id}-"))
+
+        with override_settings(DEBUG=False, PROFILING_ADMIN_TOKEN="secret"):
+            self.assertEqual(self.client.get("/traces/").status_code, 403)
+            self.assertEqual(self.client.get(f"/traces/{trace_id}/").status_code, 403)
+            trace = self.client.get(f"/traces/{trace_id}/", HTTP_AUTHORIZATION="Bearer secret").json()
+            listed = self.client.get("/traces/", HTTP_AUTHORIZATION="Bearer secret").json()
+
+        names = [span["name"] for span in trace["spans"]]
+        self.assertIn("HTTP GET project/<int:project_id>/tasks/", names)
+        self.assertIn("db.query", names)
+
+        root = next(span for span in trace["spans"] if span["name"].startswith("HTTP GET project/"))
+        self.assertEqual(root["parent_span_id"], "00f067aa0ba902b7")
+        self.assertTrue(all(
+            span["parent_span_id"] == root["span_id"] for span in trace["spans"] if span["name"] == "db.query"
+        ))
+        self.assertIn(trace_id, [entry["trace_id"] for entry in listed])
+
+    def test_model_call_span_records_outcome(self):
+        from unittest import mock
+        from .utils.model_calls import CallPolicy, call_model
+        from .utils.tracing import InMemorySpanExporter, Tracer
+
+        tracer = Tracer(InMemorySpanExporter())
+        with mock.patch("api.utils.model_calls.get_tracer", return_value=tracer):
+            with tracer.start_as_current_span("job") as job:
+                call_model("test.trace", lambda: "ok", policy=CallPolicy(timeout=5, max_attempts=1))
+
+        spans = tracer.exporter.get_traces()[job.trace_id]
+        model_span = next(span for span in spans if span["name"] == "model_call test.trace")
+        self.assertEqual(model_span["parent_span_id"], job.span_id)
+        self.assertEqual(model_span["attributes"]["model.outcome"], "ok")
+
+    def test_in_memory_exporter_caps_spans_per_trace(self):
+        from .utils.tracing import InMemorySpanExporter, Tracer
+
+        tracer = Tracer(InMemorySpanExporter(max_traces=10, max_spans_per_trace=3))
+        with tracer.start_as_current_span("batch") as root:
+            for _ in range(5):
+                with tracer.start_as_current_span("db.query"):
+                    pass
+
+        spans = tracer.exporter.get_traces()[root.trace_id]
+        self.assertEqual([span["name"] for span in spans], ["batch", "db.query", "db.query"])
+        self.assertEqual(tracer.exporter.get_dropped_spans(), {root.trace_id: 3})
+        self.assertEqual(tracer.exporter.dropped_spans, 3)
+
+
+class ProfilingTestCase(TestCase):
+
+    def test_profile_header_captures_profile(self):
+        from django.test import override_settings
+
+        project = Project.objects.create(name="Profiling Project", description="")
+        with override_settings(PROFILING_ENABLED=True, DEBUG=True):
+            response = self.client.get(f"/project/{project.id}/tasks/", HTTP_X_KAGE_PROFILE="cprofile")
+            profile_id = response["X-Kage-Profile-Id"]
+
+            listed = self.client.get("/profiles/").json()
+            profile = self.client.get(f"/profiles/{profile_id}/")
+
+        self.assertEqual(listed[0]["route"], "project/<int:project_id>/tasks/")
+        self.assertIn("cumulative", profile.content.decode())
+
+    def test_sampling_profiler_collects_collapsed_stacks(self):
+        from .utils.profiling import run_profiled
+
+        def busy():
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                sum(range(1000))
+            return "done"
+
+        result, collapsed, mode = run_profiled("sample", busy, interval=0.002)
+
+        self.assertEqual((result, mode), ("done", "sample"))
+        self.assertIn("busy", collapsed)
+        self.assertRegex(collapsed.splitlines()[0], r";.* \d+$")
+
+    def test_overlapping_cprofile_requests_fall_back_to_sampling(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from .utils.profiling import run_profiled
+
+        barrier = threading.Barrier(2)
+
+        def busy():
+            barrier.wait(timeout=5)
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                sum(range(1000))
+            return "done"
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(run_profiled, "cprofile", busy, interval=0.002) for _ in range(2)]
+            results = [future.result() for future in futures]
+
+        self.assertEqual([result for result, _, _ in results], ["done", "done"])
+        self.assertEqual(sorted(mode for _, _, mode in results), ["cprofile", "sample"])
+
+    def test_profiles_require_admin_token_outside_debug(self):
+        from django.test import override_settings
+
+        with override_settings(DEBUG=False, PROFILING_ADMIN_TOKEN="secret"):
+            self.assertEqual(self.client.get("/profiles/").status_code, 403)
+            response = self.client.get("/profiles/", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+
+
+class OfflineClientsTestCase(TestCase):
+
+    def test_ai_endpoints_run_against_fake_gemini_and_github(self):
+        from unittest import mock
+        from benchmarks.fake_gemini import FakeGeminiServer
+        from benchmarks.fake_github import FakeGitHubServer
+
+        gemini = FakeGeminiServer(latency_ms=0, token_rate=1e9).start()
+        github = FakeGitHubServer(repos="demo:12").start()
+        self.addCleanup(gemini.stop)
+        self.addCleanup(github.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "GITHUB_API_URL": github.url,
+            "GITHUB_SECONDS_BETWEEN_REQUESTS": "0",
+            "GITHUB_SECONDS_BETWEEN_WRITES": "0",
+            "GITHUB_PERSONAL_ACCESS_TOKEN": "fake-token",
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "KAGE_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "AI_ASSIST_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "ARTIFACT_BACKEND": "none",
+        }
+
+        with mock.patch.dict(os.environ, env), mock.patch("api.utils.artifact_store._store", None):
+            plan = self.client.post("/ai/generate", data=json.dumps({
+                "project_name": "Offline",
+                "project_description": "Build an offline benchmark.",
+                "team_roles": [{"name": "Ada", "level": "Analyst", "department": "Cloud"}],
+            }), content_type="application/json")
+            changes = self.client.post("/ai/generate-json-changes", data=json.dumps({
+                "repo_url": github.repo_url("demo"),
+                "task_description": "Add logging.",
+            }), content_type="application/json")
+            applied = self.client.post("/ai/apply-json-changes", data=json.dumps({
+                "repo_url": github.repo_url("demo"),
+                "json_changes": json.dumps(changes.json()["json_changes"]),
+            }), content_type="application/json")
+
+        self.assertEqual(plan.status_code, 200)
+        self.assertTrue(Task.objects.filter(project__name="Offline", employee__name="Ada").exists())
+        self.assertEqual(applied.status_code, 200, applied.content)
+        repository = github.fake.repositories["demo"]
+        changed = repository.files_at("kage-assist")[changes.json()["json_changes"][0]["file_path"]]
+        self.assertTrue(changed.startswith("// reviewed"))
+        self.assertEqual(gemini.fake.stats()["requests"], 2)
+
+
+class GenerateLoadDataTestCase(TestCase):
+
+    def test_generate_load_data_bulk_inserts_and_clears(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        call_command("generate_load_data", employees=12, projects=3, tasks=30, team_size=4, batch_size=7, stdout=StringIO())
+
+        projects = Project.objects.filter(name__startswith="[load] ")
+        self.assertEqual(projects.count(), 3)
+        self.assertEqual(Task.objects.filter(project__in=projects).count(), 30)
+        for project in projects:
+            team = set(project.employees.values_list("id", flat=True))
+            self.assertEqual(len(team), 4)
+            self.assertTrue(set(project.tasks.values_list("employee_id", flat=True)) <= team)
+
+        call_command("generate_load_data", employees=2, projects=1, tasks=2, clear=True, stdout=StringIO())
+        self.assertEqual(Project.objects.filter(name__startswith="[load] ").count(), 1)
+        self.assertEqual(Employee.objects.filter(name__startswith="[load] ").count(), 2)
+
+
+class PromptBudgetTestCase(TestCase):
+
+    def test_fit_items_drops_files_over_budget(self):
+        from unittest import mock
+        from .utils.prompt_budget import PromptBudgetExceeded, estimate_tokens, fit_items
+
+        files = [f"src/module_{index}/handlers.py" for index in range(200)]
+
+        def render(kept, omitted):
+            return "Files:\n" + "\n".join(kept) + (f"\n... and {omitted} more" if omitted else "")
+
+        with mock.patch.dict(os.environ, {"PROMPT_BUDGET_AI_ASSIST_ANALYZE_MAX_INPUT_TOKENS": "300"}):
+            prompt, estimate, kept = fit_items("ai_assist.analyze", files, render, 4096)
+            self.assertLess(kept, len(files))
+            self.assertGreater(estimate_tokens(render(files[:kept + 1], len(files) - kept - 1)), 300)
+            self.assertLessEqual(estimate.input_tokens, 300)
+            self.assertIn(f"... and {len(files) - kept} more", prompt)
+            with self.assertRaises(PromptBudgetExceeded):
+                fit_items("ai_assist.analyze", files, lambda kept, omitted: "x " * 1000, 4096)
+
+    def test_kage_condenses_guidelines_then_rejects_with_413(self):
+        from unittest import mock
+        from .utils.kage import CONDENSED_EXPERIENCE_DEFINITIONS, Kage
+
+        env = {
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "KAGE_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "GEMINI_BASE_URL": "http://127.0.0.1:9",
+            "PROMPT_BUDGET_KAGE_GENERATE_MAX_INPUT_TOKENS": "1500",
+        }
+        roles = [{"name": "Ada", "level": "Analyst", "department": "Cloud"}]
+        with mock.patch.dict(os.environ, env):
+            prompt = Kage().create_kage_prompt("Build an audit trail.", roles, logging.getLogger("kage.tests"))
+            self.assertIn(CONDENSED_EXPERIENCE_DEFINITIONS, prompt)
+
+            os.environ["PROMPT_BUDGET_KAGE_GENERATE_MAX_INPUT_TOKENS"] = "500"
+            response = self.client.post("/ai/generate", data=json.dumps({
+                "project_name": "Too big",
+                "project_description": "Build an audit trail.",
+                "team_roles": roles,
+            }), content_type="application/json")
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()["estimate"]["budget"], 500)
+        self.assertFalse(Project.objects.filter(name="Too big").exists())
+
+
+class ContextCacheTestCase(SimpleTestCase):
+
+    def test_kage_sends_static_prefix_as_cached_system_instruction(self):
+        from unittest import mock
+        from benchmarks.fake_gemini import FakeGeminiServer
+        from .utils.context_cache import get_context_cache
+        from .utils.kage import Kage
+
+        gemini = FakeGeminiServer(latency_ms=0, token_rate=1e9).start()
+        self.addCleanup(gemini.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "KAGE_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "KAGE_CONTEXT_CACHE": "vertex",
+            "ARTIFACT_BACKEND": "none",
+        }
+        roles = [{"name": "Ada", "level": "Analyst", "department": "Cloud"}]
+        with mock.patch.dict(os.environ, env), mock.patch("api.utils.context_cache._cache", None), \
+                mock.patch("api.utils.artifact_store._store", None):
+            plans = [Kage().generate_project_plan(f"Cached {index}", "Build an audit trail.", roles) for index in range(2)]
+            models = {id(get_context_cache().get_model("gemini-1.5-flash-001", None, None, "x")[0]) for _ in range(2)}
+
+        self.assertTrue(all(plan["tasks"] for plan in plans))
+        body = gemini.fake.last_request
+        self.assertIn("Experience Level Guidelines", body["systemInstruction"]["parts"][0]["text"])
+        self.assertNotIn("Experience Level Guidelines", body["contents"][0]["parts"][0]["text"])
+        self.assertIn("- Ada (Level: Analyst", body["contents"][0]["parts"][0]["text"])
+        self.assertEqual(len(models), 1)
+
+
+class MapReduceAnalysisTestCase(TestCase):
+
+    def test_map_reduce_analysis_chunks_and_caches_summaries(self):
+        from unittest import mock
+        from benchmarks.fake_gemini import FakeGeminiServer
+        from benchmarks.fake_github import FakeGitHubServer
+        from .models import FileSummary
+        from .utils.repo_analysis import chunk_files
+
+        chunks = chunk_files([{"path": f"src/a/{index}.py", "size": 4000} for index in range(5)]
+                             + [{"path": "src/b/x.py", "size": 10}], depth=2, max_tokens=2500, max_files=20)
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1, 1])
+
+        gemini = FakeGeminiServer(latency_ms=0, token_rate=1e9).start()
+        github = FakeGitHubServer(repos="mono:45").start()
+        self.addCleanup(gemini.stop)
+        self.addCleanup(github.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "GITHUB_API_URL": github.url,
+            "GITHUB_SECONDS_BETWEEN_REQUESTS": "0",
+            "GITHUB_PERSONAL_ACCESS_TOKEN": "fake-token",
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "AI_ASSIST_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "AI_ASSIST_CHUNK_DEPTH": "3",
+            "AI_ASSIST_MAP_CONCURRENCY": "3",
+            "ARTIFACT_BACKEND": "none",
+        }
+        with mock.patch.dict(os.environ, env), mock.patch("api.utils.artifact_store._store", None):
+            first = self.client.post("/ai/repository-analysis", data=json.dumps({
+                "repo_url": github.repo_url("mono"), "mode": "map_reduce",
+            }), content_type="application/json")
+            calls_after_first = gemini.fake.stats()["requests"]
+            second = self.client.post("/ai/repository-analysis", data=json.dumps({
+                "repo_url": github.repo_url("mono"), "mode": "map_reduce",
+            }), content_type="application/json")
+
+        self.assertEqual(first.status_code, 200, first.content)
+        coverage = first.json()["analysis_result"]["coverage"]
+        self.assertEqual((coverage["files"], coverage["summarized"], coverage["chunks"]), (45, 45, 5))
+        self.assertEqual(calls_after_first, 6)  # one map call per module directory and one reduce
+        self.assertEqual(FileSummary.objects.count(), 45)
+        self.assertEqual(second.json()["analysis_result"]["coverage"]["cached"], 45)
+        self.assertEqual(gemini.fake.stats()["requests"], calls_after_first + 1)
+        self.assertTrue(second.json()["analysis_result"]["tasks"])
+
+    def test_analysis_is_not_recorded_when_too_many_map_calls_fail(self):
+        from unittest import mock
+        from benchmarks.fake_gemini import FakeGeminiServer
+        from benchmarks.fake_github import FakeGitHubServer
+        from .models import FileSummary, RepositoryAnalysis
+        from .utils.repo_analysis import MapReduceAnalyzer
+
+        gemini = FakeGeminiServer(latency_ms=0, token_rate=1e9).start()
+        github = FakeGitHubServer(repos="mono:45").start()
+        self.addCleanup(gemini.stop)
+        self.addCleanup(github.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "GITHUB_API_URL": github.url,
+            "GITHUB_SECONDS_BETWEEN_REQUESTS": "0",
+            "GITHUB_PERSONAL_ACCESS_TOKEN": "fake-token",
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "AI_ASSIST_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "AI_ASSIST_CHUNK_DEPTH": "3",
+            "AI_ASSIST_MAP_CONCURRENCY": "1",
+            "ARTIFACT_BACKEND": "none",
+        }
+        summarize_chunk = MapReduceAnalyzer.summarize_chunk
+        mapped = []
+
+        def flaky_summarize_chunk(analyzer, repo, repo_name, chunk):
+            mapped.append(chunk)
+            if len(mapped) > 2:
+                raise TimeoutError("model call timed out")
+            return summarize_chunk(analyzer, repo, repo_name, chunk)
+
+        with mock.patch.dict(os.environ, env), mock.patch("api.utils.artifact_store._store", None), \
+                mock.patch.object(MapReduceAnalyzer, "summarize_chunk", flaky_summarize_chunk):
+            response = self.client.post("/ai/repository-analysis", data=json.dumps({
+                "repo_url": github.repo_url("mono"), "mode": "map_reduce",
+            }), content_type="application/json")
+
+        self.assertEqual(len(mapped), 5)
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("Map step failed for 3 of 5 chunks", response.json()["error"])
+        self.assertFalse(RepositoryAnalysis.objects.exists())
+        # The two chunks that were summarized are kept for the retry
+        self.assertEqual(FileSummary.objects.count(), sum(len(chunk) for chunk in mapped[:2]))
+
+
+    def test_truncated_map_and_reduce_replies_are_continued(self):
+        from unittest import mock
+        from benchmarks.fake_gemini import FakeGeminiServer
+        from benchmarks.fake_github import FakeGitHubServer
+        from .utils.ai_assist import AIAssist
+        from .utils.metrics import MODEL_CONTINUATIONS
+
+        gemini = FakeGeminiServer(latency_ms=0, token_rate=1e9).start()
+        github = FakeGitHubServer(repos="mono:45").start()
+        self.addCleanup(gemini.stop)
+        self.addCleanup(github.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "GITHUB_API_URL": github.url,
+            "GITHUB_SECONDS_BETWEEN_REQUESTS": "0",
+            "GITHUB_PERSONAL_ACCESS_TOKEN": "fake-token",
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "AI_ASSIST_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "AI_ASSIST_CHUNK_DEPTH": "3",
+            "MODEL_CALL_MAX_CONTINUATIONS": "10",
+            "ARTIFACT_BACKEND": "none",
+        }
+        init = AIAssist.__init__
+
+        def small_output(assist, *args, **kwargs):
+            init(assist, *args, **kwargs)
+            assist.max_output_tokens = 60
+
+        before = {endpoint: MODEL_CONTINUATIONS.value(caller="ai_assist", endpoint=endpoint)
+                  for endpoint in ("ai_assist.map", "ai_assist.reduce")}
+        with mock.patch.dict(os.environ, env), mock.patch("api.utils.artifact_store._store", None), \
+                mock.patch.object(AIAssist, "__init__", small_output):
+            response = self.client.post("/ai/repository-analysis", data=json.dumps({
+                "repo_url": github.repo_url("mono"), "mode": "map_reduce",
+            }), content_type="application/json")
+
+        self.assertEqual(response.status_code, 200, response.content)
+        result = response.json()["analysis_result"]
+        self.assertEqual((result["coverage"]["summarized"], result["coverage"]["failed_chunks"]), (45, 0))
+        self.assertEqual(len(result["tasks"]), 5)
+        for endpoint, count in before.items():
+            self.assertGreater(MODEL_CONTINUATIONS.value(caller="ai_assist", endpoint=endpoint), count, endpoint)
+
+
+class IncrementalAnalysisTestCase(TestCase):
+
+    def test_reanalysis_sends_only_the_changed_files(self):
+        from unittest import mock
+        from benchmarks.fake_gemini import FakeGeminiServer
+        from benchmarks.fake_github import FakeGitHubServer
+        from .models import RepositoryAnalysis
+
+        gemini = FakeGeminiServer(latency_ms=0, token_rate=1e9).start()
+        github = FakeGitHubServer(repos="app:30").start()
+        self.addCleanup(gemini.stop)
+        self.addCleanup(github.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "GITHUB_API_URL": github.url,
+            "GITHUB_SECONDS_BETWEEN_REQUESTS": "0",
+            "GITHUB_SECONDS_BETWEEN_WRITES": "0",
+            "GITHUB_PERSONAL_ACCESS_TOKEN": "fake-token",
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "AI_ASSIST_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "ARTIFACT_BACKEND": "none",
+        }
+        repository = github.fake.repositories["app"]
+        path = sorted(path for path in repository.files_at("main") if path.endswith(".py"))[0]
+
+        def analyze():
+            github_before = github.fake.stats()["requests"]
+            response = self.client.post("/ai/repository-analysis", data=json.dumps({"repo_url": github.repo_url("app")}),
+                                        content_type="application/json")
+            self.assertEqual(response.status_code, 200, response.content)
+            return gemini.fake.last_request, github.fake.stats()["requests"] - github_before
+
+        with mock.patch.dict(os.environ, env), mock.patch("api.utils.artifact_store._store", None):
+            _, full_github_calls = analyze()
+            first_head = RepositoryAnalysis.objects.get().commit_sha
+
+            repository.update_file("main", path, "def handler():\n    return eval(input())\n", "Use eval")
+            body, incremental_github_calls = analyze()
+            analyses = gemini.fake.stats()["requests"]
+            analyze()
+
+        prompt = body["contents"][0]["parts"][0]["text"]
+        self.assertIn("**Previous Findings:**", prompt)
+        self.assertIn(f"### Modified: {path}", prompt)
+        self.assertIn("+    return eval(input())", prompt)
+        self.assertNotIn("**Repository Structure:**", prompt)
+        self.assertLess(incremental_github_calls, full_github_calls)
+        record = RepositoryAnalysis.objects.get()
+        self.assertNotEqual(record.commit_sha, first_head)
+        self.assertEqual(record.mode, "incremental")
+        self.assertEqual(gemini.fake.stats()["requests"], analyses)  # unchanged head: no model call
+
+    def test_changed_file_diffs_are_capped_by_the_configured_budget(self):
+        from types import SimpleNamespace
+        from unittest import mock
+        from .utils.incremental_analysis import IncrementalAnalyzer
+
+        patch = "".join(f"+line {index}\n" for index in range(100))
+        repo = SimpleNamespace(compare=lambda base, head: SimpleNamespace(files=[
+            SimpleNamespace(filename="app/views.py", status="modified", patch=patch, sha="abc"),
+        ]))
+        assist = SimpleNamespace(is_code_file=lambda path: True, max_lines_per_file=500)
+        with mock.patch.dict(os.environ, {"AI_ASSIST_INCREMENTAL_MAX_FILE_CHARS": "50"}):
+            changes = IncrementalAnalyzer(assist).changed_files(repo, "base", "head")
+
+        self.assertEqual(changes[0]["patch"], patch[:50] + "\n... (diff truncated)")
+
+
+class SingleFlightTestCase(TestCase):
+
+    def test_concurrent_duplicates_share_one_call(self):
+        from .utils.single_flight import SingleFlight, coalescing_key
+
+        self.assertEqual(
+            coalescing_key("json_changes", "https://GitHub.com/o/r.git/", "abc", "Add  logging\n"),
+            coalescing_key("json_changes", "https://github.com/o/r", "abc", "Add logging"),
+        )
+        flight, calls, results = SingleFlight(timeout=5), [], []
+        started = threading.Event()
+
+        def work():
+            calls.append(1)
+            started.set()
+            time.sleep(0.2)
+            return {"tasks": ["one"]}
+
+        def request():
+            results.append(flight.do("key", work))
+
+        leader = threading.Thread(target=request)
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=request) for _ in range(4)]
+        for thread in followers:
+            thread.start()
+        for thread in [leader, *followers]:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True, True, True])
+        self.assertTrue(all(result == {"tasks": ["one"]} for result, _ in results))
+
+    def test_database_lease_is_shared_across_processes(self):
+        from .models import InFlightRequest
+        from .utils.single_flight import DatabaseSingleFlight
+
+        worker_a = DatabaseSingleFlight(timeout=0.2, poll_interval=0.05)
+        worker_b = DatabaseSingleFlight(timeout=0.2, poll_interval=0.05)
+        worker_b.owner = "other-host:1"
+
+        def leader_work():
+            # While A holds the lease, B's duplicate waits and gives up after its timeout
+            with self.assertRaises(TimeoutError):
+                worker_b.do("analysis", lambda: self.fail("duplicate should not run"))
+            return {"tasks": ["shared"]}
+
+        self.assertEqual(worker_a.do("analysis", leader_work), ({"tasks": ["shared"]}, False))
+        self.assertEqual(worker_b.do("analysis", lambda: self.fail("result should be reused")), ({"tasks": ["shared"]}, True))
+        self.assertEqual(InFlightRequest.objects.get().status, "done")
+
+        InFlightRequest.objects.update(expires_at=InFlightRequest.objects.get().created_at)
+        self.assertEqual(worker_b.do("analysis", lambda: {"tasks": ["fresh"]}), ({"tasks": ["fresh"]}, False))
+
+
+class ModelSchedulerTestCase(TestCase):
+
+    def test_interactive_first_and_round_robin_over_tenants(self):
+        from .utils.model_scheduler import ModelScheduler
+
+        scheduler = ModelScheduler(max_concurrency=1, max_wait=5)
+        running = scheduler.acquire("kage.generate", 10, tenant="a")
+        order = []
+
+        def call(endpoint, tenant, name):
+            permit = scheduler.acquire(endpoint, 10, tenant=tenant)
+            order.append(name)
+            scheduler.release(permit)
+
+        threads = []
+        for endpoint, tenant, name in [("ai_assist.analyze", "a", "batch"), ("kage.generate", "a", "a1"),
+                                       ("kage.generate", "a", "a2"), ("ai_assist.json_changes", "b", "b1")]:
+            thread = threading.Thread(target=call, args=(endpoint, tenant, name))
+            thread.start()
+            threads.append(thread)
+            # Queue the calls in a known order
+            while sum(scheduler.queue_depth(priority) for priority in ("interactive", "batch")) < len(threads):
+                time.sleep(0.005)
+        scheduler.release(running)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order, ["a1", "b1", "a2", "batch"])
+        self.assertEqual(scheduler.in_flight, 0)
+
+    def test_rate_limits_queue_then_time_out(self):
+        from unittest import mock
+        from .utils.model_scheduler import DatabaseRateLimiter, LocalRateLimiter, ModelQueueTimeout, ModelScheduler
+
+        local = LocalRateLimiter(rpm=2, tpm=100)
+        self.assertEqual([local.try_acquire(10), local.try_acquire(10)], [0, 0])
+        self.assertGreater(local.try_acquire(10), 20)
+
+        scheduler = ModelScheduler(LocalRateLimiter(rpm=1), max_wait=0.1)
+        scheduler.release(scheduler.acquire("kage.generate", 10))
+        with self.assertRaises(ModelQueueTimeout):
+            scheduler.acquire("kage.generate", 10)
+        self.assertEqual(scheduler.queue_depth("interactive"), 0)
+
+        # Two workers share the database window; estimates are reconciled with the usage reported
+        worker_a, worker_b = DatabaseRateLimiter("gemini", rpm=3, tpm=100), DatabaseRateLimiter("gemini", rpm=3, tpm=100)
+        with mock.patch("time.time", return_value=60 * 29_000_000 + 30.0):
+            self.assertEqual(worker_a.try_acquire(80), 0)
+            self.assertEqual(worker_b.try_acquire(30), 30.0)
+            worker_a.adjust(-50)
+            self.assertEqual(worker_b.try_acquire(30), 0)
+            self.assertEqual(worker_a.try_acquire(10), 0)
+            self.assertGreater(worker_b.try_acquire(1), 0)
+
+    def test_slow_or_failing_limiter_does_not_block_the_scheduler(self):
+        from .utils.model_scheduler import ModelScheduler
+
+        class SlowLimiter:
+            def __init__(self):
+                self.calls = 0
+
+            def try_acquire(self, tokens):
+                self.calls += 1
+                if self.calls == 2:
+                    time.sleep(0.3)
+                if self.calls == 3:
+                    raise RuntimeError("database unavailable")
+                return 0.0
+
+            def adjust(self, tokens):
+                raise RuntimeError("database unavailable")
+
+        scheduler = ModelScheduler(SlowLimiter(), max_concurrency=4, max_wait=5)
+        running = scheduler.acquire("kage.generate", 10)
+        slow = threading.Thread(target=lambda: scheduler.release(scheduler.acquire("kage.generate", 10)))
+        slow.start()
+        while scheduler._reserving is None:
+            time.sleep(0.005)
+
+        # While the limiter is busy the lock is free: running calls finish without waiting on it
+        started = time.monotonic()
+        running.used_tokens = 5
+        scheduler.release(running)
+        self.assertLess(time.monotonic() - started, 0.1)
+        slow.join()
+
+        # A limiter error admits the call instead of failing it
+        permit = scheduler.acquire("kage.generate", 10)
+        self.assertTrue(permit.granted)
+        scheduler.release(permit)
+        self.assertEqual(scheduler.in_flight, 0)
+
+
+class AssignmentTestCase(TestCase):
+
+    def test_two_phase_plan_is_assigned_and_reassigned_locally(self):
+        from unittest import mock
+        from benchmarks.fake_gemini import FakeGeminiServer
+
+        gemini = FakeGeminiServer(latency_ms=0, token_rate=1e9, plan_tasks=8).start()
+        self.addCleanup(gemini.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "KAGE_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "KAGE_ASSIGNMENT": "local",
+            "ARTIFACT_BACKEND": "none",
+        }
+        roles = [
+            {"name": "Ada", "level": "Analyst", "department": "Cloud"},
+            {"name": "Bo", "level": "Consultant", "department": "Cloud"},
+            {"name": "Cy", "level": "Senior Consultant", "department": "Cloud"},
+            {"name": "Di", "level": "Analyst", "department": "AI and Data"},
+        ]
+        with mock.patch.dict(os.environ, env), mock.patch("api.utils.context_cache._cache", None), \
+                mock.patch("api.utils.artifact_store._store", None):
+            response = self.client.post("/ai/generate", data=json.dumps({
+                "project_name": "Two phase",
+                "project_description": "Build an audit trail.",
+                "team_roles": roles,
+            }), content_type="application/json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotIn("employee_name", json.dumps(gemini.fake.last_request))
+
+        project = Project.objects.get(name="Two phase")
+        tasks = list(project.tasks.select_related("employee"))
+        self.assertEqual(len(tasks), 8)
+        for task in tasks:
+            # Senior Consultants integrate, they do not execute; departments are respected
+            self.assertEqual(task.employee.name == "Cy", task.level == "Senior Consultant")
+            self.assertEqual(task.employee.department, task.department)
+
+        project.employees.remove(Employee.objects.get(name="Di"))
+        reassigned = self.client.post(f"/project/{project.id}/reassign/")
+        self.assertEqual(reassigned.status_code, 200, reassigned.content)
+        self.assertFalse(project.tasks.filter(employee__name="Di").exists())
+        self.assertEqual(project.tasks.filter(employee__name="Cy").count(), 2)
+        self.assertEqual(gemini.fake.stats()["requests"], 1)
+
+
+class WorkstreamPlanTestCase(SimpleTestCase):
+
+    def test_workstreams_are_generated_in_parallel_and_renumbered(self):
+        from unittest import mock
+        from benchmarks.fake_gemini import FakeGeminiServer
+        from .utils.kage import Kage
+
+        gemini = FakeGeminiServer(latency_ms=400, token_rate=1e9, plan_tasks=4, workstreams=3).start()
+        self.addCleanup(gemini.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "KAGE_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "KAGE_WORKSTREAMS": "true",
+            "KAGE_WORKSTREAM_CONCURRENCY": "3",
+            "ARTIFACT_BACKEND": "none",
+        }
+        roles = [{"name": "Ada", "level": "Analyst", "department": "Cloud"}]
+        with mock.patch.dict(os.environ, env), mock.patch("api.utils.context_cache._cache", None), \
+                mock.patch("api.utils.artifact_store._store", None):
+            started = time.monotonic()
+            plan = Kage().generate_project_plan("Workstreams", "Build an audit trail.", roles)
+            elapsed = time.monotonic() - started
+
+        # One listing call plus three workstream calls, the latter overlapping
+        self.assertEqual(gemini.fake.stats()["requests"], 4)
+        self.assertLess(elapsed, 1.4)
+        self.assertEqual([task["task_id"] for task in plan["tasks"]], list(range(1, 13)))
+        for task in plan["tasks"]:
+            self.assertIn(f"Deliver {task['workstream']} work package", task["description"])
+        self.assertEqual(plan["tasks"][4]["workstream"], "Workstream 2")
+
+
+class ContinuationTestCase(SimpleTestCase):
+
+    def test_truncated_plan_is_continued_from_last_complete_task(self):
+        from unittest import mock
+        from benchmarks.fake_gemini import FakeGeminiServer
+        from .utils.kage import Kage
+        from .utils.metrics import MODEL_CONTINUATIONS
+        from .utils.model_calls import complete_json_prefix
+
+        text = '```json\n{"tasks": [{"description": "a \\"}]\\" b", "tags": {"x": 1}}, {"description": "cut'
+        kept, complete = complete_json_prefix(text)
+        self.assertEqual(text[:kept], '```json\n{"tasks": [{"description": "a \\"}]\\" b", "tags": {"x": 1}}')
+        self.assertFalse(complete)
+        self.assertEqual(complete_json_prefix('[{"a": 1}]'), (10, True))
+
+        gemini = FakeGeminiServer(latency_ms=0, token_rate=1e9, plan_tasks=30).start()
+        self.addCleanup(gemini.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "KAGE_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "KAGE_MAX_OUTPUT_TOKENS": "500",
+            "ARTIFACT_BACKEND": "none",
+        }
+        before = MODEL_CONTINUATIONS.value(caller="kage", endpoint="kage.generate")
+        roles = [{"name": "Ada", "level": "Analyst", "department": "Cloud"}]
+        with mock.patch.dict(os.environ, env), mock.patch("api.utils.context_cache._cache", None), \
+                mock.patch("api.utils.artifact_store._store", None):
+            plan = Kage().generate_project_plan("Long plan", "Build an audit trail.", roles)
+
+        self.assertEqual([task["task_id"] for task in plan["tasks"]], list(range(1, 31)))
+        self.assertEqual(gemini.fake.stats()["requests"], 3)
+        self.assertEqual(MODEL_CONTINUATIONS.value(caller="kage", endpoint="kage.generate") - before, 2)
+        self.assertEqual(gemini.fake.last_request["contents"][1]["role"], "model")
+
+    def test_structured_plan_is_continued_without_the_response_schema(self):
+        from unittest import mock
+        from benchmarks.fake_gemini import FakeGeminiServer
+        from .utils.kage import Kage
+
+        gemini = FakeGeminiServer(latency_ms=0, token_rate=1e9, plan_tasks=30).start()
+        self.addCleanup(gemini.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "KAGE_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "KAGE_STRUCTURED_OUTPUT": "true",
+            "KAGE_MAX_OUTPUT_TOKENS": "500",
+            "ARTIFACT_BACKEND": "none",
+        }
+        roles = [{"name": "Ada", "level": "Analyst", "department": "Cloud"}]
+        with mock.patch.dict(os.environ, env), mock.patch("api.utils.context_cache._cache", None), \
+                mock.patch("api.utils.artifact_store._store", None):
+            plan = Kage().generate_project_plan("Long structured plan", "Build an audit trail.", roles)
+
+        self.assertEqual([task["task_id"] for task in plan["tasks"]], list(range(1, 31)))
+        self.assertEqual(gemini.fake.stats()["requests"], 3)
+        config = gemini.fake.last_request["generationConfig"]
+        self.assertNotIn("response_schema", config)
+        self.assertNotIn("response_mime_type", config)
+        self.assertEqual(config["max_output_tokens"], 500)
+
+
+class CompactPlanTestCase(SimpleTestCase):
+
+    def generate(self, plan_format, assignment="model"):
+        from unittest import mock
+        from benchmarks.fake_gemini import FakeGeminiServer
+        from .utils.kage import Kage
+
+        gemini = FakeGeminiServer(latency_ms=0, token_rate=1e9, plan_tasks=8).start()
+        self.addCleanup(gemini.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "KAGE_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "KAGE_PLAN_FORMAT": plan_format,
+            "KAGE_ASSIGNMENT": assignment,
+            "ARTIFACT_BACKEND": "none",
+        }
+        roles = [
+            {"name": "Ada", "level": "Analyst", "department": "Cloud"},
+            {"name": "Sam", "level": "Senior Consultant", "department": "Fullstack"},
+        ]
+        with mock.patch.dict(os.environ, env), mock.patch("api.utils.context_cache._cache", None), \
+                mock.patch("api.utils.artifact_store._store", None):
+            plan = Kage().generate_project_plan("Compact", "Build an audit trail.", roles)
+        return plan, gemini.fake.stats()["response_tokens"]
+
+    def test_compact_records_decode_to_the_same_plan_with_fewer_tokens(self):
+        from .utils.compact_plan import decode_compact_plan
+
+        json_plan, json_tokens = self.generate("json")
+        compact_plan, compact_tokens = self.generate("compact")
+        self.assertEqual(compact_plan["tasks"], json_plan["tasks"])
+        self.assertLess(compact_tokens, json_tokens * 0.6)
+
+        tagged_plan, _ = self.generate("compact", assignment="local")
+        self.assertEqual(len(tagged_plan["tasks"]), 8)
+        self.assertEqual(tagged_plan["tasks"][3]["level"], "Senior Consultant")
+        self.assertEqual(tagged_plan["tasks"][3]["employee_name"], "Sam")
+
+        roles = [{"name": "Ada", "level": "Analyst", "department": "Cloud"}]
+        decoded = decode_compact_plan("```\n1|1|Design | build\n2|7|Review\nnot a record\n", roles)
+        self.assertEqual(decoded["tasks"], [
+            {"task_id": 1, "description": "Design | build", "employee_name": "Ada"},
+            {"task_id": 2, "description": "Review", "employee_name": ""},
+        ])
+
+
+class ReplanTestCase(TestCase):
+
+    def test_replan_applies_only_the_delta_to_the_existing_project(self):
+        from unittest import mock
+        from benchmarks.fake_gemini import FakeGeminiServer
+
+        gemini = FakeGeminiServer(latency_ms=0, token_rate=1e9, plan_tasks=4).start()
+        self.addCleanup(gemini.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "KAGE_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "ARTIFACT_BACKEND": "none",
+        }
+        ada = {"name": "Ada", "level": "Analyst", "department": "Cloud"}
+        bo = {"name": "Bo", "level": "Consultant", "department": "Cloud"}
+        cy = {"name": "Cy", "level": "Senior Consultant", "department": "Cloud"}
+        with mock.patch.dict(os.environ, env), mock.patch("api.utils.context_cache._cache", None), \
+                mock.patch("api.utils.artifact_store._store", None):
+            self.client.post("/ai/generate", data=json.dumps({
+                "project_name": "Replan", "project_description": "Build an audit trail.", "team_roles": [ada, bo],
+            }), content_type="application/json")
+            project = Project.objects.get(name="Replan")
+            first, _, third, fourth = project.tasks.order_by("id")
+            Task.objects.filter(id=first.id).update(status="done")
+
+            unchanged = self.client.post(f"/ai/replan/{project.id}", data=json.dumps({}), content_type="application/json")
+            self.assertEqual(unchanged.json()["removed"], [])
+            self.assertEqual(gemini.fake.stats()["requests"], 1)
+
+            response = self.client.post(f"/ai/replan/{project.id}", data=json.dumps({
+                "project_description": "Build an audit trail with export to CSV.", "team_roles": [bo, cy],
+            }), content_type="application/json")
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(gemini.fake.stats()["requests"], 2)
+        self.assertIn("Team members removed, no longer available: Ada", json.dumps(gemini.fake.last_request))
+        body = response.json()
+        self.assertEqual(body["removed"], [fourth.id])
+        self.assertEqual([task["task_id"] for task in body["modified"]], [third.id])
+        self.assertEqual(len(body["added"]), 2)
+
+        self.assertEqual(Project.objects.filter(name="Replan").count(), 1)
+        project.refresh_from_db()
+        self.assertEqual(project.description, "Build an audit trail with export to CSV.")
+        self.assertEqual(sorted(project.employees.values_list("name", flat=True)), ["Bo", "Cy"])
+        self.assertEqual(project.tasks.count(), 5)
+        # Only the done task keeps the removed team member
+        self.assertEqual(list(project.tasks.filter(employee__name="Ada").values_list("id", flat=True)), [first.id])
+        self.assertEqual(project.tasks.get(id=third.id).employee.name, "Bo")
+
+        # The plan index follows the re-plan, so reuse copies the current tasks
+        from .utils.plan_similarity import find_similar_plan
+
+        signature = project.plan_signatures.get()
+        self.assertEqual(signature.description, "Build an audit trail with export to CSV.")
+        similar = find_similar_plan("Build an audit trail with export to CSV.", [bo, cy])
+        self.assertEqual(similar.signature, signature)
+        self.assertEqual(
+            [task["description"] for task in similar.tasks],
+            list(project.tasks.order_by("id").values_list("description", flat=True)),
+        )
+        self.assertEqual([task["task_id"] for task in similar.tasks], list(range(1, 6)))
+
+        # An "adapt" reuse of the re-planned project re-plans its indexed tasks
+        with mock.patch.dict(os.environ, {**env, "KAGE_PLAN_REUSE_THRESHOLD": "0.3"}), \
+                mock.patch("api.utils.context_cache._cache", None), mock.patch("api.utils.artifact_store._store", None):
+            adapted = self.client.post("/ai/generate", data=json.dumps({
+                "project_name": "Replan copy", "project_description": "Build an audit trail with export to CSV and PDF.",
+                "team_roles": [bo, cy], "reuse": "adapt",
+            }), content_type="application/json")
+
+        self.assertEqual(adapted.status_code, 200, adapted.content)
+        self.assertEqual(adapted.json()["reused_plan"], {"project_id": project.id, "similarity": mock.ANY, "mode": "adapt"})
+        self.assertEqual(gemini.fake.stats()["requests"], 3)
+        self.assertTrue(Project.objects.get(name="Replan copy").tasks.exists())
+
+    def test_open_tasks_of_a_removed_member_are_reassigned_locally(self):
+        from unittest import mock
+
+        ada = Employee.objects.create(name="Ada", level="Analyst", department="Cloud")
+        bo = Employee.objects.create(name="Bo", level="Consultant", department="Cloud")
+        project = Project.objects.create(name="Removal", description="Build an audit trail.")
+        project.employees.set([ada, bo])
+        done = Task.objects.create(project=project, employee=ada, description="Schema", status="done")
+        untouched = Task.objects.create(project=project, employee=ada, description="Audit log writer", status="pending")
+        renamed = Task.objects.create(project=project, employee=ada, description="CSV export", status="pending")
+        delta = {
+            "added": [{"description": "Export API", "employee_name": "Nobody", "department": "Cloud", "level": "Consultant"}],
+            # The model names someone outside the team and leaves the other task of Ada untouched
+            "modified": [{"task_id": renamed.id, "description": "CSV and JSON export", "employee_name": "Zed",
+                          "department": None, "level": None}],
+            "removed": [],
+        }
+        team = [{"name": "Bo", "level": "Consultant", "department": "Cloud"},
+                {"name": "Cy", "level": "Analyst", "department": "Cloud"}]
+        env = {"KAGE_GCP_PROJECT_ID": "test-project", "KAGE_GOOGLE_APPLICATION_CREDENTIALS": ""}
+        with mock.patch.dict(os.environ, env), mock.patch("api.views.ai.Kage.generate_plan_delta", return_value=delta):
+            response = self.client.post(f"/ai/replan/{project.id}", data=json.dumps({"team_roles": team}),
+                                        content_type="application/json")
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(sorted(task["task_id"] for task in response.json()["modified"]), [untouched.id, renamed.id])
+        self.assertEqual(Task.objects.get(id=done.id).employee.name, "Ada")
+        self.assertEqual(Task.objects.get(id=untouched.id).employee.name, "Cy")
+        self.assertEqual(Task.objects.get(id=renamed.id).employee.name, "Cy")
+        self.assertEqual(project.tasks.get(description="Export API").employee.name, "Bo")
+
+
+class PlanReuseTestCase(TestCase):
+
+    DESCRIPTION = (
+        "Build a customer portal where clients sign in with single sign-on, review their billing history, "
+        "download invoices as PDF, open support tickets and chat with an agent. Deploy it on Cloud Run "
+        "with a managed Postgres database and nightly backups."
+    )
+
+    def test_near_duplicate_descriptions_reuse_the_indexed_plan(self):
+        from unittest import mock
+        from benchmarks.fake_gemini import FakeGeminiServer
+        from .utils.plan_similarity import minhash, shingles, similarity
+
+        gemini = FakeGeminiServer(latency_ms=0, token_rate=1e9, plan_tasks=4).start()
+        self.addCleanup(gemini.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "KAGE_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "ARTIFACT_BACKEND": "none",
+        }
+        team = [{"name": "Ada", "level": "Analyst", "department": "Cloud"},
+                {"name": "Sam", "level": "Senior Consultant", "department": "Fullstack"}]
+        new_team = [{"name": "Sue", "level": "Senior Consultant", "department": "Fullstack"},
+                    {"name": "Al", "level": "Analyst", "department": "Cloud"}]
+        edited = self.DESCRIPTION.replace("nightly backups", "daily backups")
+        self.assertGreater(similarity(minhash(shingles(self.DESCRIPTION, team)), minhash(shingles(edited, new_team))), 0.8)
+
+        def generate(name, description, roles, reuse):
+            with mock.patch.dict(os.environ, env), mock.patch("api.utils.context_cache._cache", None), \
+                    mock.patch("api.utils.artifact_store._store", None):
+                response = self.client.post("/ai/generate", data=json.dumps({
+                    "project_name": name, "project_description": description, "team_roles": roles, "reuse": reuse,
+                }), content_type="application/json")
+            self.assertEqual(response.status_code, 200, response.content)
+            return response.json(), Project.objects.get(name=name)
+
+        _, original = generate("Portal", self.DESCRIPTION, team, "offer")
+        body, offered = generate("Portal copy", edited, new_team, "offer")
+        self.assertEqual(gemini.fake.stats()["requests"], 1)
+        self.assertEqual(body["reused_plan"]["project_id"], original.id)
+        # Members with the same level and department take over the tasks
+        self.assertEqual(
+            list(offered.tasks.order_by("id").values_list("employee__name", flat=True)),
+            ["Al", "Sue", "Al", "Sue"],
+        )
+
+        body, adapted = generate("Portal adapted", edited, new_team, "adapt")
+        self.assertEqual(body["reused_plan"]["mode"], "adapt")
+        self.assertEqual(gemini.fake.stats()["requests"], 2)
+        self.assertIn("**Current Tasks", json.dumps(gemini.fake.last_request))
+        self.assertEqual(adapted.tasks.count(), 5)
+
+        body, _ = generate("Unrelated", "Migrate the payroll batch jobs from COBOL to Java.", team, "adapt")
+        self.assertNotIn("reused_plan", body)
+        self.assertEqual(gemini.fake.stats()["requests"], 3)
+
+
+class BatchGenerationTestCase(TestCase):
+
+    def test_batch_generates_concurrently_and_persists_in_bulk(self):
+        from unittest import mock
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from benchmarks.fake_gemini import FakeGeminiServer
+
+        gemini = FakeGeminiServer(latency_ms=300, token_rate=1e9, plan_tasks=3).start()
+        self.addCleanup(gemini.stop)
+        env = {
+            "GEMINI_BASE_URL": gemini.url,
+            "KAGE_GCP_PROJECT_ID": "test-project",
+            "KAGE_GOOGLE_APPLICATION_CREDENTIALS": "",
+            "KAGE_BATCH_CONCURRENCY": "3",
+            "ARTIFACT_BACKEND": "none",
+        }
+        team = [{"name": "Ada", "level": "Analyst", "department": "Cloud"},
+                {"name": "Bo", "level": "Consultant", "department": "Cloud"}]
+        Employee.objects.create(name="Ada", level="Analyst", department="Cloud")
+        specs = [
+            {"project_name": f"Batch {index}", "project_description": f"Build service number {index}.", "team_roles": team}
+            for index in range(6)
+        ]
+        specs.insert(2, {"project_name": "No description", "team_roles": team})
+
+        with mock.patch.dict(os.environ, env), mock.patch("api.utils.context_cache._cache", None), \
+                mock.patch("api.utils.artifact_store._store", None), CaptureQueriesContext(connection) as queries:
+            started = time.monotonic()
+            response = self.client.post("/ai/generate-batch", data=json.dumps({"projects": specs}),
+                                        content_type="application/json")
+            elapsed = time.monotonic() - started
+
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()["results"]
+        self.assertEqual([result["status"] for result in results], ["created"] * 2 + ["failed"] + ["created"] * 4)
+        self.assertIn("required", results[2]["error"])
+        # Six 0.3s calls, three at a time, and a constant number of queries for the whole batch
+        self.assertEqual(gemini.fake.stats()["requests"], 6)
+        self.assertLess(elapsed, 1.4)
+        self.assertLessEqual(len(queries), 12)
+
+        project = Project.objects.get(id=results[3]["project_id"])
+        self.assertEqual(project.name, "Batch 2")
+        self.assertEqual(sorted(project.employees.values_list("name", flat=True)), ["Ada", "Bo"])
+        self.assertEqual(list(project.tasks.order_by("id").values_list("employee__name", flat=True)), ["Ada", "Bo", "Ada"])
+        self.assertEqual(Employee.objects.filter(name="Ada").count(), 1)
+
+    def test_batch_rejects_invalid_concurrency_and_closes_worker_connections(self):
+        from unittest import mock
+
+        spec = {"project_name": "Batch", "project_description": "Build a service.", "team_roles": []}
+        for concurrency in ["four", 0, -2, 1.5, True]:
+            response = self.client.post("/ai/generate-batch", data=json.dumps({"projects": [spec], "concurrency": concurrency}),
+                                        content_type="application/json")
+            self.assertEqual(response.status_code, 400, concurrency)
+            self.assertIn("'concurrency'", response.json()["error"])
+
+        with mock.patch("api.views.ai.Kage") as kage, mock.patch("api.views.ai.connection") as worker_connection:
+            kage.return_value.generate_project_plan.side_effect = [{"tasks": []}, RuntimeError("model unavailable")]
+            response = self.client.post("/ai/generate-batch", data=json.dumps({"projects": [spec, spec], "concurrency": 1}),
+                                        content_type="application/json")
+
+        self.assertEqual([result["status"] for result in response.json()["results"]], ["created", "failed"])
+        # Every pool thread closes its DB connection, also after a failed item
+        self.assertEqual(worker_connection.close.call_count, 2)
@@ -4,6 +4,10 @@ from .ai import urlpatterns as ai_urls
 from .gcp import urlpatterns as gcp_urls
 from .rest import urlpatterns as rest_urls
 from .github import urlpatterns as github_urls
+from .artifact import urlpatterns as artifact_urls
+from .metrics import urlpatterns as metrics_urls
+from .tracing import urlpatterns as tracing_urls
+from .profiling import urlpatterns as profiling_urls
 
 # Combine all urlpatterns
-urlpatterns = general_urls + project_urls + ai_urls + gcp_urls + rest_urls + github_urls
\ No newline at end of file
+urlpatterns = general_urls + project_urls + ai_urls + gcp_urls + rest_urls + github_urls + artifact_urls + metrics_urls + tracing_urls + profiling_urls
\ No newline at end of file
@@ -6,6 +6,8 @@ app_name = 'ai'
 urlpatterns = [
     path('ai/check', ai_chat, name='ai_chat'),
     path('ai/generate', generate_project_plan, name='ai_generate'),
+    path('ai/generate-batch', generate_project_plans_batch, name='ai_generate_batch'),
+    path('ai/replan/<int:project_id>', replan_project, name='ai_replan'),
     path('ai/optimize', optimize_code, name='ai_optimize'),
     path('ai/repository-analysis', repository_analysis, name='repository_analysis'),
     path('ai/assist', ai_assist_functionality, name='ai_assist_functionality'),
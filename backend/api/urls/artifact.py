@@ -0,0 +1,9 @@
+from django.urls import path
+from ..views.artifact import list_artifacts, get_artifact
+
+app_name = 'artifact'
+
+urlpatterns = [
+    path('artifacts/', list_artifacts, name='list_artifacts'),
+    path('artifacts/<int:artifact_id>/', get_artifact, name='get_artifact'),
+]
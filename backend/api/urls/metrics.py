@@ -0,0 +1,8 @@
+from django.urls import path
+from ..views.metrics import prometheus_metrics
+
+app_name = 'metrics'
+
+urlpatterns = [
+    path('metrics', prometheus_metrics, name='metrics'),
+]
@@ -0,0 +1,9 @@
+from django.urls import path
+from ..views.profiling import list_profiles, get_profile
+
+app_name = 'profiling'
+
+urlpatterns = [
+    path('profiles/', list_profiles, name='list_profiles'),
+    path('profiles/<int:profile_id>/', get_profile, name='get_profile'),
+]
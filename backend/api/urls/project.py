@@ -16,6 +16,7 @@ urlpatterns = [
     path('project/<int:project_id>/employees/add/', add_employee_to_project, name='add_employee_to_project'),
     path('project/<int:project_id>/employees/list/', get_project_employees, name='get_project_employees'),  # New endpoint
     path('tasks/<int:task_id>/update/', update_task, name='update_task'), 
+    path('project/<int:project_id>/reassign/', reassign_project_tasks, name='reassign_project_tasks'),
     path('project/repos/', get_projects_with_repos, name='get_projects_with_repos'),
     path('project/<int:project_id>/link-repo/', link_project_to_repo, name='link_project_to_repo'),
     path('project/<int:project_id>/unlink-repo/', unlink_project_from_repo, name='unlink_project_from_repo'),
@@ -0,0 +1,9 @@
+from django.urls import path
+from ..views.tracing import list_traces, get_trace
+
+app_name = 'tracing'
+
+urlpatterns = [
+    path('traces/', list_traces, name='list_traces'),
+    path('traces/<str:trace_id>/', get_trace, name='get_trace'),
+]
@@ -1,13 +1,18 @@
 import os, json
 import logging
 from datetime import datetime
-from github import Github
-from github.ContentFile import ContentFile
 from dotenv import load_dotenv
-from typing import List, Dict
-import vertexai
-from vertexai.generative_models import GenerativeModel
-import tempfile
+from typing import List, Dict, Tuple
+from ..models import RepositoryAnalysis
+from .model_calls import call_model, call_model_with_continuation
+from .artifact_store import get_artifact_store
+from .log_utils import get_request_id
+from .clients import get_generative_model, get_github_client
+from .tracing import get_tracer
+from .prompt_budget import PromptBudgetExceeded, fit_items
+from .repo_analysis import MapReduceAnalyzer
+from .incremental_analysis import IncrementalAnalyzer
+from .metrics import record_cache
 
 
 load_dotenv()
@@ -29,12 +34,12 @@ class AIAssist:
         if not self.project_id:
             raise ValueError("GCP Project ID not found in environment.")
 
-        # Initialize Vertex AI client using the same method as Kage
-        vertexai.init(project=self.project_id, location=self.location)
-        self.model = GenerativeModel(self.model_name)
+        # The client factories import PyGithub and the Vertex AI SDK on first use, so workers
+        # which never run AI Assist do not pay for them at boot
+        self.model = get_generative_model(self.model_name, self.project_id, self.location)
 
         # Initialize GitHub client
-        self.github_client = Github(self.github_token)
+        self.github_client = get_github_client(self.github_token)
 
         # Ensure output directory exists
         self.output_dir = os.path.join(os.getcwd(), "output")
@@ -43,6 +48,7 @@ class AIAssist:
         # Set limits
         self.max_lines_per_file = 1000
         self.total_data_cap = 100 * 1024  # 100 KB
+        self.max_output_tokens = 4096
 
         # response = self.model.generate_content("Hello")
 
@@ -128,59 +134,57 @@ class AIAssist:
 
     def write_output_to_file(self, repo_name: str, files: List[Dict[str, str]]):
         """
-        Write the extracted data to a timestamped text file.
+        Store a snapshot of the extracted repository data in the artifact store.
         """
-        print(f"Writing output to file for repository: {repo_name}")
+        print(f"Writing output to artifact store for repository: {repo_name}")
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = os.path.join(self.output_dir, f"ai_assist_{timestamp}.txt")
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(f"Repository: {repo_name}\n")
-            f.write(f"Timestamp: {timestamp}\n")
-            f.write("=" * 80 + "\n\n")
-
-            total_files = len(files)
-            f.write(f"Total Files Analyzed: {total_files}\n\n")
-
-            for file in files:
-                num_lines = len(file["content"].splitlines())
-                size = len(file["content"].encode("utf-8"))
-                f.write(f"File: {file['name']}\n")
-                f.write(f"Number of Lines: {num_lines}\n")
-                f.write(f"Size: {size} bytes\n")
-                f.write("-" * 40 + "\n")
-                f.write(file["content"] + "\n")
-                f.write("=" * 80 + "\n\n")
-
-        print(f"Output written to: {output_file}")
-        logging.info(f"Output written to {output_file}")
+        sections = [
+            f"Repository: {repo_name}\n",
+            f"Timestamp: {timestamp}\n",
+            "=" * 80 + "\n\n",
+            f"Total Files Analyzed: {len(files)}\n\n",
+        ]
+        for file in files:
+            sections.append(f"File: {file['name']}\n")
+            sections.append(f"Number of Lines: {len(file['content'].splitlines())}\n")
+            sections.append(f"Size: {len(file['content'].encode('utf-8'))} bytes\n")
+            sections.append("-" * 40 + "\n")
+            sections.append(file["content"] + "\n")
+            sections.append("=" * 80 + "\n\n")
+
+        artifact = get_artifact_store().save(
+            "repo_snapshot", f"ai_assist_{repo_name}", "".join(sections), project_name=repo_name, job_id=get_request_id()
+        )
+        if artifact:
+            logging.info(f"Queued repository snapshot artifact {artifact.key}")
 
     def write_model_response_to_file(self, repo_name: str, response: str, task_description: str = None):
         """
-        Write the AI model's response to a timestamped text file.
+        Store the AI model's response in the artifact store.
         """
-        print(f"Writing model response to file for repository: {repo_name}")
+        print(f"Writing model response to artifact store for repository: {repo_name}")
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = os.path.join(self.output_dir, f"ai_assist_response_{timestamp}.txt")
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(f"Repository: {repo_name}\n")
-            f.write(f"Timestamp: {timestamp}\n")
-            if task_description:
-                f.write(f"Task Description: {task_description}\n")
-            f.write("=" * 80 + "\n\n")
-            f.write("AI Model Response:\n")
-            f.write(response)
+        header = f"Repository: {repo_name}\nTimestamp: {timestamp}\n"
+        if task_description:
+            header += f"Task Description: {task_description}\n"
+        content = header + "=" * 80 + "\n\n" + "AI Model Response:\n" + response
 
-        print(f"Model response written to: {output_file}")
-        logging.info(f"Model response written to {output_file}")
+        artifact = get_artifact_store().save(
+            "model_response", f"ai_assist_response_{repo_name}", content, project_name=repo_name, job_id=get_request_id()
+        )
+        if artifact:
+            logging.info(f"Queued model response artifact {artifact.key}")
 
-    def create_prompt(self, repo_name: str, files: List[Dict[str, str]]) -> str:
+    def create_prompt(self, repo_name: str, files: List[Dict[str, str]], omitted_files: int = 0) -> str:
         """
         Create a prompt for the Gemini AI model to analyze the repository.
         """
         print(f"Creating prompt for repository: {repo_name}")
         file_list = "\n".join([f"- {file['name']}" for file in files])
+        if omitted_files:
+            file_list += f"\n        - ... and {omitted_files} more files, omitted to fit the prompt budget"
         prompt = f"""
         You are an expert software engineer and repository analyzer. Your task is to analyze the repository "{repo_name}" and provide insights.
 
@@ -208,11 +212,14 @@ class AIAssist:
         """
         return prompt
 
-    def create_prompt_for_json_changes(self, repo_name: str, files: List[Dict[str, str]], task_description: str) -> str:
+    def create_prompt_for_json_changes(self, repo_name: str, files: List[Dict[str, str]], task_description: str,
+                                       omitted_files: int = 0) -> str:
         """
         Create a prompt for the Gemini AI model to output changes in JSON format.
         """
         file_list = "\n".join(f"- {file['name']}" for file in files)  # Fixed list comprehension
+        if omitted_files:
+            file_list += f"\n        - ... and {omitted_files} more files, omitted to fit the prompt budget"
         prompt = f"""
         You are an expert software engineer and repository analyzer. Your task is to analyze the repository "{repo_name}" and provide changes to meet the following task:
 
@@ -248,68 +255,204 @@ class AIAssist:
         """
         return prompt
 
-    def analyze_repository(self, repo_url: str) -> Dict:
+    def set_prompt_attributes(self, span, prompt: str, estimate, omitted_files: int):
+        """
+        Record the prompt size and pre-flight estimate on the create_prompt span.
+        """
+        if omitted_files:
+            logging.warning(f"Omitted {omitted_files} files from the prompt to fit the budget ({estimate})")
+        span.set_attributes({
+            "prompt.chars": len(prompt),
+            "prompt.estimated_tokens": estimate.input_tokens,
+            "prompt.estimated_cost_usd": estimate.cost_usd,
+            "prompt.omitted_files": omitted_files,
+        })
+
+    def get_repository_head(self, repo_url: str) -> Tuple[object, str, str]:
+        """
+        Return the repository, its default branch and the branch's head commit SHA.
+        """
+        repo = self.github_client.get_user().get_repo(repo_url.split("/")[-1])
+        branch = repo.default_branch
+        return repo, branch, repo.get_branch(branch).commit.sha
+
+    def record_analysis(self, repo_url: str, branch: str, commit_sha: str, mode: str, result: Dict):
+        """
+        Store the result as the base for the next incremental analysis of the branch.
+        """
+        RepositoryAnalysis.objects.update_or_create(
+            repo_url=repo_url,
+            branch=branch,
+            defaults={"commit_sha": commit_sha, "mode": mode, "model_name": self.model_name, "result": json.dumps(result)},
+        )
+
+    def analyze_repository(self, repo_url: str, mode: str = "full") -> Dict:
         """
-        Analyze the repository and return tasks and refactors.
+        Analyze the repository and return tasks and refactors, recording the analyzed commit.
+        `mode` "map_reduce" summarizes the whole repository chunk by chunk instead of sending
+        one prompt (see repo_analysis); "incremental" updates the previous result with the
+        changes since its commit (see incremental_analysis).
+        """
+        if mode == "incremental":
+            return self.analyze_repository_incremental(repo_url)
+        try:
+            repo, branch, head = self.get_repository_head(repo_url)
+        except Exception as e:
+            raise ValueError(f"Error analyzing repository: {str(e)}")
+        if mode == "map_reduce":
+            result = self.analyze_repository_map_reduce(repo_url, repo, head)
+        else:
+            result = self.analyze_repository_full(repo_url)
+        self.record_analysis(repo_url, branch, head, mode, result)
+        return result
+
+    def analyze_repository_full(self, repo_url: str) -> Dict:
+        """
+        Analyze the repository's files in one prompt.
         """
         print(f"Starting analysis for repository: {repo_url}")
+        tracer = get_tracer()
         try:
-            # Fetch repository files
-            repo_name = repo_url.split("/")[-1]
-            files = self.fetch_repository_files(repo_url)
-
-            # Write extracted data to output file
-            self.write_output_to_file(repo_name, files)
-
-            # Create prompt
-            prompt = self.create_prompt(repo_name, files)
-
-            # Generate response from Gemini AI
-            print("Generating AI response...")
-            generation_config = {
-                "temperature": 0.2,
-                "max_output_tokens": 4096,
-            }
-            response = self.model.generate_content(prompt, generation_config=generation_config)
-
-            # Parse response
-            if hasattr(response, "text"):
-                print("AI response generated successfully.")
-                sanitized_response = self.sanitize_json_content(response.text)
-                parsed_response = json.loads(sanitized_response)  # Parse the sanitized response
-                self.write_model_response_to_file(repo_name, response.text)
-                return parsed_response
-            else:
-                raise ValueError("Failed to generate response from Gemini AI.")
+            with tracer.start_as_current_span("ai_assist.analyze_repository", attributes={"repo.url": repo_url}):
+                # Fetch repository files
+                repo_name = repo_url.split("/")[-1]
+                with tracer.start_as_current_span("ai_assist.fetch_repository_files") as span:
+                    files = self.fetch_repository_files(repo_url)
+                    span.set_attribute("repo.files", len(files))
+
+                # Write extracted data to output file
+                with tracer.start_as_current_span("ai_assist.write_output_to_file"):
+                    self.write_output_to_file(repo_name, files)
+
+                # Create prompt, leaving out files that do not fit the token budget
+                with tracer.start_as_current_span("ai_assist.create_prompt") as span:
+                    prompt, estimate, kept = fit_items(
+                        "ai_assist.analyze", files,
+                        lambda kept_files, omitted: self.create_prompt(repo_name, kept_files, omitted),
+                        self.max_output_tokens, self.model,
+                    )
+                    self.set_prompt_attributes(span, prompt, estimate, len(files) - kept)
+
+                # Generate response from Gemini AI
+                print("Generating AI response...")
+                generation_config = {
+                    "temperature": 0.2,
+                    "max_output_tokens": self.max_output_tokens,
+                }
+                response = call_model("ai_assist.analyze", self.model.generate_content, prompt, generation_config=generation_config)
+
+                # Parse response
+                if hasattr(response, "text"):
+                    print("AI response generated successfully.")
+                    with tracer.start_as_current_span("ai_assist.parse_response"):
+                        sanitized_response = self.sanitize_json_content(response.text)
+                        parsed_response = json.loads(sanitized_response)  # Parse the sanitized response
+                    self.write_model_response_to_file(repo_name, response.text)
+                    return parsed_response
+                else:
+                    raise ValueError("Failed to generate response from Gemini AI.")
+        except PromptBudgetExceeded:
+            raise
         except Exception as e:
             raise ValueError(f"Error analyzing repository: {str(e)}")
 
 
+    def analyze_repository_map_reduce(self, repo_url: str, repo, ref: str) -> Dict:
+        """
+        Analyze the repository at `ref` with MapReduceAnalyzer, reusing cached file summaries.
+        """
+        print(f"Starting map-reduce analysis for repository: {repo_url}")
+        tracer = get_tracer()
+        try:
+            with tracer.start_as_current_span(
+                "ai_assist.analyze_repository", attributes={"repo.url": repo_url, "analysis.mode": "map_reduce"}
+            ):
+                repo_name = repo_url.split("/")[-1]
+                result = MapReduceAnalyzer(self).analyze(repo, repo_name, ref)
+                self.write_model_response_to_file(repo_name, json.dumps(result, indent=2))
+                return result
+        except PromptBudgetExceeded:
+            raise
+        except Exception as e:
+            raise ValueError(f"Error analyzing repository: {str(e)}")
+
+    def analyze_repository_incremental(self, repo_url: str) -> Dict:
+        """
+        Update the recorded analysis of the default branch with the changes since its commit.
+        Runs a full analysis (AI_ASSIST_INCREMENTAL_BASE: "full" or "map_reduce") when there
+        is no usable previous result or the change is too large.
+        """
+        print(f"Starting incremental analysis for repository: {repo_url}")
+        tracer = get_tracer()
+        try:
+            with tracer.start_as_current_span(
+                "ai_assist.analyze_repository", attributes={"repo.url": repo_url, "analysis.mode": "incremental"}
+            ) as span:
+                repo_name = repo_url.split("/")[-1]
+                repo, branch, head = self.get_repository_head(repo_url)
+                previous = RepositoryAnalysis.objects.filter(
+                    repo_url=repo_url, branch=branch, model_name=self.model_name
+                ).first()
+                record_cache("repository_analysis", previous is not None and previous.commit_sha == head)
+                if previous is not None and previous.commit_sha == head:
+                    span.set_attribute("analysis.base", "unchanged")
+                    return json.loads(previous.result)
+
+                result = IncrementalAnalyzer(self).analyze(repo, repo_name, previous, head) if previous else None
+                mode = "incremental"
+                if result is None:
+                    mode = os.getenv("AI_ASSIST_INCREMENTAL_BASE", "full")
+                    if mode == "map_reduce":
+                        result = self.analyze_repository_map_reduce(repo_url, repo, head)
+                    else:
+                        result = self.analyze_repository_full(repo_url)
+                span.set_attribute("analysis.base", mode)
+
+                self.record_analysis(repo_url, branch, head, mode, result)
+                if mode == "incremental":
+                    self.write_model_response_to_file(repo_name, json.dumps(result, indent=2))
+                return result
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Error analyzing repository: {str(e)}")
+
     def generate_json_changes(self, repo_url: str, task_description: str) -> str:
         """
         Generate a JSON document for the given task description.
         """
+        tracer = get_tracer()
         try:
-            # Fetch repository files
-            repo_name = repo_url.split("/")[-1]
-            files = self.fetch_repository_files(repo_url)
-
-            # Create prompt
-            prompt = self.create_prompt_for_json_changes(repo_name, files, task_description)
-
-            # Generate response from Gemini AI
-            generation_config = {
-                "temperature": 0.2,
-                "max_output_tokens": 4096,
-            }
-            response = self.model.generate_content(prompt, generation_config=generation_config)
-
-            # Parse response
-            if hasattr(response, "text"):
-                self.write_model_response_to_file(repo_name, response.text, task_description)
-                return response.text
-            else:
-                raise ValueError("Failed to generate JSON changes from Gemini AI.")
+            with tracer.start_as_current_span("ai_assist.generate_json_changes", attributes={"repo.url": repo_url}):
+                # Fetch repository files
+                repo_name = repo_url.split("/")[-1]
+                with tracer.start_as_current_span("ai_assist.fetch_repository_files") as span:
+                    files = self.fetch_repository_files(repo_url)
+                    span.set_attribute("repo.files", len(files))
+
+                # Create prompt, leaving out files that do not fit the token budget
+                with tracer.start_as_current_span("ai_assist.create_prompt") as span:
+                    prompt, estimate, kept = fit_items(
+                        "ai_assist.json_changes", files,
+                        lambda kept_files, omitted: self.create_prompt_for_json_changes(
+                            repo_name, kept_files, task_description, omitted),
+                        self.max_output_tokens, self.model,
+                    )
+                    self.set_prompt_attributes(span, prompt, estimate, len(files) - kept)
+
+                # Generate response from Gemini AI
+                generation_config = {
+                    "temperature": 0.2,
+                    "max_output_tokens": self.max_output_tokens,
+                }
+                # Long change lists cut off by the output token limit are continued, not discarded
+                response_text = call_model_with_continuation(
+                    "ai_assist.json_changes", self.model, prompt, generation_config
+                )
+                self.write_model_response_to_file(repo_name, response_text, task_description)
+                return response_text
+        except PromptBudgetExceeded:
+            raise
         except Exception as e:
             raise ValueError(f"Error generating JSON changes: {str(e)}")
 
@@ -405,66 +548,71 @@ class AIAssist:
         """
         Apply changes using PyGithub on a new branch called 'kage-assist'.
         """
+        tracer = get_tracer()
         try:
-            repo_name = repo_url.split("/")[-1]
-            user = self.github_client.get_user()
-            repo = user.get_repo(repo_name)
-
-            # Create a new branch 'kage-assist' from the default branch
-            default_branch = repo.default_branch
-            source_branch = repo.get_branch(default_branch)
-            new_branch_name = "kage-assist"    
+            with tracer.start_as_current_span("ai_assist.apply_changes_with_pygithub", attributes={"repo.url": repo_url, "changes": len(changes)}):
+                repo_name = repo_url.split("/")[-1]
+                user = self.github_client.get_user()
+                repo = user.get_repo(repo_name)
 
-            try:
-                # Check if the branch already exists
-                repo.get_branch(new_branch_name)
-                print(f"Branch '{new_branch_name}' already exists.")
-            except Exception:
-                # Create the new branch
-                repo.create_git_ref(ref=f"refs/heads/{new_branch_name}", sha=source_branch.commit.sha)
-                print(f"Created new branch: {new_branch_name}")
-
-            # Group changes by file path
-            changes_by_file = {}
-            for change in changes:
-                file_path = change["file_path"]
-                if file_path not in changes_by_file:
-                    changes_by_file[file_path] = []
-                changes_by_file[file_path].append(change)
-
-            # Apply changes file by file
-            for file_path, file_changes in changes_by_file.items():
-                try:
-                    # Fetch the latest file content and SHA from the new branch
-                    file = repo.get_contents(file_path, ref=new_branch_name)
-                    current_content = file.decoded_content.decode("utf-8")
-                    lines = current_content.splitlines()
-
-                    # Apply all changes for this file
-                    for change in file_changes:
-                        line_number = change["line_number"]
-                        action = change["action"]
-                        content = change.get("content", "")
-
-                        if action == "add":
-                            lines.insert(line_number - 1, content)
-                        elif action == "remove":
-                            lines.pop(line_number - 1)
-
-                    # Update the file with all changes on the new branch
-                    updated_content = "\n".join(lines)
-                    repo.update_file(
-                        path=file_path,
-                        message=f"AI-generated changes for {file_path}",
-                        content=updated_content,
-                        sha=file.sha,  # Use the latest SHA
-                        branch=new_branch_name  # Specify the branch
-                    )
-                    print(f"Updated file: {file_path} on branch '{new_branch_name}'")
+                # Create a new branch 'kage-assist' from the default branch
+                default_branch = repo.default_branch
+                source_branch = repo.get_branch(default_branch)
+                new_branch_name = "kage-assist"    
 
-                except Exception as e:
-                    print(f"Error updating file {file_path}: {e}")
-                    continue
+                with tracer.start_as_current_span("ai_assist.ensure_branch", attributes={"git.branch": new_branch_name}):
+                    try:
+                        # Check if the branch already exists
+                        repo.get_branch(new_branch_name)
+                        print(f"Branch '{new_branch_name}' already exists.")
+                    except Exception:
+                        # Create the new branch
+                        repo.create_git_ref(ref=f"refs/heads/{new_branch_name}", sha=source_branch.commit.sha)
+                        print(f"Created new branch: {new_branch_name}")
+
+                # Group changes by file path
+                changes_by_file = {}
+                for change in changes:
+                    file_path = change["file_path"]
+                    if file_path not in changes_by_file:
+                        changes_by_file[file_path] = []
+                    changes_by_file[file_path].append(change)
+
+                # Apply changes file by file
+                for file_path, file_changes in changes_by_file.items():
+                    with tracer.start_as_current_span("ai_assist.apply_file_changes", attributes={"file.path": file_path}) as span:
+                        try:
+                            # Fetch the latest file content and SHA from the new branch
+                            file = repo.get_contents(file_path, ref=new_branch_name)
+                            current_content = file.decoded_content.decode("utf-8")
+                            lines = current_content.splitlines()
+
+                            # Apply all changes for this file
+                            for change in file_changes:
+                                line_number = change["line_number"]
+                                action = change["action"]
+                                content = change.get("content", "")
+
+                                if action == "add":
+                                    lines.insert(line_number - 1, content)
+                                elif action == "remove":
+                                    lines.pop(line_number - 1)
+
+                            # Update the file with all changes on the new branch
+                            updated_content = "\n".join(lines)
+                            repo.update_file(
+                                path=file_path,
+                                message=f"AI-generated changes for {file_path}",
+                                content=updated_content,
+                                sha=file.sha,  # Use the latest SHA
+                                branch=new_branch_name  # Specify the branch
+                            )
+                            print(f"Updated file: {file_path} on branch '{new_branch_name}'")
+
+                        except Exception as e:
+                            span.record_exception(e)
+                            print(f"Error updating file {file_path}: {e}")
+                            continue
 
         except Exception as e:
             raise ValueError(f"Error applying changes with PyGithub: {str(e)}")
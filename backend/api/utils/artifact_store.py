@@ -0,0 +1,281 @@
+"""
+Artifact store for generated plans, repository snapshots and raw model responses.
+
+Replaces the ad-hoc files under output_plans/ and output/. Writes are sampled, optionally
+gzip-compressed and handed to a background thread so they never add latency to the
+request; an `Artifact` row indexes every stored blob so it can be looked up by project or
+job (request id), and the oldest blobs of each kind are pruned beyond a retention limit.
+
+Configuration (environment):
+
+- ARTIFACT_BACKEND: "local" (default, files under ARTIFACT_DIR), "gcs" (ARTIFACT_GCS_BUCKET /
+  ARTIFACT_GCS_PREFIX), "memory" (in-process stand-in) or "none" to disable the store
+- ARTIFACT_COMPRESS: gzip blobs (default true)
+- ARTIFACT_SAMPLE_RATE: fraction of artifacts kept (default 1.0), overridable per kind with
+  ARTIFACT_<KIND>_SAMPLE_RATE, e.g. ARTIFACT_REPO_SNAPSHOT_SAMPLE_RATE=0.1
+- ARTIFACT_MAX_PER_KIND: number of artifacts of each kind kept (default 200)
+- ARTIFACT_ASYNC: write in a background thread (default true)
+"""
+import gzip
+import json
+import logging
+import os
+import random
+import re
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional, Union
+
+from ..models import Artifact
+
+logger = logging.getLogger(__name__)
+
+Payload = Union[str, bytes, dict, list]
+
+
+class LocalArtifactBackend:
+    """Stores blobs as files under a root directory."""
+
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def write(self, key: str, data: bytes):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def read(self, key: str) -> bytes:
+        with open(os.path.join(self.root, key), "rb") as f:
+            return f.read()
+
+    def delete(self, key: str):
+        try:
+            os.remove(os.path.join(self.root, key))
+        except FileNotFoundError:
+            pass
+
+
+class GCSArtifactBackend:
+    """Stores blobs as objects in a Cloud Storage bucket."""
+
+    name = "gcs"
+
+    def __init__(self, bucket_name: str, prefix: str = ""):
+        # Imported lazily, google-cloud-storage is only needed when this backend is used
+        from google.cloud import storage
+
+        self.bucket = storage.Client().bucket(bucket_name)
+        self.prefix = prefix.strip("/")
+
+    def _object_name(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def write(self, key: str, data: bytes):
+        self.bucket.blob(self._object_name(key)).upload_from_string(data)
+
+    def read(self, key: str) -> bytes:
+        return self.bucket.blob(self._object_name(key)).download_as_bytes()
+
+    def delete(self, key: str):
+        from google.api_core.exceptions import NotFound
+
+        try:
+            self.bucket.blob(self._object_name(key)).delete()
+        except NotFound:
+            pass
+
+
+class MemoryArtifactBackend:
+    """In-process stand-in for tests and benchmarks."""
+
+    name = "memory"
+
+    def __init__(self):
+        self.blobs: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def write(self, key: str, data: bytes):
+        with self._lock:
+            self.blobs[key] = data
+
+    def read(self, key: str) -> bytes:
+        with self._lock:
+            return self.blobs[key]
+
+    def delete(self, key: str):
+        with self._lock:
+            self.blobs.pop(key, None)
+
+
+class ArtifactStore:
+    def __init__(self, backend, compress: bool = True, sample_rate: float = 1.0,
+                 max_per_kind: int = 200, async_writes: bool = True,
+                 kind_sample_rates: Optional[Dict[str, float]] = None):
+        self.backend = backend
+        self.compress = compress
+        self.sample_rate = sample_rate
+        self.kind_sample_rates = kind_sample_rates or {}
+        self.max_per_kind = max_per_kind
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="artifact-store") if async_writes else None
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    def _submit(self, fn, *args):
+        if self._executor is None:
+            fn(*args)
+            return
+        future = self._executor.submit(fn, *args)
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future: Future):
+        with self._pending_lock:
+            self._pending.discard(future)
+        if future.exception() is not None:
+            logger.error(f"Artifact store background task failed: {future.exception()}")
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        Wait for queued writes and deletes to finish.
+        """
+        with self._pending_lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.exception(timeout=timeout)
+
+    def _encode(self, payload: Payload) -> bytes:
+        if isinstance(payload, (dict, list)):
+            return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if isinstance(payload, str):
+            return payload.encode("utf-8")
+        return payload
+
+    def _write(self, key: str, data: bytes):
+        if self.compress:
+            data = gzip.compress(data, compresslevel=6)
+        self.backend.write(key, data)
+
+    def save(self, kind: str, name: str, payload: Payload, project_name: Optional[str] = None,
+             job_id: Optional[str] = None) -> Optional[Artifact]:
+        """
+        Index and (in the background) write an artifact. Returns None when the artifact was
+        dropped by sampling.
+        """
+        if random.random() >= self.kind_sample_rates.get(kind, self.sample_rate):
+            return None
+
+        extension = "json" if isinstance(payload, (dict, list)) else "txt"
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)[:80] or kind
+        key = f"{kind}/{datetime.now().strftime('%Y%m%d')}/{safe_name}_{uuid.uuid4().hex[:8]}.{extension}"
+        if self.compress:
+            key += ".gz"
+
+        data = self._encode(payload)
+        artifact = Artifact.objects.create(
+            kind=kind,
+            key=key,
+            backend=self.backend.name,
+            project_name=project_name,
+            job_id=job_id,
+            size=len(data),
+            compressed=self.compress,
+        )
+        # Compression and the backend write happen off the request thread
+        self._submit(self._write, key, data)
+        self._enforce_retention(kind)
+        return artifact
+
+    def _enforce_retention(self, kind: str):
+        expired = list(
+            Artifact.objects.filter(kind=kind).order_by("-id").values_list("id", "key")[self.max_per_kind:]
+        )
+        if not expired:
+            return
+        Artifact.objects.filter(id__in=[artifact_id for artifact_id, _ in expired]).delete()
+        for _, key in expired:
+            self._submit(self.backend.delete, key)
+
+    def read(self, artifact: Artifact) -> bytes:
+        data = self.backend.read(artifact.key)
+        return gzip.decompress(data) if artifact.compressed else data
+
+    def find(self, project_name: Optional[str] = None, job_id: Optional[str] = None, kind: Optional[str] = None):
+        """
+        Return indexed artifacts, newest first, filtered by project, job and kind.
+        """
+        artifacts = Artifact.objects.all()
+        if project_name:
+            artifacts = artifacts.filter(project_name=project_name)
+        if job_id:
+            artifacts = artifacts.filter(job_id=job_id)
+        if kind:
+            artifacts = artifacts.filter(kind=kind)
+        return artifacts.order_by("-id")
+
+
+class NullArtifactStore:
+    """Used when ARTIFACT_BACKEND=none: nothing is written or indexed."""
+
+    def save(self, *args, **kwargs):
+        return None
+
+    def flush(self, timeout: Optional[float] = None):
+        pass
+
+    def read(self, artifact: Artifact) -> bytes:
+        # Rows indexed before the store was disabled point at content that is no longer served
+        raise FileNotFoundError(artifact.key)
+
+    def find(self, *args, **kwargs):
+        return Artifact.objects.none()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
+def build_artifact_store():
+    backend_name = os.getenv("ARTIFACT_BACKEND", "local")
+    if backend_name == "none":
+        return NullArtifactStore()
+    if backend_name == "gcs":
+        backend = GCSArtifactBackend(os.environ["ARTIFACT_GCS_BUCKET"], os.getenv("ARTIFACT_GCS_PREFIX", "artifacts"))
+    elif backend_name == "memory":
+        backend = MemoryArtifactBackend()
+    else:
+        backend = LocalArtifactBackend(os.getenv("ARTIFACT_DIR", os.path.join(os.getcwd(), "artifacts")))
+
+    kind_sample_rates = {
+        key[len("ARTIFACT_"):-len("_SAMPLE_RATE")].lower(): float(value)
+        for key, value in os.environ.items()
+        if key.startswith("ARTIFACT_") and key.endswith("_SAMPLE_RATE") and key != "ARTIFACT_SAMPLE_RATE"
+    }
+    return ArtifactStore(
+        backend,
+        compress=_env_flag("ARTIFACT_COMPRESS", "true"),
+        sample_rate=float(os.getenv("ARTIFACT_SAMPLE_RATE", "1.0")),
+        max_per_kind=int(os.getenv("ARTIFACT_MAX_PER_KIND", "200")),
+        async_writes=_env_flag("ARTIFACT_ASYNC", "true"),
+        kind_sample_rates=kind_sample_rates,
+    )
+
+
+def get_artifact_store():
+    """
+    Return the process-wide artifact store, built from the environment on first use.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = build_artifact_store()
+        return _store
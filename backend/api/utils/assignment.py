@@ -0,0 +1,150 @@
+"""
+Deterministic task-to-employee assignment.
+
+In Kage's two-phase mode (KAGE_ASSIGNMENT=local) the model only decomposes the project into
+tasks tagged with the department and experience level they need; people are assigned here
+with a min-cost assignment (Hungarian algorithm), so a plan can be reassigned after team
+changes without another model call. The cost of giving a task to a team member combines:
+
+- department fit: a task goes to someone from its department where possible
+- level fit: the distance between the required and the member's experience level
+- the experience guidelines: Senior Consultants and above integrate and review rather than
+  execute, Analysts and Consultants execute rather than integrate
+- workload: each further task given to the same person costs more, which balances the load
+- stability (reassignment only): a task's current assignee is slightly preferred
+"""
+import math
+import re
+from typing import Dict, List, Optional, Sequence
+
+LEVEL_RANKS = {
+    "analyst": 0,
+    "consultant": 1,
+    "senior consultant": 2,
+    "manager": 3,
+    "senior manager": 4,
+    "director": 5,
+    "partner": 6,
+}
+
+# Senior Consultant: the minimum level for departmental integration and oversight
+SENIOR_RANK = LEVEL_RANKS["senior consultant"]
+
+DEPARTMENT_MISMATCH_COST = 10.0
+LEVEL_STEP_COST = 2.0
+ROLE_MISMATCH_COST = 8.0
+LOAD_STEP_COST = 3.0
+KEEP_ASSIGNEE_BONUS = 1.0
+
+
+def level_rank(level: Optional[str]) -> Optional[int]:
+    """
+    Rank of a level string ("Senior Consultant", "Analyst 2", "manager"), None if unknown.
+    """
+    normalized = " ".join(re.sub(r"[^a-z ]", " ", str(level or "").lower()).split())
+    if normalized in LEVEL_RANKS:
+        return LEVEL_RANKS[normalized]
+    matches = [name for name in LEVEL_RANKS if name in normalized]
+    return LEVEL_RANKS[max(matches, key=len)] if matches else None
+
+
+def _normalize_department(department: Optional[str]) -> str:
+    return " ".join(str(department or "").lower().split())
+
+
+def task_cost(task: Dict, member: Dict) -> float:
+    """
+    Cost of assigning `task` (department / level tags, either may be missing) to `member`.
+    """
+    cost = 0.0
+    department = _normalize_department(task.get("department"))
+    if department and department != _normalize_department(member.get("department")):
+        cost += DEPARTMENT_MISMATCH_COST
+
+    required, actual = level_rank(task.get("level")), level_rank(member.get("level"))
+    if required is not None and actual is not None:
+        cost += LEVEL_STEP_COST * abs(required - actual)
+        if (required >= SENIOR_RANK) != (actual >= SENIOR_RANK):
+            cost += ROLE_MISMATCH_COST
+    return cost
+
+
+def min_cost_assignment(cost: Sequence[Sequence[float]]) -> List[int]:
+    """
+    Hungarian algorithm (shortest augmenting paths with potentials) for a rows x columns cost
+    matrix with rows <= columns. Returns the column assigned to each row, minimizing the total
+    cost; O(rows^2 * columns).
+    """
+    rows = len(cost)
+    if not rows:
+        return []
+    columns = len(cost[0])
+    if rows > columns:
+        raise ValueError("The cost matrix needs at least as many columns as rows.")
+
+    u, v = [0.0] * (rows + 1), [0.0] * (columns + 1)
+    owner, way = [0] * (columns + 1), [0] * (columns + 1)
+    for row in range(1, rows + 1):
+        owner[0] = row
+        column = 0
+        min_reduced = [math.inf] * (columns + 1)
+        used = [False] * (columns + 1)
+        while True:
+            used[column] = True
+            current_row = owner[column]
+            costs = cost[current_row - 1]
+            delta, next_column = math.inf, 0
+            for j in range(1, columns + 1):
+                if used[j]:
+                    continue
+                reduced = costs[j - 1] - u[current_row] - v[j]
+                if reduced < min_reduced[j]:
+                    min_reduced[j], way[j] = reduced, column
+                if min_reduced[j] < delta:
+                    delta, next_column = min_reduced[j], j
+            for j in range(columns + 1):
+                if used[j]:
+                    u[owner[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_reduced[j] -= delta
+            column = next_column
+            if owner[column] == 0:
+                break
+        # Flip the augmenting path
+        while column:
+            previous = way[column]
+            owner[column] = owner[previous]
+            column = previous
+
+    assignment = [0] * rows
+    for j in range(1, columns + 1):
+        if owner[j]:
+            assignment[owner[j] - 1] = j - 1
+    return assignment
+
+
+def assign_tasks(tasks: List[Dict], team: List[Dict], current: Optional[List[Optional[int]]] = None) -> List[Optional[int]]:
+    """
+    Return the index into `team` (dicts with name, level and department) assigned to each
+    task (dicts with optional department and level tags). `current` holds each task's
+    present assignee index, or None, when reassigning. Tasks get None when the team is empty.
+    """
+    if not team:
+        return [None] * len(tasks)
+
+    base = [
+        [
+            task_cost(task, member) - (KEEP_ASSIGNEE_BONUS if current and current[index] == member_index else 0.0)
+            for member_index, member in enumerate(team)
+        ]
+        for index, task in enumerate(tasks)
+    ]
+
+    # The k-th task given to a member costs k load steps, so nobody takes more than their fair
+    # share plus the spread of the fit costs in load steps; that many slots per member suffice
+    spread = max(max(row) for row in base) - min(min(row) for row in base) if base else 0.0
+    slots = min(len(tasks), math.ceil(len(tasks) / len(team)) + math.ceil(spread / LOAD_STEP_COST) + 1)
+    matrix = [[cost + LOAD_STEP_COST * slot for cost in row for slot in range(slots)] for row in base]
+
+    return [column // slots for column in min_cost_assignment(matrix)]
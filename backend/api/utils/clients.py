@@ -0,0 +1,136 @@
+"""
+Factories for the outbound service clients (Gemini and GitHub).
+
+Both honour a base URL override so the AI paths can run against local stand-ins
+(benchmarks/fake_gemini.py, benchmarks/fake_github.py) or a proxy:
+
+- GEMINI_BASE_URL: use a plain HTTP client speaking the Gemini REST `generateContent` API at
+  this URL (with GEMINI_API_KEY when set) instead of the Vertex AI SDK
+- GITHUB_API_URL: passed to PyGithub as base_url, e.g. a GitHub Enterprise API endpoint or
+  the fake server
+"""
+import json
+import os
+import urllib.request
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+from .metrics import instrument_github
+
+
+class HttpModelResponse:
+    """
+    The subset of the Vertex AI response object the callers use: `text`, `candidates`
+    (with `finish_reason` and `content.parts`) and `usage_metadata`.
+    """
+
+    def __init__(self, payload: Dict[str, Any]):
+        self.raw = payload
+        self.candidates = []
+        for candidate in payload.get("candidates", []):
+            parts = [SimpleNamespace(text=part.get("text", "")) for part in candidate.get("content", {}).get("parts", [])]
+            self.candidates.append(SimpleNamespace(
+                content=SimpleNamespace(parts=parts),
+                finish_reason=candidate.get("finishReason", "STOP"),
+            ))
+        usage = payload.get("usageMetadata", {})
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=usage.get("promptTokenCount", 0),
+            candidates_token_count=usage.get("candidatesTokenCount", 0),
+            total_token_count=usage.get("totalTokenCount", 0),
+        )
+
+    @property
+    def text(self) -> str:
+        if not self.candidates or not self.candidates[0].content.parts:
+            raise ValueError("Response has no text candidates.")
+        return "".join(part.text for part in self.candidates[0].content.parts)
+
+    def __repr__(self):
+        return f"HttpModelResponse({json.dumps(self.raw)[:500]})"
+
+
+class HttpGenerativeModel:
+    """
+    Minimal stand-in for `vertexai.generative_models.GenerativeModel` that posts to a Gemini
+    REST endpoint. Errors surface as urllib HTTPError, whose `code` the call policy in
+    model_calls uses to decide on retries.
+    """
+
+    def __init__(self, model_name: str, base_url: str, api_key: Optional[str] = None, timeout: float = 120.0,
+                 system_instruction: Optional[str] = None):
+        self._model_name = model_name
+        self.system_instruction = system_instruction
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def generate_content(self, contents, generation_config=None, system_instruction: Optional[str] = None, **kwargs):
+        if hasattr(generation_config, "to_dict"):
+            generation_config = generation_config.to_dict()
+        if isinstance(contents, str):
+            contents = [{"role": "user", "parts": [{"text": contents}]}]
+
+        body = {"contents": contents}
+        system_instruction = system_instruction or self.system_instruction
+        if generation_config:
+            body["generationConfig"] = generation_config
+        if system_instruction:
+            body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["x-goog-api-key"] = self.api_key
+        request = urllib.request.Request(
+            f"{self.base_url}/v1beta/models/{self._model_name}:generateContent",
+            data=json.dumps(body).encode("utf-8"),
+            headers=headers,
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return HttpModelResponse(json.loads(response.read()))
+
+
+def get_generative_model(model_name: str, project_id: Optional[str] = None, location: Optional[str] = None,
+                         system_instruction: Optional[str] = None):
+    """
+    Return a Gemini model client: the HTTP client when GEMINI_BASE_URL is set, otherwise a
+    Vertex AI GenerativeModel (the SDK is imported here, on first use). A system instruction
+    is sent with every call made through the client.
+    """
+    base_url = os.getenv("GEMINI_BASE_URL")
+    if base_url:
+        return HttpGenerativeModel(
+            model_name,
+            base_url,
+            api_key=os.getenv("GEMINI_API_KEY"),
+            timeout=float(os.getenv("GEMINI_HTTP_TIMEOUT", "120")),
+            system_instruction=system_instruction,
+        )
+
+    import vertexai
+    from vertexai.generative_models import GenerativeModel
+
+    vertexai.init(project=project_id, location=location)
+    return GenerativeModel(model_name, system_instruction=system_instruction)
+
+
+def get_github_client(token: str):
+    """
+    Build an instrumented PyGithub client, pointed at GITHUB_API_URL when it is set.
+    PyGithub is imported on first use to keep worker start-up fast.
+
+    PyGithub spaces requests 0.25s apart (1s for writes) to stay clear of GitHub's secondary
+    rate limits; GITHUB_SECONDS_BETWEEN_REQUESTS / GITHUB_SECONDS_BETWEEN_WRITES override that.
+    """
+    from github import Github
+
+    options = {}
+    base_url = os.getenv("GITHUB_API_URL")
+    if base_url:
+        options["base_url"] = base_url.rstrip("/")
+    for option in ("seconds_between_requests", "seconds_between_writes"):
+        value = os.getenv(f"GITHUB_{option.upper()}")
+        if value not in (None, ""):
+            options[option] = float(value)
+    return instrument_github(Github(token, **options))
@@ -1,18 +1,17 @@
-from google.cloud import aiplatform
-import requests
 from dotenv import load_dotenv
 import os
+from .model_calls import call_model
 load_dotenv()
 
-from google import genai
-from google.genai import types
-import base64
 
 class CodeOptimizer:
     def __init__(self):
         os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = os.getenv("CODE_OPTIMIZER_GOOGLE_APPLICATION_CREDENTIALS")
         load_dotenv()
 
+        # google-genai is imported on first use to keep worker start-up fast
+        from google import genai
+
         self.client = genai.Client(
             vertexai=True,
             project=os.getenv("CODE_OPTIMIZER_GCP_PROJECT_ID"),
@@ -20,6 +19,8 @@ class CodeOptimizer:
         )
 
     def generate(self, input):
+        from google.genai import types
+
         model = "projects/{}/locations/{}/endpoints/124751688799092736".format(
             os.getenv("CODE_OPTIMIZER_GCP_PROJECT_ID"),
             os.getenv("CODE_OPTIMIZER_GCP_LOCATION"),
@@ -45,7 +46,9 @@ class CodeOptimizer:
         )
 
         # Generate content in a single call
-        response = self.client.models.generate_content(
+        response = call_model(
+            "code_optimizer.generate",
+            self.client.models.generate_content,
             model=model,
             contents=contents,
             config=generate_content_config,
@@ -0,0 +1,90 @@
+"""
+Compact wire format for Kage plans (KAGE_PLAN_FORMAT=compact).
+
+Output tokens dominate plan generation latency, and the JSON plan repeats the keys and the
+full employee name for every task. In compact mode the prompt numbers the team roster, and
+the model writes one pipe-separated record per task, which is decoded into the usual
+ProjectPlan (or TaggedProjectPlan in two-phase mode) locally:
+
+    task_id|member number|description                  (model assignment)
+    task_id|level code|department|description          (KAGE_ASSIGNMENT=local)
+
+The description is always the last field, so it may itself contain "|". Level codes are
+A (Analyst), C (Consultant) and S (Senior Consultant). Run `python -m benchmarks.plan_encoding`
+to compare output tokens and latency with the JSON format.
+"""
+import logging
+import re
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LEVEL_CODES = {"A": "Analyst", "C": "Consultant", "S": "Senior Consultant"}
+
+COMPACT_FORMAT_INSTRUCTIONS = """Do not reply with JSON. Write one line per task, and nothing else, in the form:
+task_id|member number|description
+where `member number` is the number of the assigned team member in the 'Available Team Roles' list. Example:
+1|2|Set up the CI pipeline and deployment environments."""
+
+COMPACT_TAGGED_FORMAT_INSTRUCTIONS = """Do not reply with JSON. Write one line per task, and nothing else, in the form:
+task_id|level|department|description
+where `level` is A (Analyst), C (Consultant) or S (Senior Consultant) and `department` is a Department string from the 'Available Team Roles'. Example:
+1|C|Cloud|Set up the CI pipeline and deployment environments."""
+
+
+def format_numbered_roster(team_roles: List[Dict[str, str]]) -> str:
+    """
+    The roster with 1-based member numbers, which compact records refer to.
+    """
+    roster = "\n".join(
+        f"- {number}: {role['name']} (Level: {role['level']}, Department: {role['department']})"
+        for number, role in enumerate(team_roles, start=1)
+    )
+    return roster or "No team roles provided."
+
+
+def complete_line_prefix(text: str) -> Tuple[Optional[int], bool]:
+    """
+    Continuation trimming for compact replies (see model_calls.call_model_with_continuation):
+    keep everything up to the last complete line.
+    """
+    end = text.rfind("\n")
+    return (end + 1 if end >= 0 else None), False
+
+
+def decode_compact_plan(response_content: str, team_roles: List[Dict[str, str]], tagged: bool = False) -> Dict:
+    """
+    Decode compact records into the dict form of ProjectPlan / TaggedProjectPlan, ready for
+    model_validate. Lines that are not records (fences, blank lines, stray prose) are skipped;
+    an unknown member number leaves the task unassigned.
+    """
+    tasks = []
+    for line in response_content.splitlines():
+        line = line.strip()
+        if not re.match(r"^\d+\s*\|", line):
+            continue
+        if tagged:
+            fields = [field.strip() for field in line.split("|", 3)]
+            if len(fields) < 4:
+                logger.warning(f"Skipping malformed compact record: {line[:100]}")
+                continue
+            task_id, level, department, description = fields
+            tasks.append({
+                "task_id": int(task_id),
+                "description": description,
+                "department": department,
+                "level": LEVEL_CODES.get(level.upper(), level),
+            })
+        else:
+            fields = [field.strip() for field in line.split("|", 2)]
+            if len(fields) < 3 or not fields[1].isdigit():
+                logger.warning(f"Skipping malformed compact record: {line[:100]}")
+                continue
+            task_id, number, description = fields
+            member = int(number) - 1
+            tasks.append({
+                "task_id": int(task_id),
+                "description": description,
+                "employee_name": team_roles[member]["name"] if 0 <= member < len(team_roles) else "",
+            })
+    return {"tasks": tasks}
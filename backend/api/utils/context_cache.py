@@ -0,0 +1,121 @@
+"""
+Context caching for static prompt prefixes (system instructions).
+
+Kage resends the same multi-kilobyte instructions and experience guidelines with every plan
+request. `get_context_cache().get_model(...)` returns a model client that already carries
+that prefix, so callers only send the per-request part:
+
+- "vertex": the prefix is registered once as Vertex AI cached content with a TTL and the
+  model is built with `GenerativeModel.from_cached_content`; cached input tokens are billed
+  at a discount and skip prefill. Vertex only caches prompts above a minimum size (tens of
+  thousands of tokens on Gemini 1.5), so smaller prefixes, HTTP clients (GEMINI_BASE_URL)
+  and any creation error fall back to "local".
+- "local": the model is built once per prefix with the pre-rendered prefix as its system
+  instruction and reused until the TTL passes. This only restructures the prompt: the
+  system instruction is sent and billed as input tokens on every call, so there is no
+  billing or latency saving over "off", only fewer client objects.
+
+Entries are keyed by model name and a hash of the prefix, so a changed prefix (e.g. Kage's
+condensed guidelines) gets its own entry.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Optional, Tuple
+
+from .clients import get_generative_model
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_CACHE_MODES = ("vertex", "local", "off")
+
+# Cached content is recreated this long before it expires, so no call hits an expired cache
+REFRESH_MARGIN = 60
+
+
+class CachedPrefix:
+    def __init__(self, model, mode: str, expires_at: float, name: Optional[str] = None):
+        self.model = model
+        self.mode = mode
+        self.expires_at = expires_at
+        self.name = name
+
+
+class ContextCache:
+    """
+    Process-wide registry of model clients bound to a cached prefix.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, CachedPrefix] = {}
+        self._lock = threading.Lock()
+
+    def get_model(self, model_name: str, project_id: Optional[str], location: Optional[str], system_instruction: str,
+                  mode: str = "local", ttl: int = 3600) -> Tuple[object, str]:
+        """
+        Return (model, mode used) for `system_instruction`. Creation happens under the lock so
+        concurrent requests do not register the same prefix twice.
+        """
+        key = hashlib.sha256(f"{model_name}\0{system_instruction}".encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires_at > now:
+                record_cache("context_prefix", True)
+                return entry.model, entry.mode
+            record_cache("context_prefix", False)
+
+            entry = None
+            if mode == "vertex" and not os.getenv("GEMINI_BASE_URL"):
+                try:
+                    entry = self._create_vertex_entry(model_name, project_id, location, system_instruction, ttl, key)
+                except Exception as e:
+                    logger.warning(f"Vertex context cache unavailable, using the local prefix: {e}")
+            if entry is None:
+                model = get_generative_model(model_name, project_id, location, system_instruction=system_instruction)
+                entry = CachedPrefix(model, "local", now + ttl)
+
+            self._entries = {k: v for k, v in self._entries.items() if v.expires_at > now}
+            self._entries[key] = entry
+            return entry.model, entry.mode
+
+    def _create_vertex_entry(self, model_name, project_id, location, system_instruction, ttl, key) -> CachedPrefix:
+        import vertexai
+        from vertexai.preview import caching
+        from vertexai.preview.generative_models import GenerativeModel
+
+        vertexai.init(project=project_id, location=location)
+        cached_content = caching.CachedContent.create(
+            model_name=model_name,
+            system_instruction=system_instruction,
+            ttl=timedelta(seconds=ttl),
+            display_name=f"kage-prefix-{key[:12]}",
+        )
+        logger.info(f"Registered Vertex cached content {cached_content.name} for {ttl}s")
+        return CachedPrefix(
+            GenerativeModel.from_cached_content(cached_content=cached_content),
+            "vertex",
+            time.monotonic() + max(ttl - REFRESH_MARGIN, 0),
+            cached_content.name,
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_context_cache() -> ContextCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ContextCache()
+    return _cache
@@ -0,0 +1,124 @@
+"""
+Incremental re-analysis of a repository from the commits since its last analysis.
+
+Every analysis records the head commit it described (RepositoryAnalysis). The next
+incremental run compares that commit with the current head through the compare API. It
+then prompts the model with the previous findings plus the changed files' diffs, so the cost
+scales with the size of the change rather than the size of the repository. When the head
+has not moved, the stored result is returned without any model call. The caller falls back
+to a full analysis when there is no previous result or the change is too large.
+
+Configuration (environment):
+
+- AI_ASSIST_INCREMENTAL_MAX_FILES: changed code files above which a full analysis runs
+  instead (default 50)
+- AI_ASSIST_INCREMENTAL_MAX_FILE_CHARS: characters of diff (or new content) sent per changed
+  file (default 40000); longer diffs are cut off with a marker
+"""
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from ..models import RepositoryAnalysis
+from .model_calls import call_model
+from .prompt_budget import fit_items
+from .repo_analysis import read_blob
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalAnalyzer:
+    """
+    Updates a stored analysis with the changes since its commit, using an AIAssist instance's
+    model, limits and JSON helpers.
+    """
+
+    def __init__(self, assist):
+        self.assist = assist
+        self.max_changed_files = int(os.getenv("AI_ASSIST_INCREMENTAL_MAX_FILES", "50"))
+        self.max_file_chars = int(os.getenv("AI_ASSIST_INCREMENTAL_MAX_FILE_CHARS", "40000"))
+
+    def changed_files(self, repo, base: str, head: str) -> Optional[List[Dict]]:
+        """
+        Return the changed code files between `base` and `head` as dicts with path, status
+        and the diff (or the new content when GitHub omits the patch), or None when there
+        are more than AI_ASSIST_INCREMENTAL_MAX_FILES of them.
+        """
+        comparison = repo.compare(base, head)
+        files = [file for file in comparison.files if self.assist.is_code_file(file.filename)]
+        if len(files) > self.max_changed_files:
+            logger.info(f"{len(files)} changed files since {base[:7]}, over the incremental limit")
+            return None
+
+        changes = []
+        for file in files:
+            patch = file.patch
+            if patch and len(patch) > self.max_file_chars:
+                patch = f"{patch[:self.max_file_chars]}\n... (diff truncated)"
+            change = {"path": file.filename, "status": file.status, "patch": patch, "content": None}
+            if file.status != "removed" and not file.patch:
+                try:
+                    change["content"] = read_blob(repo, file.sha, self.assist.max_lines_per_file, self.max_file_chars)
+                except UnicodeDecodeError:
+                    continue
+            changes.append(change)
+        return changes
+
+    def create_prompt(self, repo_name: str, previous: Dict, changes: List[Dict], omitted: int = 0) -> str:
+        sections = []
+        for change in changes:
+            if change["status"] == "removed":
+                sections.append(f"### Removed: {change['path']}")
+            elif change["patch"]:
+                sections.append(f"### {change['status'].capitalize()}: {change['path']}\n```diff\n{change['patch']}\n```")
+            else:
+                sections.append(f"### {change['status'].capitalize()}: {change['path']}\n{change['content']}")
+        if omitted:
+            sections.append(f"... and {omitted} more changed files, omitted to fit the prompt budget")
+        changes_text = "\n\n".join(sections)
+        return f"""
+        You are an expert software engineer and repository analyzer. You analyzed the repository "{repo_name}" before; update that analysis for the changes made since.
+
+        **Previous Findings:**
+        {json.dumps(previous, indent=2)}
+
+        **Changes Since the Previous Analysis:**
+{changes_text}
+
+        **Instructions:**
+        1. Keep the previous tasks and refactors that still apply, and drop those the changes resolved.
+        2. Add tasks and refactors for problems the changes introduce.
+        3. Provide your response in the same structured JSON format with two keys:
+           - "tasks": A list of tasks with descriptions.
+           - "refactors": A list of suggested refactors with explanations.
+        """
+
+    def analyze(self, repo, repo_name: str, previous: RepositoryAnalysis, head: str) -> Optional[Dict]:
+        """
+        Return the updated analysis, or None when a full analysis is needed instead.
+        """
+        previous_result = {key: json.loads(previous.result).get(key, []) for key in ("tasks", "refactors")}
+        tracer = get_tracer()
+        with tracer.start_as_current_span("ai_assist.compare", attributes={"repo.base_sha": previous.commit_sha}) as span:
+            changes = self.changed_files(repo, previous.commit_sha, head)
+            span.set_attribute("repo.changed_files", -1 if changes is None else len(changes))
+        if changes is None:
+            return None
+        if not changes:
+            return previous_result
+
+        with tracer.start_as_current_span("ai_assist.create_prompt") as span:
+            prompt, estimate, kept = fit_items(
+                "ai_assist.incremental", changes,
+                lambda kept_changes, omitted: self.create_prompt(repo_name, previous_result, kept_changes, omitted),
+                self.assist.max_output_tokens, self.assist.model,
+            )
+            self.assist.set_prompt_attributes(span, prompt, estimate, len(changes) - kept)
+
+        response = call_model(
+            "ai_assist.incremental", self.assist.model.generate_content, prompt,
+            generation_config={"temperature": 0.2, "max_output_tokens": self.assist.max_output_tokens},
+        )
+        return json.loads(self.assist.sanitize_json_content(response.text))
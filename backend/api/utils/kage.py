@@ -2,19 +2,35 @@ import os
 import json
 import re
 import time
-import datetime
 import logging
-import sys
+import contextvars
+import difflib
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from django.db import connection
 from dotenv import load_dotenv
-from typing import Dict, List, Optional, Tuple
-from pydantic import BaseModel, Field, field_validator
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain.output_parsers import OutputFixingParser
-from langchain_core.prompts import PromptTemplate
-import vertexai
-from vertexai.generative_models import GenerativeModel, Part
-from langchain_google_vertexai import ChatVertexAI 
-from google.cloud import aiplatform
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+from pydantic import BaseModel, Field, ValidationError, field_validator
+from .model_calls import call_model_with_continuation, complete_json_prefix
+from .log_utils import get_request_logger
+from .artifact_store import get_artifact_store
+from .tracing import get_tracer
+from .clients import get_generative_model
+from .prompt_budget import PromptBudgetExceeded, enforce_budget, estimate_prompt
+from .context_cache import CONTEXT_CACHE_MODES, get_context_cache
+from .assignment import assign_tasks
+from .compact_plan import (
+    COMPACT_FORMAT_INSTRUCTIONS,
+    COMPACT_TAGGED_FORMAT_INSTRUCTIONS,
+    complete_line_prefix,
+    decode_compact_plan,
+    format_numbered_roster,
+)
+
+# The Vertex AI SDK is imported inside the methods that use it: it takes over a second
+# to import, which would otherwise be paid by every worker at boot.
+if TYPE_CHECKING:
+    from vertexai.generative_models import GenerativeModel
 
 load_dotenv()
 
@@ -36,6 +52,325 @@ class ProjectPlan(BaseModel):
             raise ValueError("The list of tasks cannot be empty.")
         return tasks_value
 
+class TaggedTask(BaseModel):
+    """A task tagged with the role it needs, assigned to a person locally (two-phase mode)."""
+    task_id: int = Field(description="A unique sequential identifier for the task.")
+    description: str = Field(description="A clear and concise description of the task, suitable for one person to work on.")
+    department: str = Field(description="The department whose expertise the task requires.")
+    level: str = Field(description="The experience level the task requires: Analyst, Consultant or Senior Consultant.")
+
+class TaggedProjectPlan(ProjectPlan):
+    """The project plan in two-phase mode: tasks with role tags instead of assignees."""
+    tasks: List[TaggedTask] = Field(description="A list of all the broken-down project tasks.")
+
+class Workstream(BaseModel):
+    """An independent area of work, planned by its own model call in workstream mode."""
+    name: str = Field(description="A short name for the workstream.")
+    description: str = Field(description="One sentence describing the scope of the workstream.")
+
+class WorkstreamList(BaseModel):
+    """The workstreams a project is split into."""
+    workstreams: List[Workstream] = Field(description="The workstreams, together covering the whole project.")
+
+class PlanDelta(BaseModel):
+    """The changes to an existing plan after its project description or team changed."""
+    added: List[Task] = Field(default_factory=list, description="New tasks the changes require; their task_id is ignored.")
+    modified: List[Task] = Field(default_factory=list, description="Existing tasks, by their task_id, whose description or assignee changes.")
+    removed: List[int] = Field(default_factory=list, description="The task_id of each existing task that is no longer needed.")
+
+class TaggedPlanDelta(PlanDelta):
+    """The plan changes in two-phase mode: tasks with role tags instead of assignees."""
+    added: List[TaggedTask] = Field(default_factory=list, description="New tasks the changes require; their task_id is ignored.")
+    modified: List[TaggedTask] = Field(default_factory=list, description="Existing tasks, by their task_id, whose description or role changes.")
+
+
+def build_format_instructions(model: type[BaseModel]) -> str:
+    """
+    Render the JSON schema instructions for a Pydantic model, in the same shape LangChain's
+    PydanticOutputParser produced. Called once at import time rather than per request.
+    """
+    schema = {key: value for key, value in model.model_json_schema().items() if key not in ("title", "type")}
+    return (
+        "The output should be formatted as a JSON instance that conforms to the JSON schema below.\n\n"
+        'As an example, for the schema {"properties": {"foo": {"title": "Foo", "description": "a list of strings", '
+        '"type": "array", "items": {"type": "string"}}}, "required": ["foo"]}\n'
+        'the object {"foo": ["bar", "baz"]} is a well-formatted instance of the schema. '
+        'The object {"properties": {"foo": ["bar", "baz"]}} is not well-formatted.\n\n'
+        f"Here is the output schema:\n```\n{json.dumps(schema, ensure_ascii=False)}\n```"
+    )
+
+
+# Keys of the OpenAPI schema subset Gemini accepts as `response_schema`
+RESPONSE_SCHEMA_KEYS = {"type", "description", "properties", "required", "items", "enum", "format", "nullable"}
+
+
+def build_response_schema(model: type[BaseModel]) -> Dict:
+    """
+    Convert a Pydantic model's JSON schema into a Gemini `response_schema`:
+    $ref/$defs are inlined and keys Gemini rejects (such as "title") are dropped.
+    """
+    schema = model.model_json_schema()
+    definitions = schema.get("$defs", {})
+
+    def resolve(node: Dict) -> Dict:
+        if "$ref" in node:
+            node = definitions[node["$ref"].split("/")[-1]]
+        resolved = {}
+        for key, value in node.items():
+            if key not in RESPONSE_SCHEMA_KEYS:
+                continue
+            if key == "properties":
+                value = {name: resolve(prop) for name, prop in value.items()}
+            elif key == "items":
+                value = resolve(value)
+            resolved[key] = value
+        return resolved
+
+    return resolve(schema)
+
+
+PROJECT_PLAN_FORMAT_INSTRUCTIONS = build_format_instructions(ProjectPlan)
+PROJECT_PLAN_RESPONSE_SCHEMA = build_response_schema(ProjectPlan)
+TAGGED_PLAN_FORMAT_INSTRUCTIONS = build_format_instructions(TaggedProjectPlan)
+TAGGED_PLAN_RESPONSE_SCHEMA = build_response_schema(TaggedProjectPlan)
+WORKSTREAMS_FORMAT_INSTRUCTIONS = build_format_instructions(WorkstreamList)
+WORKSTREAMS_RESPONSE_SCHEMA = build_response_schema(WorkstreamList)
+PLAN_DELTA_FORMAT_INSTRUCTIONS = build_format_instructions(PlanDelta)
+PLAN_DELTA_RESPONSE_SCHEMA = build_response_schema(PlanDelta)
+TAGGED_PLAN_DELTA_FORMAT_INSTRUCTIONS = build_format_instructions(TaggedPlanDelta)
+TAGGED_PLAN_DELTA_RESPONSE_SCHEMA = build_response_schema(TaggedPlanDelta)
+
+# In JSON mode the schema is sent as `response_schema`, so the prompt only needs a reminder
+STRUCTURED_FORMAT_INSTRUCTIONS = (
+    "The response schema is enforced by the API. Reply with a single JSON object whose `tasks` array "
+    "holds objects with `task_id`, `description` and `employee_name`."
+)
+STRUCTURED_TAGGED_FORMAT_INSTRUCTIONS = (
+    "The response schema is enforced by the API. Reply with a single JSON object whose `tasks` array "
+    "holds objects with `task_id`, `description`, `department` and `level`."
+)
+
+# KAGE_ASSIGNMENT modes: the model assigns people, or only tags tasks and assign_tasks does it
+ASSIGNMENT_MODES = ("model", "local")
+
+# KAGE_PLAN_FORMAT values: the ProjectPlan JSON, or one pipe-separated record per task (compact_plan)
+PLAN_FORMATS = ("json", "compact")
+
+EXPERIENCE_DEFINITIONS = """
+**Experience Level Guidelines (Based on Company Structure):**
+
+*   **Analyst (Typically 0-2 years company experience):**
+    *   Focus: Primarily executes specific, assigned tasks within their department.
+    *   Oversight: Requires guidance and reports to the most senior role from their *same department* who is assigned to the project. This senior role must be *at least* a Senior Consultant level.
+
+*   **Consultant (Typically 2-5 years company experience):**
+    *   Focus: A more experienced Analyst, expected to execute assigned tasks with higher proficiency and potentially less direct supervision than an Analyst. Still primarily focused on execution within their department.
+    *   Oversight: Also reports to the most senior role from their same department (Senior Consultant or higher) for guidance and review. *Potentially could take on oversight if senior role is absent and capability/willingness is confirmed.
+
+*   **Senior Consultant (Typically 3+ years company experience):**
+    *   Focus: Works on combining the input of the lower experience levels into a professional clean "final product". **Does not work on their own tasks**, they merely help put everything together.
+    *   Oversight Role: **Provides guidance and oversight** for Analysts and Consultants within their *same department* on the project. This is the minimum level required for this departmental oversight function.
+    *   Contribution: Expected to deliver high-quality work and potentially lead specific technical areas or workstreams within their department's scope.
+
+*   **Senior Oversight / Lead Role (Often a Senior Consultant or Manager):**
+    *   Focus: This function (which might be fulfilled by the most senior person present, e.g., a lead Senior Consultant) is responsible for compiling and integrating the work produced by their department members on the project.
+    *   Responsibility: Ensures the department's output is neat, concise, consistent, and meets quality standards before being considered "final" for integration with other project parts. May involve reviewing work, coordinating tasks within the department, and potentially managing the departmental workload for the project.
+
+*(Use these specific guidelines to interpret roles, assign tasks, and identify missing roles/oversight.)*
+"""
+
+# Used instead of the full guidelines when a prompt would exceed the kage.generate token budget
+CONDENSED_EXPERIENCE_DEFINITIONS = """
+**Experience Levels:**
+*   Analyst / Consultant: execute assigned tasks; report to the most senior Senior Consultant+ of their department.
+*   Senior Consultant: no own tasks; integrates and reviews the work of their department's Analysts and Consultants.
+*   Manager / lead: compiles the department's output and ensures its quality before integration.
+"""
+
+# The prompt is split into a static prefix, identical for every request with the same output
+# mode, and the per-request part, so the prefix can be cached (see context_cache)
+KAGE_PROMPT_PREFIX_TEMPLATE = """
+You are KAGE, an expert project management assistant. Your goal is to create a structured project plan for the **Project Description** and **Available Team Roles** given after these instructions.
+
+{experience_definitions}
+
+**Instructions - Follow these steps SEQUENTIALLY:**
+
+1.  **Decompose Project into Tasks (Team Independent):**
+    *   Analyze the **Project Description** *only*.
+    *   Break down the project into a list of concise, actionable tasks. Each task should represent a logical chunk of work ideally manageable by a single person.
+    *   **Do NOT consider the 'Available Team Roles' during this decomposition step.** Focus solely on the work required by the project itself.
+    *   Assign a unique sequential 'task_id' starting from 1 to each decomposed task.
+
+{assignment_step}
+
+3.  **Output Format:** Structure your entire response strictly as a JSON object conforming to the following schema. Do **not** include any text outside the JSON structure.
+
+**Output JSON Schema:**
+{format_instructions}
+"""
+
+ASSIGNMENT_STEP = """2.  **Assign Decomposed Tasks to Available Roles:**
+    *   Now, take the list of tasks created in Step 1.
+    *   For *each* task, attempt to assign it to the *most suitable* team member profile from the 'Available Team Roles' list.
+    *   Use the exact Name, Level, and Department strings from the 'Available Team Roles' when assigning.
+    *   Assign a temporary employee ID (`employee_temp_id`) to each team member and include it in the task assignment.
+    *   Assign a temporary project ID (`project_temp_id`) to all tasks."""
+
+TAGGING_STEP = """2.  **Tag Decomposed Tasks with the Role They Require:**
+    *   Now, take the list of tasks created in Step 1.
+    *   For *each* task, set `department` to the Department string from the 'Available Team Roles' whose expertise the task needs, and `level` to the experience level it requires (Analyst, Consultant or Senior Consultant), following the experience guidelines.
+    *   Add Senior Consultant level integration and review tasks for each department whose members' work must be combined.
+    *   Do **not** assign tasks to people; team members are assigned after the plan is generated."""
+
+KAGE_PROMPT_REQUEST_TEMPLATE = """
+**Project Description:**
+{project_description}
+
+**Available Team Roles (Name, Level, Department):**
+{team_roles}
+
+Generate the project plan now.
+"""
+
+# Workstream mode: the request part of the plan prompt for one workstream
+KAGE_WORKSTREAM_REQUEST_TEMPLATE = """
+**Project Description:**
+{project_description}
+
+**Available Team Roles (Name, Level, Department):**
+{team_roles}
+
+**Workstream:** {workstream_name}: {workstream_description}
+The project is split into these workstreams, each planned separately: {workstream_names}.
+
+Generate the tasks of the "{workstream_name}" workstream only.
+"""
+
+KAGE_WORKSTREAMS_PROMPT_TEMPLATE = """
+You are KAGE, an expert project management assistant. Split the project below into at most {max_workstreams} workstreams: independent areas of work (for example backend, frontend or cloud deployment) that can be planned separately. Give each a short name and a one-sentence description of its scope. Together the workstreams must cover the whole project without overlapping.
+
+**Project Description:**
+{project_description}
+
+**Available Team Roles (Name, Level, Department):**
+{team_roles}
+
+**Output Format:** Structure your entire response strictly as a JSON object conforming to the following schema. Do **not** include any text outside the JSON structure.
+{format_instructions}
+"""
+
+# Re-planning: only the changes to an existing plan are requested, not the whole plan
+KAGE_REPLAN_PROMPT_TEMPLATE = """
+You are KAGE, an expert project management assistant. The **Current Tasks** below are the plan made for an earlier version of the project. Update the plan for the **Changes Since the Plan Was Made** without regenerating it: reply only with the tasks to add, the existing tasks to modify and the existing tasks to remove.
+
+{experience_definitions}
+
+**Project Description:**
+{project_description}
+
+**Changes Since the Plan Was Made:**
+{changes}
+
+**Available Team Roles (Name, Level, Department):**
+{team_roles}
+
+**Current Tasks ([task_id] description (assignee, status)):**
+{tasks}
+
+**Instructions:**
+1.  Do **not** list tasks that still apply unchanged.
+2.  {assignment_instruction}
+3.  Never modify or remove tasks whose status is "done".
+4.  **Output Format:** Structure your entire response strictly as a JSON object conforming to the following schema. Do **not** include any text outside the JSON structure.
+{format_instructions}
+"""
+
+REPLAN_ASSIGNMENT_INSTRUCTION = (
+    "Assign added tasks, and reassign the tasks of removed team members, to the most suitable member of the "
+    "'Available Team Roles', using their exact Name."
+)
+REPLAN_TAGGING_INSTRUCTION = (
+    "Tag added and modified tasks with the `department` (a Department string from the 'Available Team Roles') and "
+    "`level` (Analyst, Consultant or Senior Consultant) they require; people are assigned after the update."
+)
+
+KAGE_PROMPT_TEMPLATE = KAGE_PROMPT_PREFIX_TEMPLATE + KAGE_PROMPT_REQUEST_TEMPLATE
+
+
+def format_team_roles(team_roles: List[Dict[str, str]]) -> str:
+    formatted_roles = "\n".join(
+        [f"- {role['name']} (Level: {role['level']}, Department: {role['department']})" for role in team_roles]
+    )
+    return formatted_roles or "No team roles provided."
+
+
+def describe_plan_changes(previous_description: Optional[str], project_description: str,
+                          previous_team_roles: List[Dict[str, str]], team_roles: List[Dict[str, str]]) -> str:
+    """
+    The description diff and team changes a re-plan prompt lists.
+    """
+    changes = []
+    if (previous_description or "").strip() != project_description.strip():
+        diff = "\n".join(difflib.unified_diff(
+            (previous_description or "").strip().splitlines(), project_description.strip().splitlines(),
+            "previous", "current", n=1, lineterm="",
+        ))
+        changes.append(f"The project description changed:\n```diff\n{diff}\n```")
+
+    def key(role):
+        return role["name"], role["level"], role["department"]
+
+    previous_keys = {key(role) for role in previous_team_roles}
+    current_keys = {key(role) for role in team_roles}
+    added = [role for role in team_roles if key(role) not in previous_keys]
+    removed = [role for role in previous_team_roles if key(role) not in current_keys]
+    if added:
+        changes.append("Team members added: " + ", ".join(f"{role['name']} ({role['level']}, {role['department']})" for role in added))
+    if removed:
+        changes.append("Team members removed, no longer available: " + ", ".join(role["name"] for role in removed))
+    return "\n".join(changes) or "None."
+
+
+def apply_plan_delta(tasks: List[Dict], delta: Dict) -> List[Dict]:
+    """
+    Apply a generate_plan_delta result to plan tasks (dicts with task_id), returning the new
+    task list with added tasks numbered after the last task_id.
+    """
+    removed = set(delta["removed"])
+    modified = {change["task_id"]: change for change in delta["modified"]}
+    updated = [
+        {**task, **{key: value for key, value in modified.get(task["task_id"], {}).items() if value is not None}}
+        for task in tasks if task["task_id"] not in removed
+    ]
+    next_id = max((task["task_id"] for task in tasks), default=0) + 1
+    for offset, change in enumerate(delta["added"]):
+        updated.append({**change, "task_id": next_id + offset, "status": "to-do"})
+    return updated
+
+
+def extract_json(response_content: str) -> str:
+    """
+    Strip Markdown fences and any prose around the outermost JSON object of a reply.
+    """
+    cleaned_response = re.sub(r'^```json\s*', '', response_content.strip(), flags=re.IGNORECASE)
+    cleaned_response = re.sub(r'\s*```$', '', cleaned_response)
+
+    match = re.search(r'\{.*\}', cleaned_response, re.DOTALL)
+    return match.group(0) if match else cleaned_response
+
+
+@lru_cache(maxsize=8)
+def render_prompt_prefix(experience_definitions: str, format_instructions: str, assignment_step: str = ASSIGNMENT_STEP) -> str:
+    """
+    Render the static prompt prefix once per guideline / output / assignment mode combination.
+    """
+    return KAGE_PROMPT_PREFIX_TEMPLATE.format(
+        experience_definitions=experience_definitions,
+        format_instructions=format_instructions,
+        assignment_step=assignment_step,
+    )
+
 class Kage:
     def __init__(self):
         # Dynamically set the service account for Kage
@@ -46,181 +381,440 @@ class Kage:
         self.GCP_LOCATION = os.getenv("KAGE_GCP_LOCATION", "us-central1")
         self.VERTEX_MODEL_NAME = os.getenv("KAGE_VERTEX_MODEL_NAME", "gemini-1.5-flash-001")
 
+        # JSON mode: Gemini enforces the ProjectPlan schema, so the reply is valid JSON without fences
+        # or surrounding prose and needs fewer output tokens
+        self.STRUCTURED_OUTPUT = os.getenv("KAGE_STRUCTURED_OUTPUT", "false").lower() in ("1", "true", "yes")
+        self.MAX_OUTPUT_TOKENS = int(os.getenv("KAGE_MAX_OUTPUT_TOKENS", "3072" if self.STRUCTURED_OUTPUT else "4096"))
+
+        # Static prompt prefix caching: "vertex" (cached content), "local" (system instruction only,
+        # still billed on every call) or "off" (default)
+        self.CONTEXT_CACHE = os.getenv("KAGE_CONTEXT_CACHE", "off").lower()
+        if self.CONTEXT_CACHE not in CONTEXT_CACHE_MODES:
+            raise ValueError(f"KAGE_CONTEXT_CACHE must be one of {', '.join(CONTEXT_CACHE_MODES)}.")
+        self.CONTEXT_CACHE_TTL = int(os.getenv("KAGE_CONTEXT_CACHE_TTL", "3600"))
+        self.prompt_prefix = ""
+
+        # Two-phase mode ("local"): the model only tags tasks with a department and level, and
+        # people are assigned by the local min-cost assignment (see assignment.py)
+        self.ASSIGNMENT = os.getenv("KAGE_ASSIGNMENT", "model").lower()
+        if self.ASSIGNMENT not in ASSIGNMENT_MODES:
+            raise ValueError(f"KAGE_ASSIGNMENT must be one of {', '.join(ASSIGNMENT_MODES)}.")
+        self.plan_model = TaggedProjectPlan if self.ASSIGNMENT == "local" else ProjectPlan
+
+        # Compact output: the roster is numbered and tasks come back as short records decoded
+        # locally, for fewer output tokens; takes precedence over KAGE_STRUCTURED_OUTPUT
+        self.PLAN_FORMAT = os.getenv("KAGE_PLAN_FORMAT", "json").lower()
+        if self.PLAN_FORMAT not in PLAN_FORMATS:
+            raise ValueError(f"KAGE_PLAN_FORMAT must be one of {', '.join(PLAN_FORMATS)}.")
+
+        # Workstream mode: one short call lists the workstreams, then each workstream's tasks are
+        # generated by parallel calls, so large plans are not cut off by the output token limit
+        self.WORKSTREAMS = os.getenv("KAGE_WORKSTREAMS", "false").lower() in ("1", "true", "yes")
+        self.MAX_WORKSTREAMS = max(1, int(os.getenv("KAGE_MAX_WORKSTREAMS", "6")))
+        self.WORKSTREAM_CONCURRENCY = max(1, int(os.getenv("KAGE_WORKSTREAM_CONCURRENCY", "4")))
+
         if not self.GCP_PROJECT_ID:
             raise ValueError("GCP Project ID not found. Please set KAGE_GCP_PROJECT_ID in your .env file or environment.")
 
-    def setup_logging(self, project_name: str) -> Tuple[logging.Logger, str]:
-        try:
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            logs_dir = "logs"
-            os.makedirs(logs_dir, exist_ok=True)
-
-            log_filepath = os.path.join(logs_dir, f"kage_plan_{project_name}_{timestamp}.log")
-
-            logger = logging.getLogger("kage_project_planner")
-            logger.setLevel(logging.INFO)
-
-            if logger.handlers:
-                logger.handlers = []
-
-            file_handler = logging.FileHandler(log_filepath)
-            file_handler.setLevel(logging.INFO)
-            console_handler = logging.StreamHandler(sys.stdout)
-            console_handler.setLevel(logging.INFO)
-
-            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-            file_handler.setFormatter(formatter)
-            console_handler.setFormatter(formatter)
-
-            logger.addHandler(file_handler)
-            logger.addHandler(console_handler)
-
-            return logger, log_filepath
-
-        except Exception as e:
-            print(f"Error setting up logging: {e}")
-            logger = logging.getLogger("kage_project_planner")
-            logger.setLevel(logging.INFO)
-            return logger, "kage_project_planner.log"
+    def setup_logging(self, project_name: str) -> Tuple[logging.LoggerAdapter, str]:
+        """
+        Return the planner logger tagged with the current request id. Handlers are set up once
+        per process (see log_utils), so concurrent plan requests no longer replace each other's
+        handlers or create a log file per request.
+        """
+        logger = get_request_logger("kage_project_planner")
+        return logger, logger.extra["request_id"]
 
-    def initialize_vertex_client(self, logger: logging.Logger) -> GenerativeModel:
+    def initialize_vertex_client(self, logger: logging.Logger) -> "GenerativeModel":
         try:
             logger.info(f"Initializing Vertex AI client for project '{self.GCP_PROJECT_ID}' in location '{self.GCP_LOCATION}'")
-            vertexai.init(project=self.GCP_PROJECT_ID, location=self.GCP_LOCATION)
-            model = GenerativeModel(self.VERTEX_MODEL_NAME)
+            model = get_generative_model(self.VERTEX_MODEL_NAME, self.GCP_PROJECT_ID, self.GCP_LOCATION)
             logger.info(f"Vertex AI client initialized successfully with model '{self.VERTEX_MODEL_NAME}'.")
             return model
         except Exception as e:
             logger.error(f"Failed to initialize Vertex AI client: {e}")
             raise
 
-    def create_kage_prompt(self, project_description: str, team_roles: List[Dict[str, str]], logger: logging.Logger) -> str:
+    def create_kage_prompt(self, project_description: str, team_roles: List[Dict[str, str]], logger: logging.Logger,
+                           model: Optional["GenerativeModel"] = None, workstream: Optional[Workstream] = None,
+                           workstreams: Sequence[Workstream] = ()) -> str:
+        """
+        Render the plan prompt, for the whole project or only `workstream` out of `workstreams`,
+        and check it against the kage.generate token budget, switching to the condensed
+        experience guidelines when the full ones do not fit. Raises PromptBudgetExceeded if
+        even the condensed prompt is over budget.
+        """
         logger.info("Creating KAGE project plan prompt")
         logger.info(team_roles)
 
-        parser = PydanticOutputParser(pydantic_object=ProjectPlan)
-
-        # Format team_roles as a list of strings
-        formatted_roles = "\n".join(
-            [f"- {role['name']} (Level: {role['level']}, Department: {role['department']})" for role in team_roles]
-        )
-        if not formatted_roles:
-            formatted_roles = "No team roles provided."
-
-        experience_definitions = """
-        **Experience Level Guidelines (Based on Company Structure):**
-
-        *   **Analyst (Typically 0-2 years company experience):**
-            *   Focus: Primarily executes specific, assigned tasks within their department.
-            *   Oversight: Requires guidance and reports to the most senior role from their *same department* who is assigned to the project. This senior role must be *at least* a Senior Consultant level.
-
-        *   **Consultant (Typically 2-5 years company experience):**
-            *   Focus: A more experienced Analyst, expected to execute assigned tasks with higher proficiency and potentially less direct supervision than an Analyst. Still primarily focused on execution within their department.
-            *   Oversight: Also reports to the most senior role from their same department (Senior Consultant or higher) for guidance and review. *Potentially could take on oversight if senior role is absent and capability/willingness is confirmed.
-
-        *   **Senior Consultant (Typically 3+ years company experience):**
-            *   Focus: Works on combining the input of the lower experience levels into a professional clean "final product". **Does not work on their own tasks**, they merely help put everything together.
-            *   Oversight Role: **Provides guidance and oversight** for Analysts and Consultants within their *same department* on the project. This is the minimum level required for this departmental oversight function.
-            *   Contribution: Expected to deliver high-quality work and potentially lead specific technical areas or workstreams within their department's scope.
-
-        *   **Senior Oversight / Lead Role (Often a Senior Consultant or Manager):**
-            *   Focus: This function (which might be fulfilled by the most senior person present, e.g., a lead Senior Consultant) is responsible for compiling and integrating the work produced by their department members on the project.
-            *   Responsibility: Ensures the department's output is neat, concise, consistent, and meets quality standards before being considered "final" for integration with other project parts. May involve reviewing work, coordinating tasks within the department, and potentially managing the departmental workload for the project.
+        roster = format_numbered_roster(team_roles) if self.PLAN_FORMAT == "compact" else format_team_roles(team_roles)
+        if workstream is not None:
+            request_part = KAGE_WORKSTREAM_REQUEST_TEMPLATE.format(
+                project_description=project_description,
+                team_roles=roster,
+                workstream_name=workstream.name,
+                workstream_description=workstream.description,
+                workstream_names=", ".join(other.name for other in workstreams),
+            )
+        else:
+            request_part = KAGE_PROMPT_REQUEST_TEMPLATE.format(
+                project_description=project_description,
+                team_roles=roster,
+            )
+        if self.ASSIGNMENT == "local":
+            format_instructions = STRUCTURED_TAGGED_FORMAT_INSTRUCTIONS if self.STRUCTURED_OUTPUT else TAGGED_PLAN_FORMAT_INSTRUCTIONS
+            if self.PLAN_FORMAT == "compact":
+                format_instructions = COMPACT_TAGGED_FORMAT_INSTRUCTIONS
+            assignment_step = TAGGING_STEP
+        else:
+            format_instructions = STRUCTURED_FORMAT_INSTRUCTIONS if self.STRUCTURED_OUTPUT else PROJECT_PLAN_FORMAT_INSTRUCTIONS
+            if self.PLAN_FORMAT == "compact":
+                format_instructions = COMPACT_FORMAT_INSTRUCTIONS
+            assignment_step = ASSIGNMENT_STEP
+
+        self.prompt_prefix = render_prompt_prefix(EXPERIENCE_DEFINITIONS, format_instructions, assignment_step)
+        formatted_prompt = self.prompt_prefix + request_part
+        estimate = estimate_prompt("kage.generate", formatted_prompt, self.MAX_OUTPUT_TOKENS, model)
+        if not estimate.within_budget:
+            logger.warning(f"Prompt over budget ({estimate}), using the condensed experience guidelines.")
+            self.prompt_prefix = render_prompt_prefix(CONDENSED_EXPERIENCE_DEFINITIONS, format_instructions, assignment_step)
+            formatted_prompt = self.prompt_prefix + request_part
+        self.prompt_estimate = enforce_budget("kage.generate", formatted_prompt, self.MAX_OUTPUT_TOKENS, model)
+
+        logger.info(f"KAGE project plan prompt created successfully ({self.prompt_estimate}).")
+        return formatted_prompt
 
-        *(Use these specific guidelines to interpret roles, assign tasks, and identify missing roles/oversight.)*
+    def apply_context_cache(self, model: "GenerativeModel", prompt: str, logger: logging.Logger) -> Tuple["GenerativeModel", str]:
         """
-
-        prompt_template = PromptTemplate(
-            template="""
-            You are KAGE, an expert project management assistant. Your goal is to create a structured project plan.
-
-            **Project Description:**
-            {project_description}
-
-            {experience_definitions}
-
-            **Available Team Roles (Name, Level, Department):**
-            {team_roles}
-
-            **Instructions - Follow these steps SEQUENTIALLY:**
-
-            1.  **Decompose Project into Tasks (Team Independent):**
-                *   Analyze the **Project Description** *only*.
-                *   Break down the project into a list of concise, actionable tasks. Each task should represent a logical chunk of work ideally manageable by a single person.
-                *   **Do NOT consider the 'Available Team Roles' during this decomposition step.** Focus solely on the work required by the project itself.
-                *   Assign a unique sequential 'task_id' starting from 1 to each decomposed task.
-
-            2.  **Assign Decomposed Tasks to Available Roles:**
-                *   Now, take the list of tasks created in Step 1.
-                *   For *each* task, attempt to assign it to the *most suitable* team member profile from the 'Available Team Roles' list.
-                *   Use the exact Name, Level, and Department strings from the 'Available Team Roles' when assigning.
-                *   Assign a temporary employee ID (`employee_temp_id`) to each team member and include it in the task assignment.
-                *   Assign a temporary project ID (`project_temp_id`) to all tasks.
-
-            3.  **Output Format:** Structure your entire response strictly as a JSON object conforming to the following schema. Do **not** include any text outside the JSON structure.
-
-            **Output JSON Schema:**
-            {format_instructions}
-            Generate the project plan now.
-            """,
-            input_variables=["project_description", "team_roles"],
-            partial_variables={
-                "format_instructions": parser.get_format_instructions(),
-                "experience_definitions": experience_definitions
-            }
-        )
-
-        formatted_prompt = prompt_template.format(
-            project_description=project_description,
-            team_roles=formatted_roles
+        Move the static prefix of `prompt` into a cached system instruction. Returns the model
+        bound to the cached prefix and the per-request remainder of the prompt.
+        """
+        if self.CONTEXT_CACHE == "off" or not self.prompt_prefix or not prompt.startswith(self.prompt_prefix):
+            return model, prompt
+
+        cached_model, mode = get_context_cache().get_model(
+            self.VERTEX_MODEL_NAME,
+            self.GCP_PROJECT_ID,
+            self.GCP_LOCATION,
+            self.prompt_prefix.strip(),
+            mode=self.CONTEXT_CACHE,
+            ttl=self.CONTEXT_CACHE_TTL,
         )
+        logger.info(f"Using {mode} context cache for the static prompt prefix.")
+        return cached_model, prompt[len(self.prompt_prefix):]
 
-        logger.info("KAGE project plan prompt created successfully.")
-        return formatted_prompt
-
-    def generate_kage_response(self, model: GenerativeModel, prompt: str, logger: logging.Logger) -> str:
+    def generate_kage_response(self, model: "GenerativeModel", prompt: str, logger: logging.Logger,
+                               endpoint: str = "kage.generate", max_output_tokens: Optional[int] = None,
+                               response_schema: Optional[Dict] = None) -> str:
         logger.info(f"Generating KAGE project plan response with model {model._model_name}")
         try:
             generation_config = {
                 "temperature": 0.2,
-                "max_output_tokens": 4096,
+                "max_output_tokens": max_output_tokens or self.MAX_OUTPUT_TOKENS,
             }
-
-            response = model.generate_content(prompt, generation_config=generation_config)
+            compact = self.PLAN_FORMAT == "compact" and endpoint == "kage.generate"
+            if self.STRUCTURED_OUTPUT and not compact:
+                from vertexai.generative_models import GenerationConfig
+
+                if response_schema is None:
+                    response_schema = TAGGED_PLAN_RESPONSE_SCHEMA if self.ASSIGNMENT == "local" else PROJECT_PLAN_RESPONSE_SCHEMA
+                generation_config = GenerationConfig(
+                    **generation_config,
+                    response_mime_type="application/json",
+                    response_schema=response_schema,
+                )
+
+            # A plan cut off by the output token limit is continued rather than thrown away
+            response_content = call_model_with_continuation(
+                endpoint, model, prompt, generation_config, complete_prefix=complete_line_prefix if compact else complete_json_prefix,
+            )
             logger.info("Successfully received response from Vertex AI API.")
-            logger.info(response);
-
-            if hasattr(response, 'text'):
-                return response.text
-            elif response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
-                return response.candidates[0].content.parts[0].text
-            else:
-                logger.error("Could not extract text from Vertex AI response structure.")
-                raise ValueError("Unable to extract text content from Vertex AI response.")
+            logger.debug("Raw Vertex AI response: %s", response_content)
+            return response_content
         except Exception as e:
             logger.error(f"Error generating KAGE response from Vertex AI: {str(e)}")
             raise
 
-    def parse_kage_response(self, response_content: str, logger: logging.Logger) -> ProjectPlan:
+    def parse_kage_response(self, response_content: str, logger: logging.Logger,
+                            team_roles: Sequence[Dict[str, str]] = ()) -> ProjectPlan:
         logger.info("Parsing KAGE project plan response")
-        parser = PydanticOutputParser(pydantic_object=ProjectPlan)
 
-        try:
-            cleaned_response = re.sub(r'^```json\s*', '', response_content.strip(), flags=re.IGNORECASE)
-            cleaned_response = re.sub(r'\s*```$', '', cleaned_response)
-
-            match = re.search(r'\{.*\}', cleaned_response, re.DOTALL)
-            json_str = match.group(0) if match else cleaned_response
+        if self.PLAN_FORMAT == "compact":
+            # Member numbers in the records refer to `team_roles`, in the order they were prompted
+            try:
+                decoded = decode_compact_plan(response_content, list(team_roles), tagged=self.ASSIGNMENT == "local")
+                parsed_plan = self.plan_model.model_validate(decoded)
+                logger.info(f"Successfully parsed compact KAGE plan with {len(parsed_plan.tasks)} tasks.")
+                return parsed_plan
+            except ValidationError as e:
+                logger.error(f"Failed to parse the compact model response: {e}")
+                raise ValueError(f"Failed to parse the compact model response into ProjectPlan structure. Error: {e}")
+
+        if self.STRUCTURED_OUTPUT:
+            # JSON mode replies are bare JSON, so a single validation pass is enough
+            try:
+                parsed_plan = self.plan_model.model_validate_json(response_content)
+                logger.info(f"Successfully parsed KAGE plan with {len(parsed_plan.tasks)} tasks.")
+                return parsed_plan
+            except ValidationError as e:
+                logger.warning(f"Structured response failed validation, falling back to lenient parsing: {e}")
 
-            parsed_plan = parser.parse(json_str)
+        try:
+            parsed_plan = self.plan_model.model_validate_json(extract_json(response_content))
             logger.info(f"Successfully parsed KAGE plan with {len(parsed_plan.tasks)} tasks.")
             return parsed_plan
         except Exception as e:
             logger.error(f"Failed to parse the model response: {e}")
             raise ValueError(f"Failed to parse the model response into ProjectPlan structure. Error: {e}")
 
+    def generate_plan_tasks(self, model: "GenerativeModel", project_description: str, team_roles: List[Dict[str, str]],
+                            logger: logging.Logger) -> List:
+        """
+        Generate the whole plan with a single model call.
+        """
+        tracer = get_tracer()
+        with tracer.start_as_current_span("kage.create_prompt") as span:
+            prompt = self.create_kage_prompt(project_description, team_roles, logger, model)
+            span.set_attributes({
+                "prompt.chars": len(prompt),
+                "prompt.estimated_tokens": self.prompt_estimate.input_tokens,
+                "prompt.estimated_cost_usd": self.prompt_estimate.cost_usd,
+            })
+        with tracer.start_as_current_span("kage.context_cache") as span:
+            model, prompt = self.apply_context_cache(model, prompt, logger)
+            span.set_attributes({"context_cache.mode": self.CONTEXT_CACHE, "prompt.request_chars": len(prompt)})
+        response_content = self.generate_kage_response(model, prompt, logger)
+        with tracer.start_as_current_span("kage.parse_response") as span:
+            project_plan_obj = self.parse_kage_response(response_content, logger, team_roles)
+            span.set_attribute("plan.tasks", len(project_plan_obj.tasks))
+        return project_plan_obj.tasks
+
+    def generate_workstreams(self, model: "GenerativeModel", project_description: str, team_roles: List[Dict[str, str]],
+                             logger: logging.Logger) -> List[Workstream]:
+        """
+        Ask the model for the project's workstreams (a short reply), at most MAX_WORKSTREAMS.
+        """
+        format_instructions = (
+            "Reply with a single JSON object whose `workstreams` array holds objects with `name` and `description`."
+            if self.STRUCTURED_OUTPUT else WORKSTREAMS_FORMAT_INSTRUCTIONS
+        )
+        prompt = KAGE_WORKSTREAMS_PROMPT_TEMPLATE.format(
+            max_workstreams=self.MAX_WORKSTREAMS,
+            project_description=project_description,
+            team_roles=format_team_roles(team_roles),
+            format_instructions=format_instructions,
+        )
+        enforce_budget("kage.workstreams", prompt, 1024, model)
+        response_content = self.generate_kage_response(
+            model, prompt, logger, endpoint="kage.workstreams", max_output_tokens=1024,
+            response_schema=WORKSTREAMS_RESPONSE_SCHEMA,
+        )
+        try:
+            workstreams = WorkstreamList.model_validate_json(extract_json(response_content)).workstreams
+        except ValidationError as e:
+            raise ValueError(f"Failed to parse the workstream list. Error: {e}")
+        if not workstreams:
+            raise ValueError("The model returned no workstreams.")
+        logger.info(f"Split the project into {len(workstreams)} workstreams: {', '.join(w.name for w in workstreams)}")
+        return workstreams[:self.MAX_WORKSTREAMS]
+
+    def generate_workstream_tasks(self, model: "GenerativeModel", prompt: str, workstream: Workstream,
+                                  team_roles: List[Dict[str, str]], logger: logging.Logger) -> List:
+        with get_tracer().start_as_current_span("kage.workstream", attributes={"workstream.name": workstream.name}) as span:
+            response_content = self.generate_kage_response(model, prompt, logger)
+            tasks = self.parse_kage_response(response_content, logger, team_roles).tasks
+            span.set_attribute("plan.tasks", len(tasks))
+            return tasks
+
+    def generate_plan_by_workstreams(self, model: "GenerativeModel", project_description: str,
+                                     team_roles: List[Dict[str, str]], logger: logging.Logger) -> Tuple[List, List[str]]:
+        """
+        Generate the plan one workstream per call, at most WORKSTREAM_CONCURRENCY calls at a
+        time, so the wall-clock time follows the largest workstream. Returns the merged tasks,
+        renumbered from 1 in workstream order, and the workstream name of each task.
+        """
+        tracer = get_tracer()
+        with tracer.start_as_current_span("kage.workstreams") as span:
+            workstreams = self.generate_workstreams(model, project_description, team_roles, logger)
+            span.set_attribute("plan.workstreams", len(workstreams))
+
+        # Prompts are built here rather than in the workers: create_kage_prompt sets the prefix
+        # that apply_context_cache moves into the cached system instruction
+        requests = []
+        with tracer.start_as_current_span("kage.create_prompt"):
+            for workstream in workstreams:
+                prompt = self.create_kage_prompt(project_description, team_roles, logger, model, workstream, workstreams)
+                requests.append(self.apply_context_cache(model, prompt, logger))
+
+        def run(request_model, prompt, workstream):
+            try:
+                return self.generate_workstream_tasks(request_model, prompt, workstream, team_roles, logger)
+            finally:
+                # Django only closes the request thread's connection; close the pool thread's own
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=min(self.WORKSTREAM_CONCURRENCY, len(requests))) as executor:
+            # Each call runs in a copy of the caller's context so its spans join the request trace
+            futures = [
+                executor.submit(contextvars.copy_context().run, run, request_model, prompt, workstream)
+                for (request_model, prompt), workstream in zip(requests, workstreams)
+            ]
+            results = [future.result() for future in futures]
+
+        tasks, names = [], []
+        for workstream, workstream_tasks in zip(workstreams, results):
+            for task in workstream_tasks:
+                tasks.append(task.model_copy(update={"task_id": len(tasks) + 1}))
+                names.append(workstream.name)
+        logger.info(f"Merged {len(tasks)} tasks from {len(workstreams)} workstreams.")
+        return tasks, names
+
+    def assign_plan(self, tasks: List[TaggedTask], team_roles: List[Dict[str, str]], logger: logging.Logger) -> List[Dict]:
+        """
+        Assign the tagged tasks of a two-phase plan to the team with the local optimizer.
+        """
+        tagged = [{"department": task.department, "level": task.level} for task in tasks]
+        assignment = assign_tasks(tagged, team_roles)
+        logger.info(f"Assigned {len(tasks)} tasks to {len(team_roles)} team members locally.")
+        return [
+            {
+                "task_id": task.task_id,
+                "description": task.description,
+                "employee_name": team_roles[member]["name"] if member is not None else None,
+                "department": task.department,
+                "level": task.level,
+                "status": "to-do",
+            }
+            for task, member in zip(tasks, assignment)
+        ]
+
+    def create_replan_prompt(self, project_description: str, tasks: List[Dict], team_roles: List[Dict[str, str]],
+                             previous_description: Optional[str], previous_team_roles: List[Dict[str, str]],
+                             logger: logging.Logger, model: Optional["GenerativeModel"] = None) -> str:
+        """
+        Render the re-plan prompt: the current tasks plus the description diff and team changes,
+        checked against the kage.replan token budget. Raises PromptBudgetExceeded if over budget.
+        """
+        if self.ASSIGNMENT == "local":
+            format_instructions, assignment_instruction = TAGGED_PLAN_DELTA_FORMAT_INSTRUCTIONS, REPLAN_TAGGING_INSTRUCTION
+        else:
+            format_instructions, assignment_instruction = PLAN_DELTA_FORMAT_INSTRUCTIONS, REPLAN_ASSIGNMENT_INSTRUCTION
+        if self.STRUCTURED_OUTPUT:
+            format_instructions = "Reply with a single JSON object with the `added`, `modified` and `removed` arrays."
+
+        task_lines = "\n".join(
+            f"- [{task['task_id']}] {task['description']} ({task.get('employee_name') or 'unassigned'}, {task.get('status') or 'to-do'})"
+            for task in tasks
+        )
+        prompt = KAGE_REPLAN_PROMPT_TEMPLATE.format(
+            experience_definitions=CONDENSED_EXPERIENCE_DEFINITIONS,
+            project_description=project_description,
+            changes=describe_plan_changes(previous_description, project_description, previous_team_roles, team_roles),
+            team_roles=format_team_roles(team_roles),
+            tasks=task_lines or "No tasks.",
+            assignment_instruction=assignment_instruction,
+            format_instructions=format_instructions,
+        )
+        self.prompt_estimate = enforce_budget("kage.replan", prompt, self.MAX_OUTPUT_TOKENS, model)
+        logger.info(f"KAGE re-plan prompt created successfully ({self.prompt_estimate}).")
+        return prompt
+
+    def parse_plan_delta(self, response_content: str, tasks: List[Dict], logger: logging.Logger) -> PlanDelta:
+        """
+        Parse the re-plan reply, dropping changes to unknown or done tasks. A task both
+        modified and removed is removed.
+        """
+        delta_model = TaggedPlanDelta if self.ASSIGNMENT == "local" else PlanDelta
+        try:
+            delta = delta_model.model_validate_json(extract_json(response_content))
+        except ValidationError as e:
+            logger.error(f"Failed to parse the re-plan response: {e}")
+            raise ValueError(f"Failed to parse the model response into PlanDelta structure. Error: {e}")
+
+        open_ids = {task["task_id"] for task in tasks if task.get("status") != "done"}
+        removed = sorted({task_id for task_id in delta.removed if task_id in open_ids})
+        modified = {task.task_id: task for task in delta.modified if task.task_id in open_ids and task.task_id not in removed}
+        ignored = len(delta.removed) - len(removed) + len(delta.modified) - len(modified)
+        if ignored:
+            logger.warning(f"Ignored {ignored} changes to unknown or done tasks.")
+        return delta.model_copy(update={"modified": list(modified.values()), "removed": removed})
+
+    def generate_plan_delta(self, project_name: str, project_description: str, tasks: List[Dict],
+                            team_roles: List[Dict[str, str]], previous_description: Optional[str] = None,
+                            previous_team_roles: Optional[List[Dict[str, str]]] = None) -> Dict:
+        """
+        Update an existing plan for a changed description or team with one model call that
+        returns only the added, modified and removed tasks. `tasks` are dicts with task_id,
+        description, employee_name, status and, in two-phase mode, department and level.
+        Returns {"added": [...], "modified": [...], "removed": [task_id, ...]}; added and
+        modified tasks carry description, employee_name, department and level, modified ones
+        also their task_id.
+        """
+        logger, request_id = self.setup_logging(project_name)
+        logger.info(f"Starting KAGE re-plan of {len(tasks)} tasks for: {project_name}")
+        start_time = time.time()
+
+        if not project_description:
+            raise ValueError("Project description cannot be empty.")
+        previous_team_roles = team_roles if previous_team_roles is None else previous_team_roles
+        for role in [*team_roles, *previous_team_roles]:
+            if not all(key in role for key in ["name", "level", "department"]):
+                raise ValueError("Each team role must have 'name', 'level', and 'department' fields.")
+
+        tracer = get_tracer()
+        try:
+            with tracer.start_as_current_span("kage.initialize_vertex_client"):
+                model = self.initialize_vertex_client(logger)
+            with tracer.start_as_current_span("kage.create_prompt") as span:
+                prompt = self.create_replan_prompt(project_description, tasks, team_roles, previous_description,
+                                                   previous_team_roles, logger, model)
+                span.set_attribute("prompt.estimated_tokens", self.prompt_estimate.input_tokens)
+            response_content = self.generate_kage_response(
+                model, prompt, logger, endpoint="kage.replan",
+                response_schema=TAGGED_PLAN_DELTA_RESPONSE_SCHEMA if self.ASSIGNMENT == "local" else PLAN_DELTA_RESPONSE_SCHEMA,
+            )
+            with tracer.start_as_current_span("kage.parse_response") as span:
+                delta = self.parse_plan_delta(response_content, tasks, logger)
+                span.set_attributes({"plan.added": len(delta.added), "plan.modified": len(delta.modified),
+                                     "plan.removed": len(delta.removed)})
+
+            added = [{"description": task.description, "employee_name": getattr(task, "employee_name", None),
+                      "department": getattr(task, "department", None), "level": getattr(task, "level", None)}
+                     for task in delta.added]
+            modified = [{"task_id": task.task_id, "description": task.description,
+                         "employee_name": getattr(task, "employee_name", None),
+                         "department": getattr(task, "department", None), "level": getattr(task, "level", None)}
+                        for task in delta.modified]
+
+            if self.ASSIGNMENT == "local":
+                # Added and modified tasks, plus untouched open tasks whose assignee left the team
+                team_names = {role["name"] for role in team_roles}
+                touched = {task["task_id"] for task in modified} | set(delta.removed)
+                for task in tasks:
+                    if task["task_id"] not in touched and task.get("status") != "done" and task.get("employee_name") not in team_names:
+                        modified.append({key: task.get(key) for key in ("task_id", "description", "department", "level")})
+                assignment = assign_tasks(added + modified, team_roles)
+                for task, member in zip(added + modified, assignment):
+                    task["employee_name"] = team_roles[member]["name"] if member is not None else None
+
+            plan_delta = {"added": added, "modified": modified, "removed": list(delta.removed)}
+            with tracer.start_as_current_span("kage.save_artifact"):
+                get_artifact_store().save(
+                    "plan_delta", f"plan_delta_{project_name}", plan_delta, project_name=project_name, job_id=request_id
+                )
+
+            logger.info(f"KAGE re-plan completed in {time.time() - start_time:.2f} seconds: {len(added)} added, "
+                        f"{len(modified)} modified, {len(delta.removed)} removed.")
+            return plan_delta
+        except PromptBudgetExceeded as e:
+            logger.error(f"KAGE re-plan prompt over budget: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"KAGE re-plan failed: {str(e)}")
+            raise ValueError(f"KAGE re-plan failed: {str(e)}")
+
     def generate_project_plan(self, project_name: str, project_description: str, team_roles: List[Dict[str, str]]) -> Dict:
-        logger, log_file = self.setup_logging(project_name)
+        logger, request_id = self.setup_logging(project_name)
         logger.info(f"Starting KAGE project plan generation for: {project_name}")
         start_time = time.time()
 
@@ -237,25 +831,32 @@ class Kage:
                 logger.error("Each team role must have 'name', 'level', and 'department' fields.")
                 raise ValueError("Each team role must have 'name', 'level', and 'department' fields.")
 
-        output_dir = "output_plans"
-        os.makedirs(output_dir, exist_ok=True)
-
+        tracer = get_tracer()
         try:
-            model = self.initialize_vertex_client(logger)
-            prompt = self.create_kage_prompt(project_description, team_roles, logger)
-            response_content = self.generate_kage_response(model, prompt, logger)
-            project_plan_obj = self.parse_kage_response(response_content, logger)
+            with tracer.start_as_current_span("kage.initialize_vertex_client"):
+                model = self.initialize_vertex_client(logger)
+            if self.WORKSTREAMS:
+                plan_tasks, workstream_names = self.generate_plan_by_workstreams(model, project_description, team_roles, logger)
+            else:
+                plan_tasks, workstream_names = self.generate_plan_tasks(model, project_description, team_roles, logger), None
 
             # Format tasks correctly
-            tasks = [
-                {
-                    "task_id": task.task_id,
-                    "description": task.description,
-                    "employee_name": task.employee_name,
-                    "status": "to-do",
-                }
-                for task in project_plan_obj.tasks
-            ]
+            if self.ASSIGNMENT == "local":
+                with tracer.start_as_current_span("kage.assign"):
+                    tasks = self.assign_plan(plan_tasks, team_roles, logger)
+            else:
+                tasks = [
+                    {
+                        "task_id": task.task_id,
+                        "description": task.description,
+                        "employee_name": task.employee_name,
+                        "status": "to-do",
+                    }
+                    for task in plan_tasks
+                ]
+            if workstream_names:
+                for task, workstream_name in zip(tasks, workstream_names):
+                    task["workstream"] = workstream_name
 
             final_output_data = {
                 "project_name": project_name,
@@ -263,20 +864,21 @@ class Kage:
                 "tasks": tasks,
             }
 
-            # Save the output to a file
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_filename = f"plan_{project_name.replace(' ', '_')}_{timestamp}.json"
-            output_filepath = os.path.join(output_dir, output_filename)
-
-            with open(output_filepath, 'w', encoding='utf-8') as f:
-                json.dump(final_output_data, f, indent=4, ensure_ascii=False)
-            logger.info(f"Successfully saved project plan with inputs to: {output_filepath}")
+            # Keep a copy of the plan in the artifact store (written in the background)
+            with tracer.start_as_current_span("kage.save_artifact"):
+                artifact = get_artifact_store().save(
+                    "plan", f"plan_{project_name}", final_output_data, project_name=project_name, job_id=request_id
+                )
+            if artifact:
+                logger.info(f"Queued project plan artifact: {artifact.key}")
 
             end_time = time.time()
             logger.info(f"KAGE project plan generation completed in {end_time - start_time:.2f} seconds.")
-            logger.info(f"Log file saved to: {log_file}")
 
             return final_output_data
+        except PromptBudgetExceeded as e:
+            logger.error(f"KAGE project plan prompt over budget: {e}")
+            raise
         except Exception as e:
             logger.error(f"KAGE project plan generation failed: {str(e)}")
             raise ValueError(f"KAGE project plan generation failed: {str(e)}")
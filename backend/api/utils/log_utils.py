@@ -0,0 +1,118 @@
+"""
+Process-wide logging setup for the AI helpers.
+
+Handlers are configured once per process. Records are handed to a QueueHandler so the
+request thread never blocks on disk or console I/O; a QueueListener thread writes them to
+a size-rotated log file (bounded to KAGE_LOG_MAX_BYTES * (KAGE_LOG_BACKUP_COUNT + 1) bytes)
+and to stdout. Every record is tagged with the id of the request that produced it, so
+concurrent requests share one file instead of each opening their own.
+"""
+import atexit
+import contextvars
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import uuid
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+# Request ids end up in log lines, response headers and artifact job ids, so ids supplied by
+# callers are only accepted when they are short and free of separators or control characters
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+_request_id = contextvars.ContextVar("kage_request_id", default=None)
+_setup_lock = threading.Lock()
+_queue_handler: Optional[QueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def get_request_id() -> Optional[str]:
+    """
+    Return the id bound to the current request (thread / context), if any.
+    """
+    return _request_id.get()
+
+
+def set_request_id(request_id: Optional[str] = None) -> str:
+    """
+    Bind a request id to the current context, generating one when none is given or the given
+    one does not match REQUEST_ID_PATTERN.
+    """
+    if not request_id or not REQUEST_ID_PATTERN.fullmatch(request_id):
+        request_id = new_request_id()
+    _request_id.set(request_id)
+    return request_id
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Stamp records with the current request id unless the caller already supplied one.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "request_id", None) is None:
+            record.request_id = _request_id.get() or "-"
+        return True
+
+
+def _build_queue_handler() -> QueueHandler:
+    global _listener
+
+    logs_dir = os.getenv("KAGE_LOG_DIR", "logs")
+    os.makedirs(logs_dir, exist_ok=True)
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    file_handler = RotatingFileHandler(
+        os.path.join(logs_dir, "kage.log"),
+        maxBytes=int(os.getenv("KAGE_LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backupCount=int(os.getenv("KAGE_LOG_BACKUP_COUNT", "5")),
+        encoding="utf-8",
+        delay=True,
+    )
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    handler = QueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    return handler
+
+
+def configure_logging(name: str) -> logging.Logger:
+    """
+    Return the named logger, attached to the shared non-blocking handler. Safe to call on
+    every request: handlers are only created the first time.
+    """
+    global _queue_handler
+
+    logger = logging.getLogger(name)
+    with _setup_lock:
+        if _queue_handler is None:
+            _queue_handler = _build_queue_handler()
+        if _queue_handler not in logger.handlers:
+            logger.addHandler(_queue_handler)
+            logger.setLevel(os.getenv("KAGE_LOG_LEVEL", "INFO").upper())
+            logger.propagate = False
+    return logger
+
+
+def get_request_logger(name: str, **extra) -> logging.LoggerAdapter:
+    """
+    Return a logger adapter that tags every record with the current request id.
+    """
+    logger = configure_logging(name)
+    return logging.LoggerAdapter(logger, {"request_id": get_request_id() or set_request_id(), **extra})
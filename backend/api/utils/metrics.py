@@ -0,0 +1,245 @@
+"""
+Lightweight in-process metrics exposed in the Prometheus text format at /metrics.
+
+Counters, gauges and histograms are kept per worker process in memory; no client library
+is required. Instrumentation lives next to the code it measures:
+
+- MetricsMiddleware: view latency per route and DB queries per request
+- model_calls.call_model: model call latency and prompt / response tokens per caller
+- prompt_budget: pre-flight prompt token and cost estimates
+- model_scheduler: model call queue depth, queue wait and calls in flight
+- instrument_github: GitHub API calls, latency and rate-limit headroom
+- record_cache: hit / miss counts for the application caches
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """The metric's sample lines in the Prometheus text format."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_label = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, bucket_label)} {bucket_count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "kage_http_request_duration_seconds", "View latency per route.", ("route", "method", "status")))
+DB_QUERIES_PER_REQUEST = REGISTRY.register(Histogram(
+    "kage_db_queries_per_request", "Database queries executed per request.", ("route",), buckets=COUNT_BUCKETS))
+MODEL_CALL_DURATION = REGISTRY.register(Histogram(
+    "kage_model_call_duration_seconds", "Model call latency including retries.", ("caller", "endpoint", "outcome")))
+MODEL_PROMPT_TOKENS = REGISTRY.register(Histogram(
+    "kage_model_prompt_tokens", "Prompt tokens per model call.", ("caller", "endpoint"), buckets=TOKEN_BUCKETS))
+MODEL_RESPONSE_TOKENS = REGISTRY.register(Histogram(
+    "kage_model_response_tokens", "Response tokens per model call.", ("caller", "endpoint"), buckets=TOKEN_BUCKETS))
+MODEL_ESTIMATED_PROMPT_TOKENS = REGISTRY.register(Histogram(
+    "kage_model_estimated_prompt_tokens", "Pre-flight prompt token estimate per model call.", ("caller", "endpoint"),
+    buckets=TOKEN_BUCKETS))
+MODEL_ESTIMATED_COST = REGISTRY.register(Counter(
+    "kage_model_estimated_cost_usd_total", "Pre-flight worst-case cost estimate of model calls.", ("caller", "endpoint")))
+MODEL_CONTINUATIONS = REGISTRY.register(Counter(
+    "kage_model_continuations_total", "Continuation calls for replies cut off by the output token limit.",
+    ("caller", "endpoint")))
+MODEL_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "kage_model_queue_depth", "Model calls waiting for a scheduler slot.", ("priority",)))
+MODEL_QUEUE_WAIT = REGISTRY.register(Histogram(
+    "kage_model_queue_wait_seconds", "Time model calls waited for a scheduler slot.", ("endpoint", "priority")))
+MODEL_CALLS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "kage_model_calls_in_flight", "Model calls holding a scheduler slot."))
+GITHUB_API_CALLS = REGISTRY.register(Counter(
+    "kage_github_api_calls_total", "GitHub REST API calls.", ("method", "status")))
+GITHUB_API_DURATION = REGISTRY.register(Histogram(
+    "kage_github_api_call_duration_seconds", "GitHub REST API call latency.", ("method",)))
+GITHUB_RATE_LIMIT_REMAINING = REGISTRY.register(Gauge(
+    "kage_github_rate_limit_remaining", "Requests left in the current GitHub rate-limit window.", ("resource",)))
+GITHUB_RATE_LIMIT_LIMIT = REGISTRY.register(Gauge(
+    "kage_github_rate_limit_limit", "Size of the GitHub rate-limit window.", ("resource",)))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "kage_cache_requests_total", "Cache lookups by cache and result (hit / miss).", ("cache", "result")))
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_model_call(endpoint: str, seconds: float, outcome: str, response=None):
+    """
+    Record latency and, when the response carries usage metadata, token counts for a model call.
+    The caller label is the endpoint prefix: "kage", "ai_assist" or "code_optimizer".
+    """
+    caller = endpoint.split(".")[0]
+    MODEL_CALL_DURATION.observe(seconds, caller=caller, endpoint=endpoint, outcome=outcome)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    response_tokens = getattr(usage, "candidates_token_count", None)
+    if prompt_tokens:
+        MODEL_PROMPT_TOKENS.observe(prompt_tokens, caller=caller, endpoint=endpoint)
+    if response_tokens:
+        MODEL_RESPONSE_TOKENS.observe(response_tokens, caller=caller, endpoint=endpoint)
+
+
+def _record_github_call(verb: str, status, headers: Optional[dict], seconds: float):
+    GITHUB_API_CALLS.inc(method=verb, status=status)
+    GITHUB_API_DURATION.observe(seconds, method=verb)
+    if not headers:
+        return
+    headers = {str(key).lower(): value for key, value in headers.items()}
+    resource = headers.get("x-ratelimit-resource", "core")
+    if "x-ratelimit-remaining" in headers:
+        GITHUB_RATE_LIMIT_REMAINING.set(int(headers["x-ratelimit-remaining"]), resource=resource)
+    if "x-ratelimit-limit" in headers:
+        GITHUB_RATE_LIMIT_LIMIT.set(int(headers["x-ratelimit-limit"]), resource=resource)
+
+
+def instrument_github(client):
+    """
+    Count every HTTP request a PyGithub client makes and track rate-limit headroom from the
+    response headers. Wraps the requester's raw request methods on this client instance only.
+    """
+    requester = client.requester
+    for method_name in ("requestJson", "requestMultipart", "requestBlob"):
+        original = getattr(requester, method_name)
+
+        def wrapped(verb, url, *args, _original=original, **kwargs):
+            start = time.perf_counter()
+            try:
+                status, headers, output = _original(verb, url, *args, **kwargs)
+            except Exception:
+                _record_github_call(verb, "error", None, time.perf_counter() - start)
+                raise
+            _record_github_call(verb, status, headers, time.perf_counter() - start)
+            return status, headers, output
+
+        setattr(requester, method_name, wrapped)
+    return client
@@ -0,0 +1,513 @@
+"""
+Shared wrapper for outbound model calls (Kage, AIAssist, CodeOptimizer).
+
+Every call goes through `call_model`, which applies a per-endpoint policy:
+
+- a deadline per attempt and for the call as a whole
+- bounded retries with exponential backoff and full jitter on retryable errors (429, 5xx, timeouts)
+- an optional hedged second request once the first has been outstanding longer than the
+  endpoint's observed p95 latency (or a fixed threshold)
+- a circuit breaker that fails fast while an endpoint keeps failing
+- a slot from the process-wide model scheduler (priority, fair queuing and RPM / TPM
+  limits, see model_scheduler) for every request, held until the request really finishes:
+  a timed out or losing hedged request keeps its slot while it runs on in the background,
+  and a hedge is only sent when a slot is free
+
+`call_model_with_continuation` additionally completes replies cut off by the output token
+limit (finish reason MAX_TOKENS): the reply is trimmed to its last complete element and
+the model is asked to continue from there, up to MODEL_CALL_MAX_CONTINUATIONS times.
+
+Policies are read from the environment, with endpoint specific overrides taking precedence:
+`MODEL_CALL_TIMEOUT` applies to every endpoint, `MODEL_CALL_KAGE_GENERATE_TIMEOUT` only to
+"kage.generate".
+"""
+import contextvars
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .metrics import MODEL_CONTINUATIONS, record_model_call
+from .model_scheduler import ModelQueueTimeout, ModelScheduler, Permit, estimate_call_tokens, get_model_scheduler
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Exception class names used by google-api-core, google-genai and gRPC for transient failures.
+# Matched by name so that this module does not have to import the SDKs.
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted",
+    "TooManyRequests",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "GatewayTimeout",
+    "Aborted",
+}
+
+# Per attempt timeouts in seconds, used when no environment override is set
+DEFAULT_TIMEOUTS = {
+    "kage.generate": 120.0,
+    "kage.workstreams": 60.0,
+    "kage.replan": 120.0,
+    "ai_assist.analyze": 120.0,
+    "ai_assist.json_changes": 120.0,
+    "code_optimizer.generate": 90.0,
+}
+
+
+CONTINUATION_PROMPT = (
+    "Your reply was cut off by the output length limit. Continue it exactly where it stops, "
+    "without repeating anything and without any other text."
+)
+
+
+class ModelCallError(Exception):
+    """Base class for errors raised by the call wrapper itself."""
+
+
+class ModelCallTimeout(ModelCallError):
+    """The model did not answer within the endpoint deadline."""
+
+
+class CircuitOpenError(ModelCallError):
+    """The endpoint circuit breaker is open, the call was not attempted."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Return True for errors worth retrying: timeouts, connection errors, 429 and 5xx responses.
+    """
+    if isinstance(error, (ModelCallTimeout, TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    for attribute in ("code", "status_code"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int) and value in RETRYABLE_STATUS_CODES:
+            return True
+    return False
+
+
+def _env(endpoint: str, name: str, default: Any, cast: Callable = float) -> Any:
+    """
+    Read MODEL_CALL_<ENDPOINT>_<NAME>, then MODEL_CALL_<NAME>, then fall back to default.
+    """
+    endpoint_key = endpoint.upper().replace(".", "_")
+    for key in (f"MODEL_CALL_{endpoint_key}_{name}", f"MODEL_CALL_{name}"):
+        value = os.getenv(key)
+        if value not in (None, ""):
+            return cast(value)
+    return default
+
+
+def _as_bool(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class CallPolicy:
+    """
+    Timeout, retry, hedging and circuit breaker settings for one endpoint.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 60.0,
+        deadline: Optional[float] = None,
+        max_attempts: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 16.0,
+        hedge: bool = False,
+        hedge_after: Optional[float] = None,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        self.timeout = timeout
+        self.deadline = deadline if deadline is not None else timeout * max_attempts
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+    @classmethod
+    def from_env(cls, endpoint: str) -> "CallPolicy":
+        timeout = _env(endpoint, "TIMEOUT", DEFAULT_TIMEOUTS.get(endpoint, 60.0))
+        max_attempts = _env(endpoint, "MAX_ATTEMPTS", 3, int)
+        return cls(
+            timeout=timeout,
+            deadline=_env(endpoint, "DEADLINE", None),
+            max_attempts=max_attempts,
+            backoff_base=_env(endpoint, "BACKOFF_BASE", 1.0),
+            backoff_max=_env(endpoint, "BACKOFF_MAX", 16.0),
+            hedge=_env(endpoint, "HEDGE", False, _as_bool),
+            hedge_after=_env(endpoint, "HEDGE_AFTER", None),
+            failure_threshold=_env(endpoint, "BREAKER_THRESHOLD", 5, int),
+            reset_timeout=_env(endpoint, "BREAKER_RESET", 30.0),
+        )
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Full jitter backoff: a random delay up to base * 2^(attempt - 1), capped at backoff_max.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker. After `failure_threshold` consecutive failures
+    calls fail fast for `reset_timeout` seconds, then a single trial call is let through.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                return True
+            if self.state == self.HALF_OPEN:
+                # Only the trial call goes through until it reports back
+                return False
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent successful call latencies for one endpoint.
+    """
+
+    MIN_SAMPLES = 20
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """
+        Return the pct-th percentile, or None until enough samples have been seen.
+        """
+        with self._lock:
+            if len(self._samples) < self.MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("MODEL_CALL_MAX_WORKERS", "32")),
+    thread_name_prefix="model-call",
+)
+_registry_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyTracker] = {}
+
+
+def get_circuit_breaker(endpoint: str, policy: CallPolicy) -> CircuitBreaker:
+    with _registry_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(policy.failure_threshold, policy.reset_timeout)
+        return _breakers[endpoint]
+
+
+def get_latency_tracker(endpoint: str) -> LatencyTracker:
+    with _registry_lock:
+        if endpoint not in _latencies:
+            _latencies[endpoint] = LatencyTracker()
+        return _latencies[endpoint]
+
+
+def reset_call_state():
+    """
+    Forget all breaker and latency state (used by tests and after configuration changes).
+    """
+    with _registry_lock:
+        _breakers.clear()
+        _latencies.clear()
+
+
+def _submit(scheduler: ModelScheduler, permit: Permit, fn: Callable, args, kwargs):
+    """
+    Run fn on the worker pool in a copy of the caller's context (request id, tenant, current
+    span). The permit's scheduler slot is freed when the request finishes, not when the
+    attempt stops waiting for it, so requests left running in the background still count.
+    """
+    try:
+        future = _executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    except BaseException:
+        scheduler.release_slot(permit)
+        raise
+    future.add_done_callback(lambda _: scheduler.release_slot(permit))
+    return future
+
+
+def _run_attempt(endpoint: str, fn: Callable, args, kwargs, timeout: float, hedge_after: Optional[float],
+                 scheduler: ModelScheduler, permit: Permit) -> Tuple[Any, Permit]:
+    """
+    Run one attempt with `permit`'s slot, hedging with a duplicate request after hedge_after
+    seconds if the scheduler has a free slot for it. Returns the first successful result and
+    the permit of the request that produced it; raises ModelCallTimeout when no request
+    finishes in time. Requests that are still running when the attempt gives up cannot be
+    interrupted and finish in the background, holding their slot; their results are discarded.
+    """
+    start = time.monotonic()
+    permits = {}
+    future = _submit(scheduler, permit, fn, args, kwargs)
+    permits[future] = permit
+    pending = {future}
+    can_hedge = hedge_after is not None and hedge_after < timeout
+    error = None
+
+    while True:
+        elapsed = time.monotonic() - start
+        if elapsed >= timeout:
+            raise ModelCallTimeout(f"{endpoint} did not respond within {timeout:.1f}s")
+
+        wait_for = timeout - elapsed
+        if can_hedge:
+            wait_for = min(wait_for, max(hedge_after - elapsed, 0.0))
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return future.result(), permits[future]
+            error = future.exception()
+
+        if not pending:
+            raise error
+
+        if can_hedge and time.monotonic() - start >= hedge_after:
+            can_hedge = False
+            try:
+                hedge_permit = scheduler.acquire(endpoint, permit.tokens, priority=permit.priority,
+                                                 tenant=permit.tenant, max_wait=0)
+            except ModelQueueTimeout:
+                logger.info(f"Not hedging {endpoint}: no free model call slot")
+                continue
+            logger.info(f"Hedging {endpoint} after {hedge_after:.2f}s")
+            future = _submit(scheduler, hedge_permit, fn, args, kwargs)
+            permits[future] = hedge_permit
+            pending.add(future)
+
+
+def call_model(endpoint: str, fn: Callable, *args, policy: Optional[CallPolicy] = None, **kwargs):
+    """
+    Call fn(*args, **kwargs) under the endpoint's timeout, retry, hedging and circuit breaker policy.
+    """
+    with get_tracer().start_as_current_span(f"model_call {endpoint}", attributes={"model.endpoint": endpoint}) as span:
+        started = time.monotonic()
+        try:
+            response = _call_with_policy(endpoint, fn, args, kwargs, policy or CallPolicy.from_env(endpoint))
+        except CircuitOpenError:
+            record_model_call(endpoint, time.monotonic() - started, "circuit_open")
+            span.set_attribute("model.outcome", "circuit_open")
+            raise
+        except ModelQueueTimeout:
+            record_model_call(endpoint, time.monotonic() - started, "queue_timeout")
+            span.set_attribute("model.outcome", "queue_timeout")
+            raise
+        except ModelCallTimeout:
+            record_model_call(endpoint, time.monotonic() - started, "timeout")
+            span.set_attribute("model.outcome", "timeout")
+            raise
+        except Exception:
+            record_model_call(endpoint, time.monotonic() - started, "error")
+            span.set_attribute("model.outcome", "error")
+            raise
+        record_model_call(endpoint, time.monotonic() - started, "ok", response)
+        span.set_attribute("model.outcome", "ok")
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            span.set_attribute("model.prompt_tokens", getattr(usage, "prompt_token_count", None) or 0)
+            span.set_attribute("model.response_tokens", getattr(usage, "candidates_token_count", None) or 0)
+        return response
+
+
+def _call_with_policy(endpoint: str, fn: Callable, args, kwargs, policy: CallPolicy):
+    breaker = get_circuit_breaker(endpoint, policy)
+    latencies = get_latency_tracker(endpoint)
+    scheduler = get_model_scheduler()
+    tokens = estimate_call_tokens(args, kwargs)
+    deadline = time.monotonic() + policy.deadline
+    attempt = 0
+
+    while True:
+        attempt += 1
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit breaker for {endpoint} is open, not calling the model.")
+
+        remaining = deadline - time.monotonic()
+        hedge_after = None
+        if policy.hedge:
+            hedge_after = policy.hedge_after if policy.hedge_after is not None else latencies.percentile(95)
+
+        try:
+            # The slot is freed by the request itself when it finishes (see _submit)
+            permit = scheduler.acquire(endpoint, tokens, max_wait=remaining)
+            started = time.monotonic()
+            remaining = deadline - started
+            result, permit = _run_attempt(endpoint, fn, args, kwargs, min(policy.timeout, remaining), hedge_after,
+                                          scheduler, permit)
+            usage = getattr(result, "usage_metadata", None)
+            permit.used_tokens = getattr(usage, "prompt_token_count", None) or None
+            scheduler.reconcile(permit)
+        except ModelQueueTimeout:
+            raise
+        except Exception as e:
+            retryable = is_retryable(e)
+            if retryable:
+                breaker.record_failure()
+            else:
+                # The service answered, so it is healthy even though the request was rejected
+                breaker.record_success()
+            delay = policy.backoff_delay(attempt)
+            if not retryable or attempt >= policy.max_attempts or delay >= deadline - time.monotonic():
+                raise
+            logger.warning(f"{endpoint} attempt {attempt} failed ({e}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+
+        breaker.record_success()
+        latencies.record(time.monotonic() - started)
+        return result
+
+
+def finish_reason(response) -> str:
+    """
+    Finish reason of the first candidate as a name ("STOP", "MAX_TOKENS", ...): the Vertex AI
+    SDK returns an enum, the HTTP client a string.
+    """
+    candidates = getattr(response, "candidates", None)
+    if not candidates:
+        return ""
+    reason = getattr(candidates[0], "finish_reason", "")
+    return getattr(reason, "name", str(reason))
+
+
+def response_text(response) -> str:
+    if hasattr(response, "text"):
+        return response.text
+    if response.candidates and response.candidates[0].content and response.candidates[0].content.parts:
+        return response.candidates[0].content.parts[0].text
+    raise ValueError("Unable to extract text content from the model response.")
+
+
+def complete_json_prefix(text: str) -> Tuple[Optional[int], bool]:
+    """
+    Return (length, complete) for a possibly cut off JSON reply: the length of the longest
+    prefix ending right after a complete element of an array or object (None when no element
+    is complete yet), and whether the whole document is complete. Text before the first
+    bracket, such as a Markdown fence, is part of the prefix.
+    """
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        return None, False
+    depth, in_string, escaped, end = 0, False, False, None
+    for index in range(min(starts), len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return index + 1, True
+            end = index + 1
+    return end, False
+
+
+def continuation_config(generation_config):
+    """
+    The generation config for continuation turns: the same settings without a response schema
+    or JSON mime type. Under a schema the model starts a new, complete object instead of
+    continuing the cut off one, which cannot be appended to the kept prefix.
+    """
+    if generation_config is None:
+        return None
+    config = generation_config.to_dict() if hasattr(generation_config, "to_dict") else dict(generation_config)
+    for key in ("response_mime_type", "response_schema", "responseMimeType", "responseSchema"):
+        config.pop(key, None)
+    return config
+
+
+def call_model_with_continuation(endpoint: str, model, prompt: str, generation_config=None,
+                                 max_continuations: Optional[int] = None,
+                                 complete_prefix: Callable[[str], Tuple[Optional[int], bool]] = complete_json_prefix) -> str:
+    """
+    Call model.generate_content through call_model and return the reply text. While the reply
+    stops at MAX_TOKENS it is trimmed to its last complete element (`complete_prefix`, JSON
+    by default), sent back as the model's turn, and the continuation is appended; at most
+    max_continuations times (MODEL_CALL_<ENDPOINT>_MAX_CONTINUATIONS, default 2). Continuation
+    turns are sent without the response schema (see continuation_config).
+    """
+    if max_continuations is None:
+        max_continuations = _env(endpoint, "MAX_CONTINUATIONS", 2, int)
+    response = call_model(endpoint, model.generate_content, prompt, generation_config=generation_config)
+    text = response_text(response)
+
+    for continuation in range(max_continuations):
+        if finish_reason(response) != "MAX_TOKENS":
+            break
+        kept, complete = complete_prefix(text)
+        if complete:
+            break
+        if kept is not None:
+            text = text[:kept]
+        logger.info(f"{endpoint} reply cut off at {len(text)} characters, requesting continuation {continuation + 1}")
+        MODEL_CONTINUATIONS.inc(caller=endpoint.split(".")[0], endpoint=endpoint)
+        contents = [
+            {"role": "user", "parts": [{"text": prompt}]},
+            {"role": "model", "parts": [{"text": text}]},
+            {"role": "user", "parts": [{"text": CONTINUATION_PROMPT}]},
+        ]
+        response = call_model(endpoint, model.generate_content, contents,
+                              generation_config=continuation_config(generation_config))
+        text += re.sub(r"^\s*```(?:json)?\s*", "", response_text(response), flags=re.IGNORECASE)
+    return text
@@ -0,0 +1,376 @@
+"""
+Process-wide scheduler for model calls: quota-aware rate limits, priorities and fair queuing.
+
+`call_model` takes a slot from the scheduler before every attempt, so interactive calls
+(plan generation, JSON changes, code optimization) are not starved by background repository
+analysis and the project stays under its Vertex AI quota instead of collecting 429s:
+
+- token buckets for requests per minute and input tokens per minute, reconciled with the
+  token counts the model reports
+- priority classes: waiting "interactive" calls always go before "batch" calls
+- fair queuing: within a class, tenants (the X-Kage-Tenant header, else the client address)
+  are served round-robin, so one user's burst does not delay everyone else
+- a concurrency limit per worker process
+
+With MODEL_SCHEDULER_BACKEND=database the per-minute limits are shared by all workers through
+ModelQuotaWindow rows (fixed one-minute windows updated atomically) instead of local buckets.
+
+Configuration (environment):
+
+- MODEL_SCHEDULER_RPM / MODEL_SCHEDULER_TPM: requests / input tokens per minute (0 = unlimited)
+- MODEL_SCHEDULER_MAX_CONCURRENCY: model calls in flight per process (default 16)
+- MODEL_SCHEDULER_MAX_WAIT: seconds a call may wait in the queue (default 60)
+- MODEL_SCHEDULER_BACKEND: "local" (default) or "database", MODEL_SCHEDULER_QUOTA_NAME (default "gemini")
+- MODEL_CALL_<ENDPOINT>_PRIORITY: "interactive" or "batch", overriding DEFAULT_PRIORITIES
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from .metrics import MODEL_CALLS_IN_FLIGHT, MODEL_QUEUE_DEPTH, MODEL_QUEUE_WAIT
+from .prompt_budget import estimate_tokens
+
+PRIORITIES = ("interactive", "batch")
+
+# Endpoints that serve background work; everything else is interactive
+DEFAULT_PRIORITIES = {
+    "ai_assist.analyze": "batch",
+    "ai_assist.map": "batch",
+    "ai_assist.reduce": "batch",
+    "ai_assist.incremental": "batch",
+}
+
+logger = logging.getLogger(__name__)
+
+_tenant = contextvars.ContextVar("kage_model_tenant", default="default")
+_priority = contextvars.ContextVar("kage_model_priority", default=None)
+
+
+class ModelQueueTimeout(Exception):
+    """The call waited longer than MODEL_SCHEDULER_MAX_WAIT for a scheduler slot."""
+
+
+def set_tenant(tenant: Optional[str]):
+    """
+    Set the tenant model calls are fair-queued under for the rest of the current context.
+    """
+    _tenant.set(tenant or "default")
+
+
+@contextmanager
+def call_priority(priority: str):
+    """
+    Run the model calls made inside the block with `priority`, whatever their endpoint.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def priority_for(endpoint: str) -> str:
+    if _priority.get() is not None:
+        return _priority.get()
+    endpoint_key = endpoint.upper().replace(".", "_")
+    return os.getenv(f"MODEL_CALL_{endpoint_key}_PRIORITY") or DEFAULT_PRIORITIES.get(endpoint, "interactive")
+
+
+def estimate_call_tokens(args, kwargs) -> int:
+    """
+    Estimated input tokens of a generate_content call from its contents argument.
+    """
+    contents = args[0] if args else kwargs.get("contents", "")
+    return estimate_tokens(contents if isinstance(contents, str) else json.dumps(contents, default=str))
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken, 0 if it can be taken now."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        """Debit (positive) or refund (negative) the difference between estimated and used tokens."""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class LocalRateLimiter:
+    """
+    Requests and tokens per minute for this process.
+    """
+
+    def __init__(self, rpm: float = 0, tpm: float = 0):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: int) -> float:
+        with self._lock:
+            return self._try_acquire(tokens)
+
+    def _try_acquire(self, tokens: int) -> float:
+        waits = [bucket.wait_time(amount) for bucket, amount in ((self.requests, 1), (self.tokens, tokens)) if bucket]
+        wait = max(waits, default=0.0)
+        if wait == 0:
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+        return wait
+
+    def adjust(self, tokens: int):
+        if self.tokens:
+            with self._lock:
+                self.tokens.adjust(tokens)
+
+
+class DatabaseRateLimiter:
+    """
+    Requests and tokens per minute shared by every process, counted in one ModelQuotaWindow
+    row per minute. A conditional UPDATE admits a call only while the window has room, so
+    concurrent workers cannot overshoot the quota.
+    """
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0):
+        self.name = name
+        self.rpm = int(rpm)
+        self.tpm = int(tpm)
+
+    def try_acquire(self, tokens: int) -> float:
+        from django.db.models import F
+        from ..models import ModelQuotaWindow
+
+        now = time.time()
+        window = int(now // 60)
+        _, created = ModelQuotaWindow.objects.get_or_create(name=self.name, window=window)
+        if created:
+            ModelQuotaWindow.objects.filter(name=self.name, window__lt=window - 5).delete()
+
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+        admitted = ModelQuotaWindow.objects.filter(name=self.name, window=window)
+        if self.rpm:
+            admitted = admitted.filter(requests__lte=self.rpm - 1)
+        if self.tpm:
+            admitted = admitted.filter(tokens__lte=self.tpm - tokens)
+        if admitted.update(requests=F("requests") + 1, tokens=F("tokens") + tokens):
+            return 0.0
+        return (window + 1) * 60 - now
+
+    def adjust(self, tokens: int):
+        from django.db.models import F
+        from ..models import ModelQuotaWindow
+
+        ModelQuotaWindow.objects.filter(name=self.name, window=int(time.time() // 60)).update(tokens=F("tokens") + tokens)
+
+
+class Permit:
+    def __init__(self, endpoint: str, priority: str, tenant: str, tokens: int):
+        self.endpoint = endpoint
+        self.priority = priority
+        self.tenant = tenant
+        self.tokens = tokens
+        self.used_tokens: Optional[int] = None
+        self.granted = False
+        self.waited = 0.0
+
+
+class ModelScheduler:
+    """
+    Admits model calls in priority order, round-robin over tenants within a priority, while
+    the concurrency limit and the rate limiter allow.
+
+    The rate limiter is consulted outside the scheduler lock, since the database limiter makes
+    queries: the next call in line is taken off the queue with a concurrency slot held, one
+    call at a time, and goes back to the head of its queue if the limiter refuses it.
+    """
+
+    def __init__(self, limiter=None, max_concurrency: int = 16, max_wait: float = 60.0):
+        self.limiter = limiter or LocalRateLimiter()
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._queues: Dict[str, "OrderedDict[str, deque]"] = {priority: OrderedDict() for priority in PRIORITIES}
+        self._cond = threading.Condition()
+        self._reserving: Optional[Permit] = None  # Call being checked with the limiter
+        self._limited_until = 0.0  # Monotonic time the limiter asked to wait until
+
+    def queue_depth(self, priority: str) -> int:
+        return sum(len(waiters) for waiters in self._queues[priority].values())
+
+    def _next_candidate(self) -> Tuple[Optional[Permit], Optional[float]]:
+        """
+        Take the next call to admit off its queue, holding a concurrency slot for it. Returns
+        (permit, None), or (None, seconds until the limiter may admit a call, if known).
+        Called with the lock held.
+        """
+        if self._reserving is not None or self.in_flight >= self.max_concurrency:
+            return None, None
+        held_back = self._limited_until - time.monotonic()
+        if held_back > 0:
+            return None, held_back
+        tenants = next((queues for queues in self._queues.values() if queues), None)
+        if tenants is None:
+            return None, None
+
+        tenant, waiters = next(iter(tenants.items()))
+        permit = waiters.popleft()
+        # The served tenant goes to the back of the round-robin
+        if waiters:
+            tenants.move_to_end(tenant)
+        else:
+            del tenants[tenant]
+        self.in_flight += 1
+        self._reserving = permit
+        return permit, None
+
+    def _requeue(self, permit: Permit):
+        tenants = self._queues[permit.priority]
+        tenants.setdefault(permit.tenant, deque()).appendleft(permit)
+        tenants.move_to_end(permit.tenant, last=False)
+
+    def _reserve(self, permit: Permit):
+        """
+        Ask the limiter to admit `permit`; called with the lock held, which is released while
+        the limiter runs. A limiter error admits the call: the quota is then enforced by the
+        model API's own 429s and the retry policy.
+        """
+        self._cond.release()
+        try:
+            wait = self.limiter.try_acquire(permit.tokens)
+        except Exception as e:
+            logger.warning(f"Model rate limiter failed, admitting {permit.endpoint} unlimited: {e}")
+            wait = 0.0
+        finally:
+            self._cond.acquire()
+
+        self._reserving = None
+        if wait > 0:
+            self.in_flight -= 1
+            self._requeue(permit)
+            self._limited_until = time.monotonic() + wait
+        else:
+            permit.granted = True
+        self._cond.notify_all()
+
+    def acquire(self, endpoint: str, tokens: int, priority: Optional[str] = None, tenant: Optional[str] = None,
+                max_wait: Optional[float] = None) -> Permit:
+        permit = Permit(endpoint, priority or priority_for(endpoint), tenant or _tenant.get(), tokens)
+        if permit.priority not in self._queues:
+            permit.priority = "interactive"
+        started = time.monotonic()
+        deadline = started + (self.max_wait if max_wait is None else min(max_wait, self.max_wait))
+
+        with self._cond:
+            self._queues[permit.priority].setdefault(permit.tenant, deque()).append(permit)
+            MODEL_QUEUE_DEPTH.set(self.queue_depth(permit.priority), priority=permit.priority)
+            try:
+                while not permit.granted:
+                    candidate, retry_in = self._next_candidate()
+                    if candidate is not None:
+                        # May be another tenant's call; its thread is woken when it is granted
+                        self._reserve(candidate)
+                        continue
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 and self._reserving is not permit:
+                        self._remove(permit)
+                        raise ModelQueueTimeout(
+                            f"{endpoint} waited {time.monotonic() - started:.1f}s for a model call slot."
+                        )
+                    self._cond.wait(max(0.001, min(remaining, retry_in) if retry_in else remaining))
+            finally:
+                MODEL_QUEUE_DEPTH.set(self.queue_depth(permit.priority), priority=permit.priority)
+                MODEL_CALLS_IN_FLIGHT.set(self.in_flight)
+
+        permit.waited = time.monotonic() - started
+        MODEL_QUEUE_WAIT.observe(permit.waited, endpoint=endpoint, priority=permit.priority)
+        return permit
+
+    def _remove(self, permit: Permit):
+        tenants = self._queues[permit.priority]
+        waiters = tenants.get(permit.tenant)
+        if waiters and permit in waiters:
+            waiters.remove(permit)
+            if not waiters:
+                del tenants[permit.tenant]
+
+    def reconcile(self, permit: Permit):
+        """
+        Debit or refund the difference between the estimated and the used tokens of a call.
+        """
+        if permit.used_tokens is not None:
+            try:
+                self.limiter.adjust(permit.used_tokens - permit.tokens)
+            except Exception as e:
+                logger.warning(f"Could not reconcile model token usage with the rate limiter: {e}")
+
+    def release(self, permit: Permit):
+        self.reconcile(permit)
+        self.release_slot(permit)
+
+    def release_slot(self, permit: Permit):
+        """
+        Free the permit's concurrency slot, without touching the rate limiter.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+            MODEL_CALLS_IN_FLIGHT.set(self.in_flight)
+
+    @contextmanager
+    def slot(self, endpoint: str, tokens: int, max_wait: Optional[float] = None):
+        permit = self.acquire(endpoint, tokens, max_wait=max_wait)
+        try:
+            yield permit
+        finally:
+            self.release(permit)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def build_model_scheduler() -> ModelScheduler:
+    rpm = float(os.getenv("MODEL_SCHEDULER_RPM", "0"))
+    tpm = float(os.getenv("MODEL_SCHEDULER_TPM", "0"))
+    if os.getenv("MODEL_SCHEDULER_BACKEND", "local") == "database":
+        limiter = DatabaseRateLimiter(os.getenv("MODEL_SCHEDULER_QUOTA_NAME", "gemini"), rpm, tpm)
+    else:
+        limiter = LocalRateLimiter(rpm, tpm)
+    return ModelScheduler(
+        limiter,
+        max_concurrency=int(os.getenv("MODEL_SCHEDULER_MAX_CONCURRENCY", "16")),
+        max_wait=float(os.getenv("MODEL_SCHEDULER_MAX_WAIT", "60")),
+    )
+
+
+def get_model_scheduler() -> ModelScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = build_model_scheduler()
+    return _scheduler
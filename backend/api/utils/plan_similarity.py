@@ -0,0 +1,210 @@
+"""
+Near-duplicate plan reuse for `/ai/generate`.
+
+Many plan requests repeat a past project with small wording edits, or come from the same
+template with a different team. Exact-match caching misses them, so every generated plan is
+indexed by a MinHash signature of its description shingles (word 3-grams) plus its team
+composition (level and department of each member, not the names). The signature is split
+into LSH bands stored in PlanSignatureBand, and a new request only compares itself with the
+plans sharing at least one band bucket. Everything is computed locally; no embedding model
+is called.
+
+A match at or above the similarity threshold is remapped to the new team. Members with the
+same level and department take over each other's tasks, and the tasks of unmatched members
+go through the local assignment engine. What the caller does with the match depends on the
+reuse mode:
+
+- "offer": the remapped plan is used as is, without a model call
+- "adapt": the remapped plan is updated for the new description with Kage's re-plan (delta)
+  prompt, which costs a fraction of a full generation
+- "off": no lookup
+
+Configuration (environment):
+
+- KAGE_PLAN_REUSE: default reuse mode, "off" (default), "offer" or "adapt"
+- KAGE_PLAN_REUSE_THRESHOLD: minimum estimated Jaccard similarity (default 0.8)
+- KAGE_PLAN_REUSE_CANDIDATES: most recent candidate plans compared per lookup (default 50)
+"""
+import hashlib
+import json
+import os
+import random
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from ..models import PlanSignature, PlanSignatureBand
+from .assignment import assign_tasks
+from .metrics import record_cache
+
+REUSE_MODES = ("off", "offer", "adapt")
+
+BANDS = 16
+ROWS = 4
+NUM_PERM = BANDS * ROWS
+SHINGLE_SIZE = 3
+
+# Universal hashing modulo a Mersenne prime; fixed seed so signatures are stable across processes
+MERSENNE_PRIME = (1 << 61) - 1
+_random = random.Random(0x6B616765)
+PERMUTATIONS = [(_random.randrange(1, MERSENNE_PRIME), _random.randrange(0, MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+
+def reuse_mode(requested: Optional[str] = None) -> str:
+    mode = (requested or os.getenv("KAGE_PLAN_REUSE", "off")).lower()
+    if mode not in REUSE_MODES:
+        raise ValueError(f"'reuse' must be one of {', '.join(REUSE_MODES)}.")
+    return mode
+
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", str(text or "").lower()).split())
+
+
+def _role_key(role: Dict[str, str]) -> Tuple[str, str]:
+    return _normalize(role["level"]), _normalize(role["department"])
+
+
+def shingles(description: str, team_roles: Sequence[Dict[str, str]]) -> Set[str]:
+    """
+    Word 3-grams of the description plus one token per team member's level and department
+    (numbered, so two Analysts count twice).
+    """
+    words = _normalize(description).split()
+    tokens = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    counts = Counter()
+    for role in team_roles:
+        key = _role_key(role)
+        counts[key] += 1
+        tokens.add(f"team:{key[0]}:{key[1]}:{counts[key]}")
+    tokens.discard("")
+    return tokens
+
+
+def minhash(tokens: Set[str]) -> List[int]:
+    hashes = [int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big") for token in tokens]
+    if not hashes:
+        return [MERSENNE_PRIME] * NUM_PERM
+    return [min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in PERMUTATIONS]
+
+
+def similarity(signature: Sequence[int], other: Sequence[int]) -> float:
+    """Estimated Jaccard similarity: the fraction of equal MinHash values."""
+    return sum(1 for a, b in zip(signature, other) if a == b) / NUM_PERM
+
+
+def band_buckets(signature: Sequence[int]) -> List[str]:
+    return [
+        f"{band}:{hashlib.blake2b(json.dumps(signature[band * ROWS:(band + 1) * ROWS]).encode('utf-8'), digest_size=16).hexdigest()}"
+        for band in range(BANDS)
+    ]
+
+
+def remap_tasks(tasks: List[Dict], previous_team: List[Dict[str, str]], team_roles: List[Dict[str, str]]) -> List[Dict]:
+    """
+    Move a past plan's tasks onto a new team. Each previous member's tasks go to an unused new
+    member with the same level and department. The remaining tasks are assigned by the local
+    engine, from their own role tags or their previous assignee's role.
+    """
+    unused = list(range(len(team_roles)))
+    mapping = {}
+    for member in previous_team:
+        match = next((index for index in unused if _role_key(team_roles[index]) == _role_key(member)), None)
+        if match is not None:
+            unused.remove(match)
+            mapping[member["name"]] = team_roles[match]["name"]
+    roles = {member["name"]: member for member in previous_team}
+
+    remapped = [dict(task, employee_name=mapping.get(task.get("employee_name"))) for task in tasks]
+    orphans = [task for task in remapped if task["employee_name"] is None]
+    tags = [
+        {
+            "department": task.get("department") or roles.get(original.get("employee_name"), {}).get("department"),
+            "level": task.get("level") or roles.get(original.get("employee_name"), {}).get("level"),
+        }
+        for task, original in zip(remapped, tasks) if task["employee_name"] is None
+    ]
+    for task, member in zip(orphans, assign_tasks(tags, team_roles)):
+        task["employee_name"] = team_roles[member]["name"] if member is not None else None
+    return remapped
+
+
+class SimilarPlan:
+    def __init__(self, signature: PlanSignature, similarity: float, tasks: List[Dict]):
+        self.signature = signature
+        self.similarity = similarity
+        self.tasks = tasks
+
+    @property
+    def description(self) -> str:
+        return self.signature.description
+
+    def to_dict(self) -> Dict:
+        return {
+            "project_id": self.signature.project_id,
+            "similarity": round(self.similarity, 3),
+        }
+
+
+def find_similar_plan(description: str, team_roles: List[Dict[str, str]],
+                      threshold: Optional[float] = None) -> Optional[SimilarPlan]:
+    """
+    The most similar indexed plan at or above the threshold, with its tasks remapped to
+    `team_roles`, or None.
+    """
+    if threshold is None:
+        threshold = float(os.getenv("KAGE_PLAN_REUSE_THRESHOLD", "0.8"))
+    limit = int(os.getenv("KAGE_PLAN_REUSE_CANDIDATES", "50"))
+    signature = minhash(shingles(description, team_roles))
+
+    candidate_ids = (
+        PlanSignatureBand.objects.filter(bucket__in=band_buckets(signature))
+        .values_list("signature_id", flat=True).distinct().order_by("-signature_id")[:limit]
+    )
+    best, best_similarity = None, threshold
+    for candidate in PlanSignature.objects.filter(id__in=list(candidate_ids)):
+        score = similarity(signature, json.loads(candidate.minhash))
+        if score >= best_similarity:
+            best, best_similarity = candidate, score
+
+    record_cache("plan_reuse", best is not None)
+    if best is None:
+        return None
+    tasks = remap_tasks(json.loads(best.plan), json.loads(best.team), team_roles)
+    return SimilarPlan(best, best_similarity, tasks)
+
+
+def index_plan(project, description: str, team_roles: List[Dict[str, str]], tasks: List[Dict]) -> PlanSignature:
+    return index_plans([(project, description, team_roles, tasks)])[0]
+
+
+def reindex_plan(project, description: str, team_roles: List[Dict[str, str]], tasks: List[Dict]) -> PlanSignature:
+    """
+    Replace the project's indexed plans after its plan changed (e.g. a re-plan), so a later
+    reuse copies the current tasks and is matched on the current description and team.
+    """
+    PlanSignature.objects.filter(project=project).delete()
+    return index_plan(project, description, team_roles, tasks)
+
+
+def index_plans(entries: Sequence[Tuple]) -> List[PlanSignature]:
+    """
+    Index several plans, given as (project, description, team_roles, tasks), with two bulk inserts.
+    """
+    signatures = [minhash(shingles(description, team_roles)) for _, description, team_roles, _ in entries]
+    plan_signatures = PlanSignature.objects.bulk_create([
+        PlanSignature(
+            project=project,
+            description=description,
+            team=json.dumps(team_roles),
+            plan=json.dumps(tasks),
+            minhash=json.dumps(signature),
+        )
+        for (project, description, team_roles, tasks), signature in zip(entries, signatures)
+    ])
+    PlanSignatureBand.objects.bulk_create([
+        PlanSignatureBand(signature=plan_signature, bucket=bucket)
+        for plan_signature, signature in zip(plan_signatures, signatures)
+        for bucket in band_buckets(signature)
+    ])
+    return plan_signatures
@@ -0,0 +1,193 @@
+"""
+Opt-in request profiling.
+
+ProfilingMiddleware runs a request under a profiler when the client sends
+`X-Kage-Profile: cprofile|sample` (honoured when PROFILING_ENABLED is on, by default only
+with DEBUG) or when the request is picked by PROFILING_SAMPLE_RATE. Two profilers are
+available:
+
+- "cprofile": deterministic, stored as a pstats report sorted by cumulative time
+- "sample": a background thread samples the request thread's stack every
+  PROFILING_INTERVAL_MS milliseconds and stores collapsed stacks
+  ("frame;frame;frame count" lines) ready for flamegraph.pl or speedscope
+
+Profiles are kept in a bounded in-process store (PROFILING_MAX_PROFILES) and served by the
+admin endpoints /profiles/ and /profiles/<id>/.
+"""
+import cProfile
+import io
+import itertools
+import logging
+import os
+import pstats
+import sys
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+PROFILE_MODES = ("cprofile", "sample")
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval from a background thread.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="kage-sampling-profiler", daemon=True)
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(self._frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+# cProfile hooks into the interpreter-wide profiling slot (sys.monitoring since Python 3.12), so
+# only one request per process can use it at a time
+_cprofile_lock = threading.Lock()
+
+
+def _run_sampled(fn: Callable, args, kwargs, interval: float) -> Tuple[object, Optional[str], Optional[str]]:
+    profiler = SamplingProfiler(threading.get_ident(), interval)
+    try:
+        profiler.start()
+    except Exception as e:
+        logger.warning(f"Sampling profiler unavailable, serving the request unprofiled: {e}")
+        return fn(*args, **kwargs), None, None
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        profiler.stop()
+    return result, profiler.collapsed(), "sample"
+
+
+def run_profiled(mode: str, fn: Callable, *args, interval: float = 0.005,
+                 **kwargs) -> Tuple[object, Optional[str], Optional[str]]:
+    """
+    Run fn(*args, **kwargs) under the given profiler and return (result, profile text, mode
+    used). While another request holds cProfile, "cprofile" falls back to the sampling
+    profiler. Profiler failures never fail the call: fn runs unprofiled and the profile text
+    and mode are None. Exceptions raised by fn itself propagate as usual.
+    """
+    if mode != "cprofile" or not _cprofile_lock.acquire(blocking=False):
+        return _run_sampled(fn, args, kwargs, interval)
+
+    try:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Another profiling tool (a debugger, coverage) holds the slot
+            logger.warning(f"cProfile unavailable, using the sampling profiler: {e}")
+            return _run_sampled(fn, args, kwargs, interval)
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+    finally:
+        _cprofile_lock.release()
+
+    try:
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(80)
+        return result, output.getvalue(), "cprofile"
+    except Exception as e:
+        logger.warning(f"Could not format the cProfile report: {e}")
+        return result, None, None
+
+
+class ProfileStore:
+    """
+    Keeps the most recent `max_profiles` profiles in memory.
+    """
+
+    def __init__(self, max_profiles: int = 50):
+        self.max_profiles = max_profiles
+        self._profiles: "OrderedDict[int, Dict]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, mode: str, method: str, path: str, route: str, status: int, duration_ms: float,
+            content: str, request_id: Optional[str] = None) -> int:
+        with self._lock:
+            profile_id = next(self._ids)
+            self._profiles[profile_id] = {
+                "id": profile_id,
+                "mode": mode,
+                "method": method,
+                "path": path,
+                "route": route,
+                "status": status,
+                "duration_ms": round(duration_ms, 3),
+                "request_id": request_id,
+                "created_at": datetime.now().isoformat(),
+                "content": content,
+            }
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def list(self) -> List[Dict]:
+        """
+        Return profile summaries (without content), newest first.
+        """
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return [{key: value for key, value in profile.items() if key != "content"} for profile in reversed(profiles)]
+
+    def get(self, profile_id: int) -> Optional[Dict]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_profile_store() -> ProfileStore:
+    """
+    Return the process-wide profile store.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ProfileStore(int(os.getenv("PROFILING_MAX_PROFILES", "50")))
+        return _store
+
+
+def profile_interval() -> float:
+    return float(os.getenv("PROFILING_INTERVAL_MS", "5")) / 1000
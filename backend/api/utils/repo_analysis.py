@@ -0,0 +1,327 @@
+"""
+Map-reduce analysis of large repositories for AI Assist.
+
+The single-prompt analysis only sees the first 100 KB of a repository. Map-reduce mode
+instead lists the whole tree in one GitHub call and splits the code files into chunks by
+module (directory prefix), summarizes the chunks in parallel model calls (map), and turns the
+summaries into the usual tasks / refactors JSON (reduce). If the summaries are too large for
+one reduce prompt, each module is condensed first. Wall-clock time is bounded by the map
+concurrency rather than the repository size.
+
+File summaries are stored per git blob SHA (FileSummary), so unchanged files are never
+fetched or summarized again, in this repository or any other containing the same file.
+
+Configuration (environment):
+
+- AI_ASSIST_CHUNK_DEPTH: path segments that define a module (default 2, e.g. "src/api")
+- AI_ASSIST_CHUNK_MAX_TOKENS: file content per map call, in estimated tokens (default 12000)
+- AI_ASSIST_CHUNK_MAX_FILES: files per map call (default 20)
+- AI_ASSIST_MAP_CONCURRENCY: parallel map calls (default 4)
+- AI_ASSIST_MIN_MAP_SUCCESS: fraction of map calls that must succeed for the analysis to be
+  reduced and recorded (default 0.5); an analysis where every map call failed always fails
+- AI_ASSIST_MAX_FILES: code files analyzed per repository (default 5000)
+"""
+import base64
+import contextvars
+import json
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from django.db import connection
+
+from ..models import FileSummary
+from .metrics import record_cache
+from .model_calls import call_model, call_model_with_continuation
+from .prompt_budget import enforce_budget, estimate_prompt, fit_items
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+FILE_HEADER = "### File: {path}"
+
+
+def module_of(path: str, depth: int) -> str:
+    """
+    The module a file belongs to: its first `depth` directories, or "." for top-level files.
+    """
+    directories = path.split("/")[:-1]
+    return "/".join(directories[:depth]) or "."
+
+
+def chunk_files(files: List[Dict], depth: int, max_tokens: int, max_files: int) -> List[List[Dict]]:
+    """
+    Split files (dicts with "path" and "size") into chunks that stay within one module and
+    within the token and file limits. Sizes are estimated at four bytes per token.
+    """
+    chunks, current, current_tokens, current_module = [], [], 0, None
+    for file in sorted(files, key=lambda item: item["path"]):
+        module = module_of(file["path"], depth)
+        tokens = min(file.get("size", 0) // 4 + 1, max_tokens)
+        if current and (module != current_module or current_tokens + tokens > max_tokens or len(current) >= max_files):
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(file)
+        current_tokens += tokens
+        current_module = module
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def read_blob(repo, sha: str, max_lines: int, max_chars: int) -> str:
+    """
+    Fetch a file version by blob SHA, truncated to `max_lines` lines and `max_chars` characters.
+    Raises UnicodeDecodeError for binary files.
+    """
+    blob = repo.get_git_blob(sha)
+    data = base64.b64decode(blob.content) if blob.encoding == "base64" else blob.content.encode("utf-8")
+    content = data.decode("utf-8")
+    lines = content.splitlines()
+    if len(lines) > max_lines:
+        content = "\n".join(lines[:max_lines])
+    return content[:max_chars]
+
+
+class MapReduceAnalyzer:
+    """
+    Runs the map-reduce analysis with the model, limits and JSON helpers of an AIAssist instance.
+    """
+
+    def __init__(self, assist):
+        self.assist = assist
+        self.depth = int(os.getenv("AI_ASSIST_CHUNK_DEPTH", "2"))
+        self.chunk_max_tokens = int(os.getenv("AI_ASSIST_CHUNK_MAX_TOKENS", "12000"))
+        self.chunk_max_files = int(os.getenv("AI_ASSIST_CHUNK_MAX_FILES", "20"))
+        self.concurrency = max(1, int(os.getenv("AI_ASSIST_MAP_CONCURRENCY", "4")))
+        self.min_map_success = float(os.getenv("AI_ASSIST_MIN_MAP_SUCCESS", "0.5"))
+        self.max_files = int(os.getenv("AI_ASSIST_MAX_FILES", "5000"))
+
+    def list_files(self, repo, ref: str) -> List[Dict]:
+        """
+        List the code files at `ref` with their blob SHAs and sizes in a single tree request.
+        """
+        tree = repo.get_git_tree(ref, recursive=True)
+        files = [
+            {"path": element.path, "sha": element.sha, "size": element.size or 0}
+            for element in tree.tree
+            if element.type == "blob" and self.assist.is_code_file(element.path)
+        ]
+        if len(files) > self.max_files:
+            logger.warning(f"Analyzing the first {self.max_files} of {len(files)} code files")
+            files = sorted(files, key=lambda item: item["path"])[:self.max_files]
+        return files
+
+    def cached_summaries(self, files: List[Dict]) -> Dict[str, str]:
+        """
+        Return {blob sha: summary} for the files summarized before.
+        """
+        shas = {file["sha"] for file in files}
+        cached = dict(
+            FileSummary.objects.filter(blob_sha__in=shas, model_name=self.assist.model_name)
+            .values_list("blob_sha", "summary")
+        )
+        for file in files:
+            record_cache("file_summary", file["sha"] in cached)
+        return cached
+
+    def read_blob(self, repo, sha: str) -> str:
+        return read_blob(repo, sha, self.assist.max_lines_per_file, self.chunk_max_tokens * 4)
+
+    def create_map_prompt(self, repo_name: str, module: str, files: List[Dict]) -> str:
+        sections = "\n\n".join(f"{FILE_HEADER.format(path=file['path'])}\n{file['content']}" for file in files)
+        return f"""
+        You are an expert software engineer. Summarize each file of the "{module}" module of the repository "{repo_name}".
+
+        **Files to Summarize:**
+{sections}
+
+        **Instructions:**
+        1. For every file, write a summary of at most three sentences: its purpose, its main components and any problems you notice (bugs, missing tests, duplication, poor structure).
+        2. Respond with JSON only, without Markdown indicators, in the form:
+        {{"files": [{{"path": "src/app.py", "summary": "..."}}]}}
+        """
+
+    def summarize_chunk(self, repo, repo_name: str, chunk: List[Dict]) -> Dict[str, str]:
+        """
+        Map step: fetch the chunk's files and summarize them in one model call.
+        Returns {blob sha: summary}.
+        """
+        module = module_of(chunk[0]["path"], self.depth)
+        with get_tracer().start_as_current_span(
+            "ai_assist.map_chunk", attributes={"chunk.module": module, "chunk.files": len(chunk)}
+        ):
+            files = []
+            for file in chunk:
+                try:
+                    files.append({**file, "content": self.read_blob(repo, file["sha"])})
+                except UnicodeDecodeError:
+                    logger.warning(f"Skipping binary file: {file['path']}")
+            if not files:
+                return {}
+
+            prompt = self.create_map_prompt(repo_name, module, files)
+            enforce_budget("ai_assist.map", prompt, self.assist.max_output_tokens)
+            # Summaries cut off by the output token limit are continued rather than failing the chunk
+            response_text = call_model_with_continuation(
+                "ai_assist.map", self.assist.model, prompt,
+                generation_config={"temperature": 0.2, "max_output_tokens": self.assist.max_output_tokens},
+            )
+            summaries = json.loads(self.assist.sanitize_json_content(response_text)).get("files", [])
+            sha_by_path = {file["path"]: file["sha"] for file in files}
+            return {
+                sha_by_path[entry["path"]]: entry["summary"]
+                for entry in summaries
+                if entry.get("path") in sha_by_path and entry.get("summary")
+            }
+
+    def map_chunks(self, repo, repo_name: str, chunks: List[List[Dict]]) -> Tuple[Dict[str, str], int]:
+        """
+        Summarize the chunks with at most `concurrency` calls in flight. A failed chunk is
+        logged and leaves its files unsummarized; returns the summaries and the number of
+        failed chunks, which `analyze` checks against AI_ASSIST_MIN_MAP_SUCCESS.
+        """
+        def run(chunk):
+            try:
+                return self.summarize_chunk(repo, repo_name, chunk)
+            except Exception as e:
+                logger.warning(f"Map step failed for {module_of(chunk[0]['path'], self.depth)}: {e}")
+                return None
+            finally:
+                # Django only closes the request thread's connection; close the pool thread's own
+                connection.close()
+
+        summaries, failed = {}, 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            # Each task runs in a copy of the caller's context so its spans join the request trace
+            futures = [executor.submit(contextvars.copy_context().run, run, chunk) for chunk in chunks]
+            for future in futures:
+                result = future.result()
+                if result is None:
+                    failed += 1
+                else:
+                    summaries.update(result)
+        return summaries, failed
+
+    def create_reduce_prompt(self, repo_name: str, modules: "OrderedDict[str, str]", omitted: int = 0) -> str:
+        sections = "\n\n".join(f"#### {module}\n{summary}" for module, summary in modules.items())
+        if omitted:
+            sections += f"\n\n... and {omitted} more modules, omitted to fit the prompt budget"
+        return f"""
+        You are an expert software engineer and repository analyzer. Your task is to analyze the repository "{repo_name}" from summaries of its modules and files, and provide insights.
+
+        **Module Summaries:**
+{sections}
+
+        **Instructions:**
+        1. Identify potential tasks that can be done to improve this repository.
+        2. Suggest refactors or improvements for the codebase.
+        3. Provide your response in a structured JSON format with two keys:
+           - "tasks": A list of tasks with descriptions.
+           - "refactors": A list of suggested refactors with explanations.
+
+        **Example Output:**
+        {{
+            "tasks": [
+                {{"description": "Add unit tests for critical modules."}}
+            ],
+            "refactors": [
+                {{"description": "Refactor the authentication module to use middleware."}}
+            ]
+        }}
+        """
+
+    def condense_module(self, repo_name: str, module: str, summary: str) -> str:
+        prompt = f"""
+        You are an expert software engineer. Condense the file summaries below into one paragraph describing the "{module}" module of the repository "{repo_name}", keeping every problem they mention.
+
+        **Summarize Module:** {module}
+{summary}
+        """
+        response = call_model(
+            "ai_assist.reduce", self.assist.model.generate_content, prompt,
+            generation_config={"temperature": 0.2, "max_output_tokens": 512},
+        )
+        return response.text.strip()
+
+    def reduce(self, repo_name: str, files: List[Dict], summaries: Dict[str, str]) -> Dict:
+        """
+        Reduce step: group the file summaries by module and ask for tasks and refactors,
+        condensing each module first when the whole set does not fit one prompt.
+        """
+        modules = OrderedDict()
+        for file in sorted(files, key=lambda item: item["path"]):
+            if file["sha"] in summaries:
+                line = f"- {file['path']}: {summaries[file['sha']]}"
+                module = module_of(file["path"], self.depth)
+                modules[module] = f"{modules[module]}\n{line}" if module in modules else line
+
+        tracer = get_tracer()
+        with tracer.start_as_current_span("ai_assist.reduce", attributes={"reduce.modules": len(modules)}) as span:
+            prompt = self.create_reduce_prompt(repo_name, modules)
+            if not estimate_prompt("ai_assist.reduce", prompt, self.assist.max_output_tokens).within_budget:
+                span.set_attribute("reduce.condensed", True)
+
+                def condense(module, summary):
+                    try:
+                        return self.condense_module(repo_name, module, summary)
+                    finally:
+                        connection.close()
+
+                with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                    futures = [
+                        executor.submit(contextvars.copy_context().run, condense, module, summary)
+                        for module, summary in modules.items()
+                    ]
+                    modules = OrderedDict(zip(modules, [future.result() for future in futures]))
+
+            items = list(modules.items())
+            prompt, _, _ = fit_items(
+                "ai_assist.reduce", items,
+                lambda kept, omitted: self.create_reduce_prompt(repo_name, OrderedDict(kept), omitted),
+                self.assist.max_output_tokens,
+            )
+            response_text = call_model_with_continuation(
+                "ai_assist.reduce", self.assist.model, prompt,
+                generation_config={"temperature": 0.2, "max_output_tokens": self.assist.max_output_tokens},
+            )
+            return json.loads(self.assist.sanitize_json_content(response_text))
+
+    def analyze(self, repo, repo_name: str, ref: str) -> Dict:
+        tracer = get_tracer()
+        with tracer.start_as_current_span("ai_assist.list_files") as span:
+            files = self.list_files(repo, ref)
+            span.set_attribute("repo.files", len(files))
+
+        summaries = self.cached_summaries(files)
+        missing = [file for file in files if file["sha"] not in summaries]
+        chunks = chunk_files(missing, self.depth, self.chunk_max_tokens, self.chunk_max_files)
+        logger.info(f"{repo_name}: {len(files)} files, {len(files) - len(missing)} cached, {len(chunks)} chunks to map")
+
+        new_summaries, failed = self.map_chunks(repo, repo_name, chunks)
+        path_by_sha = {file["sha"]: file["path"] for file in missing}
+        # Summaries of the chunks that did succeed are kept so a retry only maps the rest
+        FileSummary.objects.bulk_create(
+            [FileSummary(blob_sha=sha, model_name=self.assist.model_name, path=path_by_sha[sha], summary=summary)
+             for sha, summary in new_summaries.items()],
+            ignore_conflicts=True,
+        )
+        if chunks and (failed == len(chunks) or (len(chunks) - failed) / len(chunks) < self.min_map_success):
+            # A reduce over a fraction of the repository would be recorded, and later diffed
+            # against, as if it were a complete analysis
+            raise RuntimeError(
+                f"Map step failed for {failed} of {len(chunks)} chunks of {repo_name}; the analysis was not recorded."
+            )
+        summaries.update(new_summaries)
+
+        result = self.reduce(repo_name, files, summaries)
+        result["coverage"] = {
+            "files": len(files),
+            "summarized": sum(1 for file in files if file["sha"] in summaries),
+            "cached": len(files) - len(missing),
+            "chunks": len(chunks),
+            "failed_chunks": failed,
+        }
+        return result
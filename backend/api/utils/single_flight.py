@@ -0,0 +1,187 @@
+"""
+Single-flight coalescing of identical in-flight AI requests.
+
+When several users ask for the same repository analysis or the same JSON changes at once,
+the first request (the leader) does the work and the duplicates wait for its result instead
+of repeating the GitHub crawl and the model call. Requests are identified by
+`coalescing_key`, built from the normalized inputs: operation, repository URL, head commit
+SHA and task text.
+
+- "memory" (default): duplicates within one worker process share the leader's call
+- "database": additionally coordinates across processes through an InFlightRequest lease
+  row. Other processes poll it and reuse the stored JSON result, and a lease left by a
+  crashed worker expires. Results must be JSON serializable.
+- "none": no coalescing
+
+Configuration (environment):
+
+- SINGLE_FLIGHT_BACKEND: "memory", "database" or "none"
+- SINGLE_FLIGHT_TIMEOUT: seconds a duplicate waits for the leader (default 300)
+- SINGLE_FLIGHT_LEASE: seconds before another process may take over a running request (default 300)
+- SINGLE_FLIGHT_RESULT_TTL: seconds a finished result is reused by late duplicates (default 30)
+- SINGLE_FLIGHT_POLL_INTERVAL: seconds between lease checks in the database backend (default 0.5)
+"""
+import hashlib
+import json
+import os
+import re
+import socket
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, Tuple
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from ..models import InFlightRequest
+from .metrics import record_cache
+
+
+def coalescing_key(operation: str, repo_url: str, head_sha: str, *parts: str) -> str:
+    """
+    Key for a request: repository URLs are compared case-insensitively without a trailing
+    slash or ".git", and extra parts (task text, mode) with whitespace collapsed.
+    """
+    repo = re.sub(r"(\.git)?/*$", "", repo_url.strip().lower())
+    normalized = [" ".join(str(part).split()) for part in parts]
+    return "\n".join([operation, repo, head_sha, *normalized])
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key within the process.
+    """
+
+    def __init__(self, timeout: float = 300.0):
+        self.timeout = timeout
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Run `fn(*args, **kwargs)` unless a call with the same key is in flight, in which case
+        wait for it. Returns (result, shared); the leader's exception is raised to every caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            record_cache("single_flight", True)
+            if not call.done.wait(self.timeout):
+                raise TimeoutError(f"Timed out after {self.timeout:.0f}s waiting for an identical request.")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result, shared = self.run(key, fn, args, kwargs)
+            return call.result, shared
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def run(self, key: str, fn: Callable, args, kwargs) -> Tuple[Any, bool]:
+        record_cache("single_flight", False)
+        return fn(*args, **kwargs), False
+
+
+class DatabaseSingleFlight(SingleFlight):
+    """
+    Coalesces within the process, then across processes with a lease row per key.
+    """
+
+    def __init__(self, timeout: float = 300.0, lease: float = 300.0, result_ttl: float = 30.0, poll_interval: float = 0.5):
+        super().__init__(timeout)
+        self.lease = lease
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"[:64]
+
+    def run(self, key: str, fn: Callable, args, kwargs) -> Tuple[Any, bool]:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        deadline = time.monotonic() + self.timeout
+        while True:
+            now = timezone.now()
+            # Expired leases (crashed leaders) and results past their reuse window
+            InFlightRequest.objects.filter(key=digest, expires_at__lt=now).delete()
+            try:
+                with transaction.atomic():
+                    InFlightRequest.objects.create(
+                        key=digest, owner=self.owner, status="running", expires_at=now + timedelta(seconds=self.lease)
+                    )
+                break
+            except IntegrityError:
+                pass
+
+            row = InFlightRequest.objects.filter(key=digest).values("status", "result", "error").first()
+            if row and row["status"] == "done":
+                record_cache("single_flight", True)
+                return json.loads(row["result"]), True
+            if row and row["status"] == "failed":
+                record_cache("single_flight", True)
+                raise ValueError(row["error"])
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Timed out after {self.timeout:.0f}s waiting for an identical request.")
+            time.sleep(self.poll_interval)
+
+        record_cache("single_flight", False)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._finish(digest, status="failed", error=str(e))
+            raise
+        self._finish(digest, status="done", result=json.dumps(result))
+        return result, False
+
+    def _finish(self, digest: str, **fields):
+        InFlightRequest.objects.filter(key=digest, owner=self.owner).update(
+            expires_at=timezone.now() + timedelta(seconds=self.result_ttl), **fields
+        )
+
+
+class NoSingleFlight:
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        return fn(*args, **kwargs), False
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def build_single_flight():
+    backend = os.getenv("SINGLE_FLIGHT_BACKEND", "memory")
+    timeout = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "300"))
+    if backend == "none":
+        return NoSingleFlight()
+    if backend == "database":
+        return DatabaseSingleFlight(
+            timeout=timeout,
+            lease=float(os.getenv("SINGLE_FLIGHT_LEASE", "300")),
+            result_ttl=float(os.getenv("SINGLE_FLIGHT_RESULT_TTL", "30")),
+            poll_interval=float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", "0.5")),
+        )
+    return SingleFlight(timeout=timeout)
+
+
+def get_single_flight():
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = build_single_flight()
+    return _single_flight
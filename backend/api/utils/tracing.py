@@ -0,0 +1,272 @@
+"""
+Per-request tracing with an OpenTelemetry-compatible API.
+
+Code creates spans with `get_tracer().start_as_current_span(name, attributes={...})` and
+calls `set_attribute` / `record_exception` on them, which is the OpenTelemetry tracer API,
+so the backend can be swapped without touching call sites. TRACING_BACKEND selects it:
+
+- "memory" (default): finished traces are kept in a bounded in-memory buffer and served at /traces/;
+  both the number of traces and the spans kept per trace are capped
+- "console": every finished span is logged as one JSON line
+- "opentelemetry": delegate to `opentelemetry.trace` (install and configure the SDK / exporter yourself)
+- "none": spans are created but not exported
+
+Trace and span ids use the W3C trace-context format, and an incoming `traceparent` header
+continues the caller's trace.
+"""
+import contextvars
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("kage_current_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, attributes: Optional[Dict] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.events: List[Dict] = []
+        self.status = "UNSET"
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict):
+        self.attributes.update(attributes)
+
+    def update_name(self, name: str):
+        self.name = name
+
+    def add_event(self, name: str, attributes: Optional[Dict] = None):
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": dict(attributes or {})})
+
+    def record_exception(self, exception: BaseException):
+        self.status = "ERROR"
+        self.add_event("exception", {"exception.type": type(exception).__name__, "exception.message": str(exception)})
+
+    def end(self):
+        if self.end_time_ns is None:
+            self.end_time_ns = time.time_ns()
+            if self.status == "UNSET":
+                self.status = "OK"
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_time_ns or time.time_ns()
+        return (end - self.start_time_ns) / 1e6
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "start_time_unix_nano": self.start_time_ns,
+            "end_time_unix_nano": self.end_time_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+            "events": self.events,
+        }
+
+
+class InMemorySpanExporter:
+    """
+    Keeps the spans of the most recent `max_traces` traces, at most `max_spans_per_trace` each.
+    A trace over the cap (e.g. a long batch job with thousands of DB queries) keeps its most
+    recently finished spans, so the root span, which ends last, is never lost; the others
+    are counted as dropped.
+    """
+
+    def __init__(self, max_traces: int = 100, max_spans_per_trace: int = 500):
+        self.max_traces = max_traces
+        self.max_spans_per_trace = max_spans_per_trace
+        self.dropped_spans = 0
+        self._traces: "OrderedDict[str, deque]" = OrderedDict()
+        self._dropped: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = deque(maxlen=self.max_spans_per_trace)
+            if len(spans) == spans.maxlen:
+                self._dropped[span.trace_id] = self._dropped.get(span.trace_id, 0) + 1
+                self.dropped_spans += 1
+            spans.append(span)
+            self._traces.move_to_end(span.trace_id)
+            while len(self._traces) > self.max_traces:
+                trace_id, _ = self._traces.popitem(last=False)
+                self._dropped.pop(trace_id, None)
+
+    def get_traces(self) -> Dict[str, List[Dict]]:
+        with self._lock:
+            traces = {trace_id: list(spans) for trace_id, spans in self._traces.items()}
+        return {
+            trace_id: sorted((span.to_dict() for span in spans), key=lambda span: span["start_time_unix_nano"])
+            for trace_id, spans in reversed(list(traces.items()))
+        }
+
+    def get_dropped_spans(self) -> Dict[str, int]:
+        """
+        Number of spans dropped per kept trace, for the traces that hit the span cap.
+        """
+        with self._lock:
+            return dict(self._dropped)
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+            self._dropped.clear()
+
+
+class ConsoleSpanExporter:
+    """
+    Logs every finished span as a single JSON line.
+    """
+
+    def export(self, span: Span):
+        logger.info(json.dumps(span.to_dict(), default=str))
+
+
+class NoopSpanExporter:
+    def export(self, span: Span):
+        pass
+
+
+class Tracer:
+    def __init__(self, exporter):
+        self.exporter = exporter
+
+    @contextmanager
+    def start_as_current_span(self, name: str, attributes: Optional[Dict] = None, trace_parent: Optional[str] = None):
+        """
+        Start a span as a child of the current span (or of `trace_parent`, a W3C traceparent
+        header value) and make it current for the duration of the block.
+        """
+        parent = _current_span.get()
+        trace_id, parent_id = (parent.trace_id, parent.span_id) if parent else (None, None)
+        if parent is None and trace_parent:
+            trace_id, parent_id = parse_traceparent(trace_parent)
+        span = Span(name, trace_id or secrets.token_hex(16), parent_id, attributes)
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+            try:
+                self.exporter.export(span)
+            except Exception as e:
+                logger.warning(f"Failed to export span {span.name}: {e}")
+
+
+def parse_traceparent(header: str):
+    """
+    Return (trace_id, parent_span_id) from a W3C traceparent header, or (None, None) if invalid.
+    """
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+
+def format_traceparent(span) -> str:
+    """
+    Return the W3C traceparent header value identifying `span` (ours or an opentelemetry span).
+    """
+    if hasattr(span, "get_span_context"):
+        span_context = span.get_span_context()
+        return f"00-{span_context.trace_id:032x}-{span_context.span_id:016x}-01"
+    return f"00-{span.trace_id}-{span.span_id}-01"
+
+
+class OpenTelemetryTracer:
+    """
+    Adapter giving an opentelemetry tracer the same `trace_parent` argument as Tracer.
+    """
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+    @contextmanager
+    def start_as_current_span(self, name: str, attributes: Optional[Dict] = None, trace_parent: Optional[str] = None):
+        from opentelemetry.propagate import extract
+
+        context = extract({"traceparent": trace_parent}) if trace_parent else None
+        with self.tracer.start_as_current_span(name, context=context, attributes=attributes) as span:
+            yield span
+
+
+def get_current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def build_tracer():
+    backend = os.getenv("TRACING_BACKEND", "memory")
+    if backend == "opentelemetry":
+        from opentelemetry import trace
+
+        return OpenTelemetryTracer(trace.get_tracer("kage"))
+    if backend == "console":
+        return Tracer(ConsoleSpanExporter())
+    if backend == "none":
+        return Tracer(NoopSpanExporter())
+    return Tracer(InMemorySpanExporter(
+        int(os.getenv("TRACING_MAX_TRACES", "100")),
+        int(os.getenv("TRACING_MAX_SPANS_PER_TRACE", "500")),
+    ))
+
+
+def get_tracer():
+    """
+    Return the process-wide tracer, built from TRACING_BACKEND on first use.
+    """
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = build_tracer()
+        return _tracer
+
+
+def get_recent_traces() -> Optional[Dict[str, List[Dict]]]:
+    """
+    Return recent traces, newest first, or None when the active backend does not keep them.
+    """
+    exporter = getattr(get_tracer(), "exporter", None)
+    if not isinstance(exporter, InMemorySpanExporter):
+        return None
+    return exporter.get_traces()
+
+
+def get_dropped_span_counts() -> Dict[str, int]:
+    """
+    Return the number of spans dropped per recent trace by the in-memory span cap.
+    """
+    exporter = getattr(get_tracer(), "exporter", None)
+    if not isinstance(exporter, InMemorySpanExporter):
+        return {}
+    return exporter.get_dropped_spans()
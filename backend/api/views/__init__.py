@@ -3,4 +3,8 @@ from .project import *
 from .ai import *
 from .gcp import *
 from .task import *
-from .github import *
\ No newline at end of file
+from .github import *
+from .artifact import *
+from .metrics import *
+from .tracing import *
+from .profiling import *
\ No newline at end of file
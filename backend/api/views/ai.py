@@ -1,17 +1,22 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django.http import JsonResponse
-from vertexai.preview.generative_models import GenerativeModel
-import vertexai
-from google.cloud import aiplatform
-from google import genai
-from google.genai import types
-from ..utils.kage import Kage
+from django.db import connection, transaction
+from django.shortcuts import get_object_or_404
+from ..utils.kage import Kage, apply_plan_delta
+from ..utils.model_scheduler import call_priority
+from ..utils.assignment import assign_tasks
+from ..utils.plan_similarity import find_similar_plan, index_plan, index_plans, reindex_plan, reuse_mode
 import json
+import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from ..models import Project, Task, Employee
 from ..utils.code_optimizer import CodeOptimizer
 from ..utils.ai_assist import AIAssist
+from ..utils.prompt_budget import PromptBudgetExceeded
+from ..utils.single_flight import coalescing_key, get_single_flight
 
 load_dotenv()
 
@@ -26,6 +31,11 @@ load_dotenv()
 
 @api_view(['POST'])
 def generate_project_plan(request):
+    """
+    Generate a project plan with Kage and save the project, its team and tasks. With "reuse"
+    ("offer" or "adapt", default KAGE_PLAN_REUSE) a near-duplicate past plan is reused
+    instead: as is, or updated for the new description with a re-plan (delta) prompt.
+    """
     try:
         # Parse the input data from the request body
         data = json.loads(request.body)
@@ -40,13 +50,35 @@ def generate_project_plan(request):
         ):
             return JsonResponse({"error": "'team_roles' must be a list of objects with 'name', 'level', and 'department'."}, status=400)
 
-        # Initialize the Kage class and generate the project plan
+        try:
+            reuse = reuse_mode(data.get("reuse"))
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        # Initialize the Kage class and generate the project plan, unless a similar plan can be reused
         kage = Kage()
-        kage_project_plan = kage.generate_project_plan(
-            project_name=project_name,
-            project_description=project_description,
-            team_roles=team_roles
-        )
+        similar = find_similar_plan(project_description, team_roles) if reuse != "off" and project_description else None
+        reused = None
+        if similar is None:
+            kage_project_plan = kage.generate_project_plan(
+                project_name=project_name,
+                project_description=project_description,
+                team_roles=team_roles
+            )
+        else:
+            kage_project_plan = {"tasks": similar.tasks}
+            reused = {**similar.to_dict(), "mode": "offer"}
+            if reuse == "adapt" and " ".join(similar.description.split()) != " ".join(project_description.split()):
+                # The remapped tasks already fit the new team, so only the description changed
+                delta = kage.generate_plan_delta(
+                    project_name=project_name,
+                    project_description=project_description,
+                    tasks=similar.tasks,
+                    team_roles=team_roles,
+                    previous_description=similar.description,
+                )
+                kage_project_plan = {"tasks": apply_plan_delta(similar.tasks, delta)}
+                reused["mode"] = "adapt"
 
         # Save the project to the database
         project = Project.objects.create(name=project_name, description=project_description)
@@ -72,12 +104,290 @@ def generate_project_plan(request):
                 project=project,
                 employee=assigned_employee,  # Associate the employee with the task
                 description=task.get("description", ""),
-                status="to-do"
+                status="to-do",
+                department=task.get("department"),
+                level=task.get("level"),
             )
 
+        # Index new plans for near-duplicate reuse; a plan reused as is is already indexed
+        if reused is None or reused["mode"] == "adapt":
+            index_plan(project, project_description, team_roles, kage_project_plan.get("tasks", []))
+
         # Return the generated project plan as a JSON response
-        return JsonResponse({"message": "Project and employees created successfully."}, status=200)
+        response = {"message": "Project and employees created successfully."}
+        if reused:
+            response["reused_plan"] = reused
+        return JsonResponse(response, status=200)
+
+    except PromptBudgetExceeded as e:
+        return JsonResponse({"error": str(e), "estimate": e.estimate.to_dict()}, status=413)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+def generate_batch_item(spec):
+    """
+    Generate the plan of one batch item as a background ("batch" priority) model call. Each
+    item gets its own Kage, which keeps per-request prompt state. Runs on a pool thread, whose
+    DB connection is closed afterwards since Django only closes the request thread's.
+    """
+    try:
+        with call_priority("batch"):
+            return Kage().generate_project_plan(
+                project_name=spec["project_name"],
+                project_description=spec["project_description"],
+                team_roles=spec["team_roles"],
+            )
+    finally:
+        connection.close()
+
+
+@api_view(['POST'])
+def generate_project_plans_batch(request):
+    """
+    Generate and save the plans of many projects at once. Plans are generated with at most
+    KAGE_BATCH_CONCURRENCY model calls at a time (or "concurrency" in the body, up to that
+    limit), and all successful projects, teams and tasks are saved with bulk queries in one
+    transaction. Returns the status of every item; one failed item does not fail the batch.
+    """
+    try:
+        data = json.loads(request.body)
+        specs = data.get("projects")
+        max_items = int(os.getenv("KAGE_BATCH_MAX_ITEMS", "100"))
+        if not isinstance(specs, list) or not specs:
+            return JsonResponse({"error": "'projects' must be a non-empty list of project specs."}, status=400)
+        if len(specs) > max_items:
+            return JsonResponse({"error": f"At most {max_items} projects can be generated per batch."}, status=400)
+        max_concurrency = int(os.getenv("KAGE_BATCH_CONCURRENCY", "4"))
+        concurrency = data.get("concurrency")
+        if concurrency is None:
+            concurrency = max_concurrency
+        elif isinstance(concurrency, bool) or not isinstance(concurrency, int) or concurrency < 1:
+            return JsonResponse({"error": "'concurrency' must be a positive integer."}, status=400)
+        concurrency = min(concurrency, max(1, max_concurrency))
+
+        results = [
+            {"index": index, "project_name": spec.get("project_name") if isinstance(spec, dict) else None, "status": "pending"}
+            for index, spec in enumerate(specs)
+        ]
+        valid = []
+        for index, spec in enumerate(specs):
+            team_roles = spec.get("team_roles", []) if isinstance(spec, dict) else None
+            if not isinstance(spec, dict) or not spec.get("project_name") or not spec.get("project_description"):
+                results[index].update(status="failed", error="'project_name' and 'project_description' are required.")
+            elif not isinstance(team_roles, list) or not all(
+                isinstance(role, dict) and {"name", "level", "department"}.issubset(role) for role in team_roles
+            ):
+                results[index].update(status="failed", error="'team_roles' must be a list of objects with 'name', 'level', and 'department'.")
+            else:
+                valid.append((index, {**spec, "team_roles": team_roles}))
+
+        plans = {}
+        if valid:
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(valid))) as executor:
+                # Each plan runs in a copy of the request context (tenant, trace) at batch priority
+                futures = {
+                    index: executor.submit(contextvars.copy_context().run, generate_batch_item, spec)
+                    for index, spec in valid
+                }
+                for index, future in futures.items():
+                    try:
+                        plans[index] = future.result()
+                    except Exception as e:
+                        results[index].update(status="failed", error=str(e))
+
+        generated = [(index, spec) for index, spec in valid if index in plans]
+        with transaction.atomic():
+            projects = Project.objects.bulk_create([
+                Project(name=spec["project_name"], description=spec["project_description"]) for _, spec in generated
+            ])
+
+            # Employees are matched on name, level and department, like get_or_create in /ai/generate
+            role_keys = {(role["name"], role["level"], role["department"]) for _, spec in generated for role in spec["team_roles"]}
+            employees = {}
+            for employee in Employee.objects.filter(name__in={key[0] for key in role_keys}).order_by('id'):
+                employees.setdefault((employee.name, employee.level, employee.department), employee)
+            missing = [key for key in role_keys if key not in employees]
+            for employee in Employee.objects.bulk_create(
+                [Employee(name=name, level=level, department=department) for name, level, department in missing]
+            ):
+                employees[(employee.name, employee.level, employee.department)] = employee
+
+            memberships, tasks = [], []
+            for project, (index, spec) in zip(projects, generated):
+                team = {}
+                for role in spec["team_roles"]:
+                    employee = employees[(role["name"], role["level"], role["department"])]
+                    team.setdefault(employee.name, employee)
+                memberships.extend(
+                    Project.employees.through(project_id=project.id, employee_id=employee.id)
+                    for employee in {employee.id: employee for employee in team.values()}.values()
+                )
+                plan_tasks = plans[index].get("tasks", [])
+                tasks.extend(
+                    Task(
+                        project=project,
+                        employee=team.get(task.get("employee_name")),
+                        description=task.get("description", ""),
+                        status="to-do",
+                        department=task.get("department"),
+                        level=task.get("level"),
+                    )
+                    for task in plan_tasks
+                )
+                results[index].update(status="created", project_id=project.id, tasks=len(plan_tasks))
+            Project.employees.through.objects.bulk_create(memberships)
+            Task.objects.bulk_create(tasks)
+            index_plans([
+                (project, spec["project_description"], spec["team_roles"], plans[index].get("tasks", []))
+                for project, (index, spec) in zip(projects, generated)
+            ])
+
+        created = sum(1 for result in results if result["status"] == "created")
+        return JsonResponse({
+            "message": f"Created {created} of {len(specs)} projects.",
+            "results": results,
+        }, status=200)
+
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@api_view(['POST'])
+def replan_project(request, project_id):
+    """
+    Update an existing project's plan after its description or team changed, instead of
+    generating a new project. Kage is sent the current tasks and the changes and returns only
+    the added, modified and removed tasks, which are applied with bulk queries in one
+    transaction. Omitted fields keep their current value.
+    """
+    try:
+        data = json.loads(request.body or "{}")
+        project = get_object_or_404(Project, id=project_id)
+
+        previous_team = [
+            {"name": e.name, "level": e.level, "department": e.department} for e in project.employees.order_by('id')
+        ]
+        project_description = data.get("project_description") or project.description or ""
+        team_roles = data.get("team_roles", previous_team)
+        if not isinstance(team_roles, list) or not all(
+            isinstance(role, dict) and {"name", "level", "department"}.issubset(role) for role in team_roles
+        ):
+            return JsonResponse({"error": "'team_roles' must be a list of objects with 'name', 'level', and 'department'."}, status=400)
+
+        def team_key(roles):
+            return sorted((role["name"], role["level"], role["department"]) for role in roles)
 
+        if project_description == project.description and team_key(team_roles) == team_key(previous_team):
+            return JsonResponse({"message": "Nothing changed; the plan is up to date.", "added": [], "modified": [], "removed": []}, status=200)
+
+        tasks = {task.id: task for task in project.tasks.select_related('employee').order_by('id')}
+        delta = Kage().generate_plan_delta(
+            project_name=project.name,
+            project_description=project_description,
+            tasks=[
+                {
+                    "task_id": task.id,
+                    "description": task.description,
+                    "employee_name": task.employee.name if task.employee else None,
+                    "status": task.status,
+                    "department": task.department,
+                    "level": task.level,
+                }
+                for task in tasks.values()
+            ],
+            team_roles=team_roles,
+            previous_description=project.description,
+            previous_team_roles=previous_team,
+        )
+
+        with transaction.atomic():
+            if project_description != project.description:
+                project.description = project_description
+                project.save(update_fields=['description'])
+
+            employees = [
+                Employee.objects.get_or_create(name=role["name"], level=role["level"], department=role["department"])[0]
+                for role in team_roles
+            ]
+            project.employees.set(employees)
+            employees_by_name = {employee.name: employee for employee in employees}
+
+            removed = set(delta["removed"])
+            Task.objects.filter(project=project, id__in=removed).delete()
+
+            changed = {}
+            for change in delta["modified"]:
+                task = tasks[change["task_id"]]
+                task.description = change["description"]
+                task.employee = employees_by_name.get(change["employee_name"]) or task.employee
+                # Changes from a model-assigned plan carry no role tags; keep the stored ones
+                task.department = change["department"] or task.department
+                task.level = change["level"] or task.level
+                changed[task.id] = task
+            added = [
+                Task(
+                    project=project,
+                    employee=employees_by_name.get(change["employee_name"]),
+                    description=change["description"],
+                    status="to-do",
+                    department=change["department"],
+                    level=change["level"],
+                )
+                for change in delta["added"]
+            ]
+
+            # Open tasks left with someone outside the new team (a removed member the model did not
+            # reassign, or a name it made up) are assigned locally, from their tags or old assignee's role
+            team_ids = {employee.id for employee in employees}
+            stranded = [
+                task for task in [*tasks.values(), *added]
+                if task.id not in removed and task.status != 'done' and task.employee_id not in team_ids
+            ]
+            assignment = assign_tasks([
+                {
+                    "department": task.department or (task.employee.department if task.employee else None),
+                    "level": task.level or (task.employee.level if task.employee else None),
+                }
+                for task in stranded
+            ], team_roles)
+            for task, index in zip(stranded, assignment):
+                task.employee = employees[index] if index is not None else None
+                if task.id is not None:
+                    changed[task.id] = task
+
+            modified = list(changed.values())
+            Task.objects.bulk_update(modified, ['description', 'employee', 'department', 'level'])
+            added = Task.objects.bulk_create(added)
+
+            # The indexed plan would otherwise keep offering the pre-re-plan tasks for reuse. It is
+            # stored in the shape generate_project_plan returns, which an "adapt" reuse re-plans
+            reindex_plan(project, project_description, team_roles, [
+                {
+                    "task_id": task_id,
+                    "description": task.description,
+                    "employee_name": task.employee.name if task.employee else None,
+                    "department": task.department,
+                    "level": task.level,
+                    "status": task.status,
+                }
+                for task_id, task in enumerate((task for task in [*tasks.values(), *added] if task.id not in removed), start=1)
+            ])
+
+        def task_summary(task):
+            return {
+                "task_id": task.id,
+                "description": task.description,
+                "employee_name": task.employee.name if task.employee else None,
+            }
+
+        return JsonResponse({
+            "message": f"Added {len(added)}, modified {len(modified)} and removed {len(delta['removed'])} tasks.",
+            "added": [task_summary(task) for task in added],
+            "modified": [task_summary(task) for task in modified],
+            "removed": sorted(removed),
+        }, status=200)
+
+    except PromptBudgetExceeded as e:
+        return JsonResponse({"error": str(e), "estimate": e.estimate.to_dict()}, status=413)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -93,6 +403,9 @@ def ai_chat(request):
         )
         print(response.text, end="")
 
+        # Imported lazily: the AI Platform SDK takes over a second to import
+        from google.cloud import aiplatform
+
         # Initialize the Vertex AI client with your project and location
         aiplatform.init(project='centered-accord-442214-b9', location='us-central1')
 
@@ -136,23 +449,33 @@ def optimize_code(request):
 @api_view(['POST'])
 def repository_analysis(request):
     """
-    Analyze the repository linked to a project and return a summary.
+    Analyze the repository linked to a project and return a summary. By default only the
+    changes since the previous analysis are analyzed ("mode": "incremental"); "full" re-reads
+    the repository and "map_reduce" analyzes every file of a large repository in chunks.
     """
     try:
         # Parse the input data from the request body
         data = json.loads(request.body)
         repo_url = data.get("repo_url")
+        mode = data.get("mode", "incremental")
 
         if not repo_url:
             return JsonResponse({"error": "Repository URL is required."}, status=400)
+        if mode not in ("incremental", "full", "map_reduce"):
+            return JsonResponse({"error": "'mode' must be 'incremental', 'full' or 'map_reduce'."}, status=400)
 
-        # Initialize AI Assist and analyze the repository
+        # Initialize AI Assist and analyze the repository, sharing the work with identical in-flight requests
         ai_assist = AIAssist()
-        analysis_result = ai_assist.analyze_repository(repo_url)
+        key = coalescing_key("repository_analysis", repo_url, ai_assist.get_repository_head(repo_url)[2], mode)
+        analysis_result, shared = get_single_flight().do(key, ai_assist.analyze_repository, repo_url, mode=mode)
 
         # Return the analysis result
-        return JsonResponse({"analysis_result": analysis_result}, status=200)
+        response = JsonResponse({"analysis_result": analysis_result}, status=200)
+        response["X-Kage-Coalesced"] = "true" if shared else "false"
+        return response
 
+    except PromptBudgetExceeded as e:
+        return JsonResponse({"error": str(e), "estimate": e.estimate.to_dict()}, status=413)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -171,13 +494,18 @@ def ai_assist_functionality(request):
         if not repo_url or not task_description:
             return JsonResponse({"error": "Both 'repo_url' and 'task_description' are required."}, status=400)
 
-        # Initialize AI Assist and generate JSON changes
+        # Initialize AI Assist and generate JSON changes, sharing the work with identical in-flight requests
         ai_assist = AIAssist()
-        json_changes = ai_assist.generate_json_changes(repo_url, task_description)
+        key = coalescing_key("json_changes", repo_url, ai_assist.get_repository_head(repo_url)[2], task_description)
+        json_changes, shared = get_single_flight().do(key, ai_assist.generate_json_changes, repo_url, task_description)
 
         # Return the JSON changes
-        return JsonResponse({"json_changes": json_changes}, status=200)
+        response = JsonResponse({"json_changes": json_changes}, status=200)
+        response["X-Kage-Coalesced"] = "true" if shared else "false"
+        return response
 
+    except PromptBudgetExceeded as e:
+        return JsonResponse({"error": str(e), "estimate": e.estimate.to_dict()}, status=413)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
@@ -242,9 +570,10 @@ def generate_json_changes_ai_assist(request):
         if not repo_url or not task_description:
             return JsonResponse({"error": "Both 'repo_url' and 'task_description' are required."}, status=400)
 
-        # Initialize AI Assist and generate JSON changes
+        # Initialize AI Assist and generate JSON changes, sharing the work with identical in-flight requests
         ai_assist = AIAssist()
-        json_changes_str = ai_assist.generate_json_changes(repo_url, task_description)
+        key = coalescing_key("json_changes", repo_url, ai_assist.get_repository_head(repo_url)[2], task_description)
+        json_changes_str, shared = get_single_flight().do(key, ai_assist.generate_json_changes, repo_url, task_description)
 
         # Sanitize the JSON changes string
         sanitized_json = AIAssist.sanitize_json_content(json_changes_str)
@@ -253,8 +582,12 @@ def generate_json_changes_ai_assist(request):
         json_changes = json.loads(sanitized_json)
 
         # Return the sanitized JSON changes
-        return JsonResponse({"json_changes": json_changes}, status=200)
+        response = JsonResponse({"json_changes": json_changes}, status=200)
+        response["X-Kage-Coalesced"] = "true" if shared else "false"
+        return response
 
+    except PromptBudgetExceeded as e:
+        return JsonResponse({"error": str(e), "estimate": e.estimate.to_dict()}, status=413)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
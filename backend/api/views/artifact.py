@@ -0,0 +1,57 @@
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from rest_framework.decorators import api_view
+from ..models import Artifact
+from ..utils.artifact_store import get_artifact_store
+from .profiling import is_profiling_admin
+
+
+@api_view(['GET'])
+def list_artifacts(request):
+    """
+    Lists stored artifacts, newest first, optionally filtered by ?project=, ?job= and ?kind=.
+    """
+    if not is_profiling_admin(request):
+        return JsonResponse({"error": "Not authorized."}, status=403)
+    try:
+        limit = min(int(request.GET.get("limit", 50)), 500)
+        artifacts = get_artifact_store().find(
+            project_name=request.GET.get("project"),
+            job_id=request.GET.get("job"),
+            kind=request.GET.get("kind"),
+        )[:limit]
+
+        artifact_list = []
+        for artifact in artifacts:
+            artifact_list.append({
+                "id": artifact.id,
+                "kind": artifact.kind,
+                "key": artifact.key,
+                "backend": artifact.backend,
+                "project_name": artifact.project_name,
+                "job_id": artifact.job_id,
+                "size": artifact.size,
+                "created_at": artifact.created_at.isoformat(),
+            })
+
+        return JsonResponse(artifact_list, safe=False, status=200)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@api_view(['GET'])
+def get_artifact(request, artifact_id):
+    """
+    Returns the (decompressed) content of a stored artifact.
+    """
+    if not is_profiling_admin(request):
+        return JsonResponse({"error": "Not authorized."}, status=403)
+    try:
+        artifact = get_object_or_404(Artifact, id=artifact_id)
+        content = get_artifact_store().read(artifact)
+        content_type = "application/json" if ".json" in artifact.key else "text/plain; charset=utf-8"
+        return HttpResponse(content, content_type=content_type)
+    except FileNotFoundError:
+        return JsonResponse({"error": "Artifact content is no longer available."}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
@@ -1,12 +1,14 @@
 from rest_framework.decorators import api_view
 from django.http import JsonResponse
-from google.cloud import storage
-from google.auth import default
-from googleapiclient.discovery import build
 
 @api_view(['GET'])
 def check_gcp_connection(request):
     try:
+        # Imported lazily so booting a worker does not load the GCP client libraries
+        from google.cloud import storage
+        from google.auth import default
+        from googleapiclient.discovery import build
+
         # Get default credentials and project
         credentials, project = default()
 
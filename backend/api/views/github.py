@@ -2,11 +2,11 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from ..models import GitHubToken, Project, GitHubRepository
 from ..utils.token_utils import TokenEncryptor
-from github import Github
 import json
 from rest_framework.decorators import api_view
 # from django.contrib.auth.models import User
 from ..utils.token_utils import get_token, get_token_obj
+from ..utils.clients import get_github_client
 
 encryptor = TokenEncryptor()
 
@@ -23,7 +23,7 @@ def manage_token(request):
 
         # Validate token by attempting GitHub call
         try:
-            g = Github(raw_token)
+            g = get_github_client(raw_token)
             user = g.get_user().login
         except Exception:
             return JsonResponse({"error": "Invalid token"}, status=400)
@@ -49,7 +49,7 @@ def list_repos(request):
         return JsonResponse({"error": "Token not set"}, status=400)
 
     try:
-        g = Github(token)
+        g = get_github_client(token)
         repos = g.get_user().get_repos()
         data = [{"name": r.name, "url": r.html_url} for r in repos]
         return JsonResponse(data, safe=False)
@@ -63,7 +63,7 @@ def repo_summary(request, repo_name):
         return JsonResponse({"error": "Token not set"}, status=400)
 
     try:
-        g = Github(token)
+        g = get_github_client(token)
         user = g.get_user()
         repo = user.get_repo(repo_name)
 
@@ -97,7 +97,7 @@ def check_github_token(request):
         return JsonResponse({"exists": False}, status=200)
 
     try:
-        g = Github(token)
+        g = get_github_client(token)
         user = g.get_user()
         return JsonResponse({"exists": True, "username": user.login}, status=200)
     except Exception as e:
@@ -128,7 +128,7 @@ def fetch_public_repos(request):
     user = request.user
     try:
         token = GitHubToken.objects.get(user=user).encrypted_token
-        g = Github(token)
+        g = get_github_client(token)
         repos = g.get_user().get_repos(visibility='public')
         data = [{"name": repo.name, "url": repo.html_url} for repo in repos]
         return JsonResponse(data, safe=False, status=200)
@@ -174,7 +174,7 @@ def create_repository(request):
             return JsonResponse({"error": "GitHub token not found."}, status=404)
 
         # Initialize the GitHub API client
-        github_client = Github(token)
+        github_client = get_github_client(token)
 
         # Check if the repository exists on GitHub
         try:
@@ -0,0 +1,9 @@
+from django.http import HttpResponse
+from ..utils.metrics import render_metrics
+
+
+def prometheus_metrics(request):
+    """
+    Exposes the process metrics in the Prometheus text exposition format.
+    """
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from rest_framework.decorators import api_view
+from ..utils.profiling import get_profile_store
+
+
+def is_profiling_admin(request) -> bool:
+    """
+    Profiles expose code paths and timings, traces SQL statements, URLs and exception messages,
+    and artifacts raw prompts, plans and repository contents, so all three are only served in
+    DEBUG or to callers presenting PROFILING_ADMIN_TOKEN as a bearer token.
+    """
+    if settings.DEBUG:
+        return True
+    token = settings.PROFILING_ADMIN_TOKEN
+    return bool(token) and request.headers.get("Authorization") == f"Bearer {token}"
+
+
+@api_view(['GET'])
+def list_profiles(request):
+    """
+    Lists captured request profiles, newest first.
+    """
+    if not is_profiling_admin(request):
+        return JsonResponse({"error": "Not authorized."}, status=403)
+    try:
+        return JsonResponse(get_profile_store().list(), safe=False, status=200)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@api_view(['GET'])
+def get_profile(request, profile_id):
+    """
+    Returns one profile: a pstats report for cProfile captures, collapsed stacks
+    (flamegraph.pl / speedscope input) for sampled captures.
+    """
+    if not is_profiling_admin(request):
+        return JsonResponse({"error": "Not authorized."}, status=403)
+    try:
+        profile = get_profile_store().get(profile_id)
+        if profile is None:
+            return JsonResponse({"error": "Profile not found."}, status=404)
+        return HttpResponse(profile["content"], content_type="text/plain; charset=utf-8")
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
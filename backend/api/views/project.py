@@ -7,6 +7,7 @@ from ..models import Project, Task, Employee, GitHubToken, GitHubRepository
 from ..serializers import ProjectSerializer, TaskSerializer
 from django.shortcuts import get_object_or_404
 from ..utils.token_utils import get_token, get_token_obj
+from ..utils.assignment import assign_tasks
 
 class ProjectViewSet(ModelViewSet):
     queryset = Project.objects.all()
@@ -309,6 +310,51 @@ def update_task(request, task_id):
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+@api_view(['POST'])
+def reassign_project_tasks(request, project_id):
+    """
+    Reassigns the project's open tasks to its current employees with the local assignment
+    engine, e.g. after team changes. No model call is made; tasks keep their assignee unless
+    moving them gives a better fit or a more balanced workload.
+    """
+    try:
+        project = get_object_or_404(Project, id=project_id)
+        employees = list(project.employees.order_by('id'))
+        if not employees:
+            return JsonResponse({"error": "The project has no employees to assign tasks to."}, status=400)
+
+        tasks = list(project.tasks.exclude(status='done').order_by('id'))
+        team = [{"name": e.name, "level": e.level, "department": e.department} for e in employees]
+        positions = {employee.id: index for index, employee in enumerate(employees)}
+        assignment = assign_tasks(
+            [{"department": task.department, "level": task.level} for task in tasks],
+            team,
+            current=[positions.get(task.employee_id) for task in tasks],
+        )
+
+        changed = []
+        for task, index in zip(tasks, assignment):
+            if task.employee_id != employees[index].id:
+                task.employee = employees[index]
+                changed.append(task)
+        Task.objects.bulk_update(changed, ['employee'])
+
+        return JsonResponse({
+            "message": f"Reassigned {len(changed)} of {len(tasks)} open tasks.",
+            "tasks": [
+                {
+                    "task_id": task.id,
+                    "description": task.description,
+                    "employee_id": employees[index].id,
+                    "employee_name": employees[index].name,
+                }
+                for task, index in zip(tasks, assignment)
+            ],
+        }, status=200)
+
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
 @api_view(['GET'])
 def get_project_employees(request, project_id):
     """
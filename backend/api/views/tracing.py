@@ -0,0 +1,60 @@
+from django.http import JsonResponse
+from rest_framework.decorators import api_view
+from ..utils.tracing import get_dropped_span_counts, get_recent_traces
+from .profiling import is_profiling_admin
+
+TRACES_UNAVAILABLE = "Recent traces are only kept with TRACING_BACKEND=memory."
+
+
+@api_view(['GET'])
+def list_traces(request):
+    """
+    Lists recent request traces, newest first, with their root span and total duration.
+    """
+    if not is_profiling_admin(request):
+        return JsonResponse({"error": "Not authorized."}, status=403)
+    try:
+        traces = get_recent_traces()
+        if traces is None:
+            return JsonResponse({"error": TRACES_UNAVAILABLE}, status=404)
+
+        limit = min(int(request.GET.get("limit", 50)), 500)
+        dropped = get_dropped_span_counts()
+        trace_list = []
+        for trace_id, spans in list(traces.items())[:limit]:
+            span_ids = {span["span_id"] for span in spans}
+            root = next((span for span in spans if span["parent_span_id"] not in span_ids), spans[0])
+            trace_list.append({
+                "trace_id": trace_id,
+                "name": root["name"],
+                "duration_ms": root["duration_ms"],
+                "status": root["status"],
+                "span_count": len(spans),
+                "dropped_spans": dropped.get(trace_id, 0),
+            })
+
+        return JsonResponse(trace_list, safe=False, status=200)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@api_view(['GET'])
+def get_trace(request, trace_id):
+    """
+    Returns every span kept for one trace, ordered by start time, and how many were dropped.
+    """
+    if not is_profiling_admin(request):
+        return JsonResponse({"error": "Not authorized."}, status=403)
+    try:
+        traces = get_recent_traces()
+        if traces is None:
+            return JsonResponse({"error": TRACES_UNAVAILABLE}, status=404)
+        if trace_id not in traces:
+            return JsonResponse({"error": "Trace not found."}, status=404)
+        return JsonResponse({
+            "trace_id": trace_id,
+            "spans": traces[trace_id],
+            "dropped_spans": get_dropped_span_counts().get(trace_id, 0),
+        }, status=200)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
@@ -16,6 +16,14 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def env_bool(name, default=False):
+    """Read a boolean flag such as '1', 'true' or 'yes' from the environment."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -47,6 +55,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.RequestIdMiddleware",
+    "api.middleware.TracingMiddleware",
+    "api.middleware.MetricsMiddleware",
+    "api.middleware.ProfilingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -122,6 +134,43 @@ DATABASES = {
     # }
 }
 
+# Local stand-in: DB_ENGINE=sqlite swaps Cloud SQL for the bundled db.sqlite3
+# (used for tests and benchmarks when no Postgres instance is reachable)
+if os.getenv('DB_ENGINE', 'postgresql') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('DB_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+    }
+
+# Persistent connections
+# https://docs.djangoproject.com/en/5.2/ref/databases/#persistent-connections
+# Without CONN_MAX_AGE every request pays a fresh TCP + TLS + auth handshake to Cloud SQL.
+# Health checks make a reused connection that the server has dropped reconnect
+# transparently instead of failing the first query of a request.
+DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = env_bool('DB_CONN_HEALTH_CHECKS', True)
+
+# Optional server-side connection pool (Django 5.1+, needs psycopg 3 with its pool extra, which
+# requirements.txt installs as `psycopg[binary,pool]`; Django prefers psycopg 3 over psycopg2).
+# https://docs.djangoproject.com/en/5.2/ref/databases/#connection-pool
+# The pool replaces persistent connections, so CONN_MAX_AGE must be 0 when it is enabled.
+if env_bool('DB_POOL') and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+    }
+
+# Opt-in request profiling (api.middleware.ProfilingMiddleware)
+# The X-Kage-Profile header is only honoured when PROFILING_ENABLED is on; a non-zero
+# PROFILING_SAMPLE_RATE profiles that fraction of all requests. /profiles/, /traces/ and
+# /artifacts/ require DEBUG or an "Authorization: Bearer <PROFILING_ADMIN_TOKEN>" header.
+PROFILING_ENABLED = env_bool('PROFILING_ENABLED', DEBUG)
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DEFAULT_MODE = os.getenv('PROFILING_DEFAULT_MODE', 'sample')
+PROFILING_ADMIN_TOKEN = os.getenv('PROFILING_ADMIN_TOKEN')
+
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
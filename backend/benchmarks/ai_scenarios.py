@@ -0,0 +1,260 @@
+"""
+Offline end-to-end benchmark of the AI, GitHub and project board endpoints.
+
+Starts the fake Gemini and fake GitHub servers, points the backend at them
+(GEMINI_BASE_URL / GITHUB_API_URL), creates a throwaway test database and drives each
+scenario through the Django test client, optionally from several threads. Reports per
+scenario p50 / p95 / mean latency, throughput, error count, DB queries per request and the
+number of model and GitHub calls each request made.
+
+    DB_ENGINE=sqlite python -m benchmarks.ai_scenarios --iterations 10 --concurrency 2
+    python -m benchmarks.ai_scenarios --scenarios board --iterations 200 --output bench_board.json
+    python -m benchmarks.ai_scenarios --repo-files 400 --model-latency-ms 1500 --token-rate 80
+
+PyGithub's default request spacing (0.25s) is kept so GitHub-heavy scenarios stay
+representative; pass --github-request-interval 0 to measure the backend's own overhead.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import setup_django, summarize_latencies, write_report
+from .fake_gemini import FakeGeminiServer
+from .fake_github import FakeGitHubServer
+
+TEAM = [
+    {"name": "Ada Analyst", "level": "Analyst", "department": "AI and Data"},
+    {"name": "Cole Consultant", "level": "Consultant", "department": "Cloud"},
+    {"name": "Sam Senior", "level": "Senior Consultant", "department": "Fullstack"},
+    {"name": "Mia Manager", "level": "Manager", "department": "Fullstack"},
+]
+TASK_DESCRIPTION = "Add input validation and error handling to every request handler."
+
+SCENARIO_GROUPS = {
+    "ai": ["ai_generate", "ai_repository_analysis", "ai_repository_analysis_map_reduce", "ai_generate_json_changes",
+           "ai_apply_json_changes"],
+    "board": ["board_projects", "board_project_details", "board_project_tasks", "board_update_task"],
+}
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class ScenarioContext:
+    """
+    Shared state for the scenarios: the fakes, the seeded board and the request payloads.
+    """
+
+    def __init__(self, github, repo_url, board_projects=20, tasks_per_project=25):
+        from api.models import Employee, Project, Task
+
+        self.github = github
+        self.repo_url = repo_url
+        employees = [Employee.objects.create(**member) for member in TEAM]
+        self.project_ids = []
+        self.task_ids = []
+        for index in range(board_projects):
+            project = Project.objects.create(name=f"Board project {index}", description="Seeded for benchmarks")
+            project.employees.set(employees)
+            tasks = Task.objects.bulk_create([
+                Task(project=project, employee=employees[number % len(employees)],
+                     description=f"Task {number} of project {index}", status="to-do")
+                for number in range(tasks_per_project)
+            ])
+            self.project_ids.append(project.id)
+            self.task_ids.extend(task.id for task in tasks)
+        self.employee_ids = [employee.id for employee in employees]
+        self.json_changes = None
+
+    def pick(self, values, iteration):
+        return values[iteration % len(values)]
+
+
+def ai_generate(client, context, iteration):
+    return client.post("/ai/generate", data=json.dumps({
+        "project_name": f"Benchmark plan {iteration}",
+        "project_description": "Build a document comparison assistant with a web front end and an audit trail.",
+        "team_roles": TEAM,
+    }), content_type="application/json")
+
+
+def ai_repository_analysis(client, context, iteration):
+    return client.post("/ai/repository-analysis", data=json.dumps({"repo_url": context.repo_url, "mode": "full"}),
+                       content_type="application/json")
+
+
+def ai_repository_analysis_map_reduce(client, context, iteration):
+    # File summaries are cached per blob SHA, so only the first iteration runs the map step
+    return client.post("/ai/repository-analysis", data=json.dumps({"repo_url": context.repo_url, "mode": "map_reduce"}),
+                       content_type="application/json")
+
+
+def ai_generate_json_changes(client, context, iteration):
+    response = client.post("/ai/generate-json-changes", data=json.dumps({
+        "repo_url": context.repo_url,
+        "task_description": TASK_DESCRIPTION,
+    }), content_type="application/json")
+    if response.status_code == 200 and context.json_changes is None:
+        context.json_changes = json.dumps(response.json()["json_changes"])
+    return response
+
+
+def ai_apply_json_changes(client, context, iteration):
+    if context.json_changes is None:
+        ai_generate_json_changes(client, context, iteration)
+    return client.post("/ai/apply-json-changes", data=json.dumps({
+        "repo_url": context.repo_url,
+        "json_changes": context.json_changes,
+    }), content_type="application/json")
+
+
+def board_projects(client, context, iteration):
+    return client.get("/project/")
+
+
+def board_project_details(client, context, iteration):
+    return client.get(f"/project/{context.pick(context.project_ids, iteration)}/")
+
+
+def board_project_tasks(client, context, iteration):
+    return client.get(f"/project/{context.pick(context.project_ids, iteration)}/tasks/")
+
+
+def board_update_task(client, context, iteration):
+    return client.patch(
+        f"/tasks/{context.pick(context.task_ids, iteration)}/update/",
+        data=json.dumps({"status": "in-progress" if iteration % 2 else "done",
+                         "employee_id": context.pick(context.employee_ids, iteration)}),
+        content_type="application/json",
+    )
+
+
+def run_scenario(name, context, gemini, iterations, concurrency):
+    """
+    Run one scenario `iterations` times on `concurrency` threads and summarize it.
+    """
+    from django.db import connection, connections
+    from django.test import Client
+
+    scenario = globals()[name]
+    latencies, queries, errors = [], [], []
+    lock = threading.Lock()
+    model_before, github_before = gemini.fake.stats()["requests"], context.github.fake.stats()["requests"]
+
+    def one(iteration):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                response = scenario(Client(), context, iteration)
+            status = response.status_code
+        except Exception as e:
+            status = repr(e)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed_ms)
+            queries.append(counter.count)
+            if status != 200:
+                errors.append(status)
+        connections.close_all()
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(iterations)))
+    wall_time = time.perf_counter() - wall_start
+
+    summary = summarize_latencies(latencies, wall_time)
+    summary.update({
+        "errors": len(errors),
+        "error_samples": [str(error) for error in errors[:3]],
+        "db_queries_per_request": round(sum(queries) / len(queries), 2) if queries else 0,
+        "model_calls_per_request": round((gemini.fake.stats()["requests"] - model_before) / iterations, 2),
+        "github_calls_per_request": round((context.github.fake.stats()["requests"] - github_before) / iterations, 2),
+    })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="ai,board",
+                        help="Comma separated scenario or group names (groups: ai, board)")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--repo-files", type=int, default=40, help="Code files in the synthetic repository")
+    parser.add_argument("--file-lines", type=int, default=60)
+    parser.add_argument("--model-latency-ms", type=float, default=300.0)
+    parser.add_argument("--token-rate", type=float, default=150.0)
+    parser.add_argument("--model-error-rate", type=float, default=0.0)
+    parser.add_argument("--github-latency-ms", type=float, default=0.0)
+    parser.add_argument("--github-request-interval", type=float, help="Override PyGithub's seconds_between_requests")
+    parser.add_argument("--board-projects", type=int, default=20)
+    parser.add_argument("--tasks-per-project", type=int, default=25)
+    parser.add_argument("--output", help="Optional path for the JSON report")
+    args = parser.parse_args()
+
+    gemini = FakeGeminiServer(latency_ms=args.model_latency_ms, token_rate=args.token_rate,
+                              error_rate=args.model_error_rate).start()
+    github = FakeGitHubServer(repos=f"bench:{args.repo_files}", file_lines=args.file_lines,
+                              latency_ms=args.github_latency_ms).start()
+
+    os.environ.update({
+        "GEMINI_BASE_URL": gemini.url,
+        "GITHUB_API_URL": github.url,
+        "GITHUB_PERSONAL_ACCESS_TOKEN": "fake-token",
+        "KAGE_GCP_PROJECT_ID": "kage-benchmark",
+        "KAGE_GOOGLE_APPLICATION_CREDENTIALS": "",
+        "AI_ASSIST_GOOGLE_APPLICATION_CREDENTIALS": "",
+        "KAGE_LOG_LEVEL": "WARNING",
+    })
+    os.environ.setdefault("ARTIFACT_BACKEND", "memory")
+    if args.github_request_interval is not None:
+        os.environ["GITHUB_SECONDS_BETWEEN_REQUESTS"] = str(args.github_request_interval)
+        os.environ["GITHUB_SECONDS_BETWEEN_WRITES"] = str(args.github_request_interval)
+
+    setup_django()
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    # A file-backed test database so worker threads share it (in-memory SQLite is per connection)
+    if connection.vendor == "sqlite":
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+
+    names = []
+    for entry in args.scenarios.split(","):
+        names.extend(SCENARIO_GROUPS.get(entry.strip(), [entry.strip()]))
+
+    try:
+        context = ScenarioContext(github, github.repo_url("bench"), args.board_projects, args.tasks_per_project)
+        results = {name: run_scenario(name, context, gemini, args.iterations, args.concurrency) for name in names}
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        gemini.stop()
+        github.stop()
+
+    write_report({
+        "benchmark": "ai_scenarios",
+        "vendor": connection.vendor,
+        "iterations": args.iterations,
+        "concurrency": args.concurrency,
+        "repo_files": args.repo_files,
+        "model_latency_ms": args.model_latency_ms,
+        "token_rate": args.token_rate,
+        "scenarios": results,
+        "model_tokens": {key: value for key, value in gemini.fake.stats().items() if key != "requests"},
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Shared helpers for the offline benchmark scripts.
+
+Run any benchmark from the backend root, e.g. `python -m benchmarks.db_connections`.
+"""
+import json
+import os
+import statistics
+import sys
+
+
+def setup_django():
+    """
+    Configure Django for a standalone benchmark run.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    django.setup()
+
+
+def percentile(samples, pct):
+    """
+    Return the pct-th percentile (0-100) of samples using linear interpolation.
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize_latencies(samples_ms, wall_time_s=None):
+    """
+    Summarize a list of latencies in milliseconds as p50/p95/mean (and throughput when wall time is known).
+    """
+    summary = {
+        "count": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "mean_ms": round(statistics.fmean(samples_ms), 3) if samples_ms else 0.0,
+        "max_ms": round(max(samples_ms), 3) if samples_ms else 0.0,
+    }
+    if wall_time_s:
+        summary["throughput_rps"] = round(len(samples_ms) / wall_time_s, 2)
+    return summary
+
+
+def write_report(report, output_path=None):
+    """
+    Print the JSON report and optionally write it to output_path.
+    """
+    text = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(text)
+    sys.stdout.write(text + "\n")
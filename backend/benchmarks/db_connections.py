@@ -0,0 +1,68 @@
+"""
+Benchmark the per-request cost of opening a database connection.
+
+Simulates the request lifecycle Django runs for every view (close_old_connections on
+request start and finish) around a single query, once with CONN_MAX_AGE=0 (a fresh
+connection per request, the old behaviour) and once with persistent connections.
+
+    DB_ENGINE=sqlite python -m benchmarks.db_connections --requests 500
+    python -m benchmarks.db_connections --requests 200 --output bench_db.json   # Cloud SQL / local Postgres
+"""
+import argparse
+import time
+
+from .common import setup_django, summarize_latencies, write_report
+
+
+def run_requests(connection, close_old_connections, conn_max_age, requests):
+    """
+    Run `requests` simulated requests with the given CONN_MAX_AGE and return latencies in ms.
+    """
+    connection.close()
+    connection.settings_dict["CONN_MAX_AGE"] = conn_max_age
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        close_old_connections()  # request_started
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        close_old_connections()  # request_finished
+        latencies.append((time.perf_counter() - start) * 1000)
+    connection.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--conn-max-age", type=int, default=60, help="CONN_MAX_AGE used for the persistent run")
+    parser.add_argument("--output", help="Optional path for the JSON report")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection, close_old_connections
+
+    configured = connection.settings_dict["CONN_MAX_AGE"]
+    fresh = run_requests(connection, close_old_connections, 0, args.requests)
+    persistent = run_requests(connection, close_old_connections, args.conn_max_age, args.requests)
+    connection.settings_dict["CONN_MAX_AGE"] = configured
+
+    fresh_summary = summarize_latencies(fresh)
+    persistent_summary = summarize_latencies(persistent)
+    write_report({
+        "benchmark": "db_connections",
+        "vendor": connection.vendor,
+        "host": connection.settings_dict.get("HOST") or None,
+        "requests": args.requests,
+        "fresh_connection": fresh_summary,
+        "persistent_connection": persistent_summary,
+        "saved_per_request_ms": {
+            "p50": round(fresh_summary["p50_ms"] - persistent_summary["p50_ms"], 3),
+            "mean": round(fresh_summary["mean_ms"] - persistent_summary["mean_ms"], 3),
+        },
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Local stand-in for the Gemini `generateContent` REST API.
+
+Answers every `POST /v1beta/models/<model>:generateContent` after a simulated delay of
+`latency_ms` (time to first token) plus `response tokens / token_rate` seconds, with a
+reply shaped after the prompt:
+
+- Kage plan prompts (team roster lines "- Name (Level: ..., Department: ...)") get a
+  ProjectPlan JSON assigning `plan_tasks` tasks round-robin over the roster, or in two-phase
+  mode ("**Tag Decomposed Tasks") tasks tagged round-robin with the roster departments, every
+  fourth one a Senior Consultant integration task. Workstream plan prompts ("**Workstream:**")
+  name the workstream in each task description. Compact plan prompts (numbered roster,
+  "task_id|member number|description" or "task_id|level|department|description") get the
+  same plans as pipe-separated records
+- Kage re-plan prompts ("**Current Tasks") get a delta: two added tasks, the open tasks of
+  removed team members reassigned to the first roster member and the last open task removed
+- Kage workstream prompts ("independent areas of work") get `workstreams` workstreams
+- AI Assist change prompts ("**Task Description:**") get a JSON list of line changes for the
+  listed repository files
+- AI Assist analysis prompts ("**Repository Structure:**", "**Module Summaries:**" for the
+  map-reduce reduce step or "**Previous Findings:**" for incremental updates) get tasks and
+  refactors JSON
+- map-reduce map prompts ("**Files to Summarize:**") get a summary per "### File:" section,
+  module condense prompts ("**Summarize Module:**") a short paragraph
+- anything else gets a short text reply
+
+Replies longer than the request's max output tokens are cut off with finish reason
+MAX_TOKENS. A continuation request (the cut off reply sent back as a "model" turn) gets the
+rest of the reply for its first user turn, unless it has a response schema: like Gemini's
+constrained decoding, a schema always yields a new complete document.
+
+`error_rate` makes that fraction of requests fail with 429 to exercise the retry policy.
+Point the backend at it with GEMINI_BASE_URL=http://127.0.0.1:<port>.
+
+    python -m benchmarks.fake_gemini --port 8091 --latency-ms 400 --token-rate 120
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROSTER_PATTERN = re.compile(r"^\s*- (?:\d+: )?(.+?) \(Level: (.+?), Department: (.+?)\)\s*$", re.MULTILINE)
+FILE_PATTERN = re.compile(r"^\s*- (\S+\.\w+)\s*$", re.MULTILINE)
+FILE_HEADER_PATTERN = re.compile(r"^### File: (\S+)\s*$", re.MULTILINE)
+CURRENT_TASK_PATTERN = re.compile(r"^- \[(\d+)\] .+ \((.+?), (.+?)\)\s*$", re.MULTILINE)
+WORKSTREAM_PATTERN = re.compile(r"^\*\*Workstream:\*\* (.+?):", re.MULTILINE)
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def prompt_text(body):
+    return "\n".join(
+        part.get("text", "")
+        for content in body.get("contents", [])
+        for part in content.get("parts", [])
+    )
+
+
+class FakeGemini:
+    def __init__(self, latency_ms=300.0, token_rate=150.0, plan_tasks=12, error_rate=0.0, seed=None, workstreams=3):
+        self.latency_ms = latency_ms
+        self.token_rate = token_rate
+        self.plan_tasks = plan_tasks
+        self.workstreams = workstreams
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.last_request = None
+        self._lock = threading.Lock()
+
+    def reply_for(self, prompt):
+        if "**Task Description:**" in prompt:
+            files = FILE_PATTERN.findall(prompt.split("**Repository Structure:**", 1)[-1].split("**Instructions:**", 1)[0])
+            changes = [
+                {"file_path": path, "line_number": 1, "action": "add", "content": f"// reviewed: change {index}"}
+                for index, path in enumerate(files[:5])
+            ]
+            return json.dumps(changes, indent=2)
+        if "**Files to Summarize:**" in prompt:
+            return json.dumps({"files": [
+                {"path": path, "summary": f"Request handlers for {path}; no input validation or tests."}
+                for path in FILE_HEADER_PATTERN.findall(prompt)
+            ]}, indent=2)
+        if "**Summarize Module:**" in prompt:
+            return "Request handlers without input validation or tests."
+        if any(marker in prompt for marker in ("**Repository Structure:**", "**Module Summaries:**", "**Previous Findings:**")):
+            return json.dumps({
+                "tasks": [{"description": f"Add tests for module {index}."} for index in range(5)],
+                "refactors": [{"description": f"Split oversized module {index}."} for index in range(3)],
+            }, indent=2)
+        if "**Current Tasks" in prompt:
+            return self.plan_delta(prompt)
+        if "independent areas of work" in prompt:
+            return json.dumps({"workstreams": [
+                {"name": f"Workstream {index + 1}", "description": f"Component {index + 1} of the project."}
+                for index in range(self.workstreams)
+            ]}, indent=2)
+        roster = ROSTER_PATTERN.findall(prompt)
+        workstream = WORKSTREAM_PATTERN.search(prompt)
+        package = f"{workstream.group(1)} work package" if workstream else "work package"
+        if roster and "task_id|level|department|description" in prompt:
+            departments = sorted({department for _, _, department in roster})
+            return "\n".join(
+                f"{index + 1}|{'S' if index % 4 == 3 else 'AC'[index % 2]}|{departments[index % len(departments)]}|"
+                f"Deliver {package} {index + 1}: design, implement and review the component."
+                for index in range(self.plan_tasks)
+            ) + "\n"
+        if roster and "task_id|member number|description" in prompt:
+            return "\n".join(
+                f"{index + 1}|{index % len(roster) + 1}|Deliver {package} {index + 1}: design, implement and review the component."
+                for index in range(self.plan_tasks)
+            ) + "\n"
+        if roster and "**Tag Decomposed Tasks" in prompt:
+            departments = sorted({department for _, _, department in roster})
+            tasks = [
+                {
+                    "task_id": index + 1,
+                    "description": f"Deliver {package} {index + 1}: design, implement and review the component.",
+                    "department": departments[index % len(departments)],
+                    "level": "Senior Consultant" if index % 4 == 3 else ("Analyst", "Consultant")[index % 2],
+                }
+                for index in range(self.plan_tasks)
+            ]
+            return json.dumps({"tasks": tasks}, indent=2)
+        names = [name for name, _, _ in roster]
+        if names:
+            tasks = [
+                {
+                    "task_id": index + 1,
+                    "description": f"Deliver {package} {index + 1}: design, implement and review the component.",
+                    "employee_name": names[index % len(names)],
+                }
+                for index in range(self.plan_tasks)
+            ]
+            return json.dumps({"tasks": tasks}, indent=2)
+        return "This is a simulated response."
+
+    def plan_delta(self, prompt):
+        roster = ROSTER_PATTERN.findall(prompt.split("**Current Tasks (", 1)[0])
+        removed_line = re.search(r"^Team members removed, no longer available: (.+)$", prompt, re.MULTILINE)
+        removed_members = set(removed_line.group(1).split(", ")) if removed_line else set()
+        open_tasks = [(int(task_id), assignee) for task_id, assignee, status in CURRENT_TASK_PATTERN.findall(prompt)
+                      if status != "done"]
+        tagged = "`department`" in prompt
+
+        def task(task_id, description, index):
+            if tagged:
+                return {"task_id": task_id, "description": description, "department": roster[index % len(roster)][2],
+                        "level": ("Analyst", "Consultant")[index % 2]}
+            return {"task_id": task_id, "description": description, "employee_name": roster[index % len(roster)][0]}
+
+        removed = [open_tasks[-1][0]] if open_tasks else []
+        return json.dumps({
+            "added": [task(0, f"Deliver change package {index + 1}: implement the updated scope.", index) for index in range(2)],
+            "modified": [
+                task(task_id, f"Take over task {task_id} from {assignee}.", 0)
+                for task_id, assignee in open_tasks if assignee in removed_members and task_id not in removed
+            ],
+            "removed": removed,
+        }, indent=2)
+
+    def generate(self, body):
+        """
+        Return (status, payload) for a generateContent request body.
+        """
+        with self._lock:
+            self.requests += 1
+            self.last_request = body
+            fail = self.random.random() < self.error_rate
+        if fail:
+            return 429, {"error": {"code": 429, "message": "Resource exhausted (simulated).", "status": "RESOURCE_EXHAUSTED"}}
+
+        prompt = prompt_text(body)
+        system_instruction = "".join(part.get("text", "") for part in body.get("systemInstruction", {}).get("parts", []))
+        contents = body.get("contents", [])
+        config = body.get("generationConfig") or {}
+        schema = config.get("response_schema") or config.get("responseSchema")
+        if len(contents) > 1 and contents[1].get("role") == "model" and not schema:
+            first_turn = prompt_text({"contents": contents[:1]})
+            sent = prompt_text({"contents": contents[1:2]})
+            text = self.reply_for(f"{system_instruction}\n{first_turn}")
+            text = text[len(sent):] if text.startswith(sent) else text
+        else:
+            text = self.reply_for(f"{system_instruction}\n{prompt}")
+
+        max_tokens = config.get("maxOutputTokens") or config.get("max_output_tokens")
+        finish_reason = "STOP"
+        if max_tokens and estimate_tokens(text) > max_tokens:
+            text, finish_reason = text[:max_tokens * 4], "MAX_TOKENS"
+        prompt_tokens, response_tokens = estimate_tokens(system_instruction + prompt), estimate_tokens(text)
+        time.sleep(self.latency_ms / 1000 + response_tokens / self.token_rate)
+
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.response_tokens += response_tokens
+        return 200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": finish_reason}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": response_tokens,
+                "totalTokenCount": prompt_tokens + response_tokens,
+            },
+        }
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "prompt_tokens": self.prompt_tokens, "response_tokens": self.response_tokens}
+
+
+def make_handler(fake):
+    class FakeGeminiHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not self.path.split("?")[0].endswith(":generateContent"):
+                self._send(404, {"error": {"code": 404, "message": "Not found."}})
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            self._send(*fake.generate(body))
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeGeminiHandler
+
+
+class FakeGeminiServer:
+    """
+    Runs a FakeGemini on a background thread; `url` is the GEMINI_BASE_URL to use.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, **options):
+        self.fake = FakeGemini(**options)
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.fake))
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Simulated time to first token")
+    parser.add_argument("--token-rate", type=float, default=150.0, help="Simulated output tokens per second")
+    parser.add_argument("--plan-tasks", type=int, default=12, help="Tasks per generated Kage plan")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--workstreams", type=int, default=3, help="Workstreams per Kage workstream listing")
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(
+        port=args.port,
+        latency_ms=args.latency_ms,
+        token_rate=args.token_rate,
+        plan_tasks=args.plan_tasks,
+        error_rate=args.error_rate,
+        workstreams=args.workstreams,
+    )
+    print(f"Fake Gemini listening on {server.url}")
+    server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
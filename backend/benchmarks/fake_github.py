@@ -0,0 +1,417 @@
+"""
+Local stand-in for the parts of the GitHub REST API the backend uses through PyGithub.
+
+Serves synthetic repositories generated from a size spec ("name:files", e.g.
+"small:20,medium:200,large:1000"), with code files spread over nested directories.
+Implemented endpoints:
+
+- GET  /user, /repos/<owner>/<repo>
+- GET  /repos/<owner>/<repo>/contents/<path>?ref=   (directory listings and files)
+- PUT  /repos/<owner>/<repo>/contents/<path>        (update_file, creates a commit)
+- GET  /repos/<owner>/<repo>/branches/<branch>
+- POST /repos/<owner>/<repo>/git/refs                (create_git_ref)
+- GET  /repos/<owner>/<repo>/git/trees/<sha>?recursive=1
+- GET  /repos/<owner>/<repo>/git/blobs/<sha>
+- GET  /repos/<owner>/<repo>/compare/<base>...<head>
+
+`latency_ms` delays every response. Point the backend at it with
+GITHUB_API_URL=http://127.0.0.1:<port> and repo URLs https://github.com/<owner>/<repo>.
+
+    python -m benchmarks.fake_github --port 8092 --repos small:20,large:1000
+"""
+import argparse
+import base64
+import difflib
+import hashlib
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+OWNER = "kage-bench"
+EXTENSIONS = (".py", ".js", ".ts", ".tsx", ".css", ".html")
+
+
+def blob_sha(content):
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def synthetic_file(path, lines):
+    body = [f"// {path}"] + [f"export function handler{index}(input) {{ return input + {index}; }}" for index in range(lines - 1)]
+    return "\n".join(body) + "\n"
+
+
+def synthetic_files(file_count, file_lines=60, files_per_dir=10):
+    """
+    Deterministic source tree: `file_count` code files in directories of `files_per_dir`,
+    grouped two levels deep, plus a README and a lock file the analyzer skips.
+    """
+    files = {"README.md": "# Synthetic repository\n", "package-lock.json": "{}\n"}
+    for index in range(file_count):
+        directory = f"src/area_{index // (files_per_dir * 10)}/module_{index // files_per_dir}"
+        path = f"{directory}/file_{index}{EXTENSIONS[index % len(EXTENSIONS)]}"
+        files[path] = synthetic_file(path, file_lines)
+    return files
+
+
+class FakeRepository:
+    def __init__(self, name, files, default_branch="main"):
+        self.name = name
+        self.default_branch = default_branch
+        self.commits = {}
+        self.branches = {}
+        self._lock = threading.Lock()
+        self.branches[default_branch] = self._commit(None, dict(files), "Initial commit")
+
+    def _commit(self, parent, files, message):
+        sha = hashlib.sha1(f"{parent}:{message}:{len(self.commits)}".encode("utf-8")).hexdigest()
+        self.commits[sha] = {"sha": sha, "parent": parent, "files": files, "message": message}
+        return sha
+
+    def resolve(self, ref):
+        """
+        Return the commit sha for a branch name or sha (None for unknown refs).
+        """
+        ref = ref or self.default_branch
+        if ref in self.branches:
+            return self.branches[ref]
+        return ref if ref in self.commits else None
+
+    def files_at(self, ref):
+        sha = self.resolve(ref)
+        return self.commits[sha]["files"] if sha else None
+
+    def update_file(self, branch, path, content, message):
+        with self._lock:
+            head = self.resolve(branch)
+            files = dict(self.commits[head]["files"])
+            files[path] = content
+            self.branches[branch] = self._commit(head, files, message)
+            return self.branches[branch]
+
+    def create_branch(self, branch, sha):
+        with self._lock:
+            if branch in self.branches:
+                return False
+            self.branches[branch] = sha
+            return True
+
+
+class FakeGitHub:
+    def __init__(self, repos="small:20,medium:200", file_lines=60, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self.repositories = {}
+        for spec in filter(None, repos.split(",")):
+            name, _, count = spec.partition(":")
+            self.repositories[name] = FakeRepository(name, synthetic_files(int(count or 20), file_lines))
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests}
+
+
+def make_handler(fake):
+    class FakeGitHubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        @property
+        def base(self):
+            return f"http://{self.headers.get('Host')}"
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("X-RateLimit-Limit", "5000")
+            self.send_header("X-RateLimit-Remaining", "4999")
+            self.send_header("X-RateLimit-Resource", "core")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _not_found(self):
+            self._send(404, {"message": "Not Found", "documentation_url": "https://docs.github.com/rest"})
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length)) if length else {}
+
+        def _route(self):
+            fake.count_request()
+            if fake.latency_ms:
+                time.sleep(fake.latency_ms / 1000)
+            parsed = urllib.parse.urlsplit(self.path)
+            query = urllib.parse.parse_qs(parsed.query)
+            parts = [urllib.parse.unquote(part) for part in parsed.path.strip("/").split("/")]
+            if parts == ["user"]:
+                return self._user()
+            if len(parts) < 3 or parts[0] != "repos" or parts[2] not in fake.repositories:
+                return None
+            return parts[3:], fake.repositories[parts[2]], query
+
+        def do_GET(self):
+            routed = self._route()
+            if not isinstance(routed, tuple):
+                return None if routed else self._not_found()
+            rest, repo, query = routed
+            ref = query.get("ref", [None])[0]
+            if not rest:
+                return self._send(200, self._repo_json(repo))
+            if rest[0] == "contents":
+                return self._contents(repo, "/".join(rest[1:]), ref)
+            if rest[0] == "branches" and len(rest) > 1:
+                return self._branch(repo, "/".join(rest[1:]))
+            if rest[:2] == ["git", "trees"] and len(rest) == 3:
+                return self._tree(repo, rest[2], query.get("recursive", ["0"])[0] not in ("0", ""))
+            if rest[:2] == ["git", "blobs"] and len(rest) == 3:
+                return self._blob(repo, rest[2])
+            if rest[0] == "compare" and len(rest) > 1:
+                base, _, head = "/".join(rest[1:]).partition("...")
+                return self._compare(repo, base, head)
+            return self._not_found()
+
+        def do_PUT(self):
+            routed = self._route()
+            if not isinstance(routed, tuple):
+                return None if routed else self._not_found()
+            rest, repo, _ = routed
+            if not rest or rest[0] != "contents":
+                return self._not_found()
+            path, body = "/".join(rest[1:]), self._body()
+            branch = body.get("branch") or repo.default_branch
+            files = repo.files_at(branch)
+            if files is None:
+                return self._not_found()
+            if path in files and body.get("sha") != blob_sha(files[path]):
+                return self._send(409, {"message": f"{path} does not match {body.get('sha')}"})
+            content = base64.b64decode(body.get("content", "")).decode("utf-8")
+            commit_sha = repo.update_file(branch, path, content, body.get("message", "Update"))
+            return self._send(200, {
+                "content": self._file_json(repo, path, content, branch, include_content=False),
+                "commit": self._commit_json(repo, commit_sha),
+            })
+
+        def do_POST(self):
+            routed = self._route()
+            if not isinstance(routed, tuple):
+                return None if routed else self._not_found()
+            rest, repo, _ = routed
+            if rest != ["git", "refs"]:
+                return self._not_found()
+            body = self._body()
+            branch = body.get("ref", "").removeprefix("refs/heads/")
+            if not repo.create_branch(branch, body.get("sha")):
+                return self._send(422, {"message": "Reference already exists"})
+            return self._send(201, {
+                "ref": body["ref"],
+                "url": f"{self.base}/repos/{OWNER}/{repo.name}/git/refs/heads/{branch}",
+                "object": {"sha": body["sha"], "type": "commit", "url": f"{self.base}/repos/{OWNER}/{repo.name}/git/commits/{body['sha']}"},
+            })
+
+        def _user(self):
+            self._send(200, {"login": OWNER, "id": 1, "type": "User", "url": f"{self.base}/users/{OWNER}"})
+            return True
+
+        def _repo_json(self, repo):
+            return {
+                "id": abs(hash(repo.name)) % 10 ** 8,
+                "name": repo.name,
+                "full_name": f"{OWNER}/{repo.name}",
+                "owner": {"login": OWNER, "id": 1, "type": "User", "url": f"{self.base}/users/{OWNER}"},
+                "private": False,
+                "default_branch": repo.default_branch,
+                "url": f"{self.base}/repos/{OWNER}/{repo.name}",
+                "html_url": f"https://github.com/{OWNER}/{repo.name}",
+            }
+
+        def _file_json(self, repo, path, content, ref, include_content=True):
+            url = f"{self.base}/repos/{OWNER}/{repo.name}/contents/{urllib.parse.quote(path)}?ref={ref}"
+            payload = {
+                "type": "file",
+                "name": path.rsplit("/", 1)[-1],
+                "path": path,
+                "sha": blob_sha(content),
+                "size": len(content.encode("utf-8")),
+                "url": url,
+                "git_url": f"{self.base}/repos/{OWNER}/{repo.name}/git/blobs/{blob_sha(content)}",
+                "html_url": f"https://github.com/{OWNER}/{repo.name}/blob/{ref}/{path}",
+                "download_url": None,
+            }
+            if include_content:
+                payload["encoding"] = "base64"
+                payload["content"] = base64.b64encode(content.encode("utf-8")).decode("ascii")
+            return payload
+
+        def _contents(self, repo, path, ref):
+            ref = ref or repo.default_branch
+            files = repo.files_at(ref)
+            if files is None:
+                return self._not_found()
+            path = path.strip("/")
+            if path in files:
+                return self._send(200, self._file_json(repo, path, files[path], ref))
+
+            prefix = f"{path}/" if path else ""
+            entries = {}
+            for file_path, content in files.items():
+                if not file_path.startswith(prefix):
+                    continue
+                name, _, remainder = file_path[len(prefix):].partition("/")
+                if remainder:
+                    entries.setdefault(name, {
+                        "type": "dir",
+                        "name": name,
+                        "path": prefix + name,
+                        "sha": hashlib.sha1((prefix + name).encode("utf-8")).hexdigest(),
+                        "size": 0,
+                        "url": f"{self.base}/repos/{OWNER}/{repo.name}/contents/{urllib.parse.quote(prefix + name)}?ref={ref}",
+                    })
+                else:
+                    entries[name] = self._file_json(repo, file_path, content, ref, include_content=False)
+            if not entries:
+                return self._not_found()
+            return self._send(200, [entries[name] for name in sorted(entries)])
+
+        def _branch(self, repo, branch):
+            sha = repo.branches.get(branch)
+            if sha is None:
+                return self._send(404, {"message": "Branch not found"})
+            return self._send(200, {
+                "name": branch,
+                "commit": self._commit_json(repo, sha),
+                "protected": False,
+            })
+
+        def _commit_json(self, repo, sha):
+            commit = repo.commits[sha]
+            return {
+                "sha": sha,
+                "url": f"{self.base}/repos/{OWNER}/{repo.name}/commits/{sha}",
+                "commit": {"message": commit["message"], "tree": {"sha": sha}},
+                "parents": [{"sha": commit["parent"]}] if commit["parent"] else [],
+            }
+
+        def _tree(self, repo, ref, recursive):
+            files = repo.files_at(ref)
+            if files is None:
+                return self._not_found()
+            entries = []
+            directories = set()
+            for path in sorted(files):
+                if not recursive and "/" in path:
+                    directories.add(path.split("/", 1)[0])
+                    continue
+                segments = path.split("/")
+                for depth in range(1, len(segments)):
+                    directories.add("/".join(segments[:depth]))
+                entries.append({"path": path, "mode": "100644", "type": "blob", "sha": blob_sha(files[path]),
+                                "size": len(files[path].encode("utf-8")),
+                                "url": f"{self.base}/repos/{OWNER}/{repo.name}/git/blobs/{blob_sha(files[path])}"})
+            entries += [{"path": directory, "mode": "040000", "type": "tree",
+                         "sha": hashlib.sha1(directory.encode("utf-8")).hexdigest()} for directory in sorted(directories)]
+            return self._send(200, {"sha": repo.resolve(ref), "url": f"{self.base}/repos/{OWNER}/{repo.name}/git/trees/{ref}",
+                                    "tree": entries, "truncated": False})
+
+        def _blob(self, repo, sha):
+            for commit in repo.commits.values():
+                for content in commit["files"].values():
+                    if blob_sha(content) == sha:
+                        return self._send(200, {
+                            "sha": sha,
+                            "size": len(content.encode("utf-8")),
+                            "encoding": "base64",
+                            "content": base64.b64encode(content.encode("utf-8")).decode("ascii"),
+                            "url": f"{self.base}/repos/{OWNER}/{repo.name}/git/blobs/{sha}",
+                        })
+            return self._not_found()
+
+        def _compare(self, repo, base, head):
+            base_files, head_files = repo.files_at(base), repo.files_at(head)
+            if base_files is None or head_files is None:
+                return self._not_found()
+            changed = []
+            for path in sorted(set(base_files) | set(head_files)):
+                before, after = base_files.get(path), head_files.get(path)
+                if before == after:
+                    continue
+                status = "added" if before is None else "removed" if after is None else "modified"
+                changed.append({
+                    "filename": path,
+                    "status": status,
+                    "sha": blob_sha(after) if after is not None else None,
+                    "additions": len((after or "").splitlines()),
+                    "deletions": len((before or "").splitlines()),
+                    "changes": len((after or "").splitlines()) + len((before or "").splitlines()),
+                    "patch": "".join(difflib.unified_diff(
+                        (before or "").splitlines(keepends=True), (after or "").splitlines(keepends=True), n=1,
+                    )).split("\n", 2)[-1],
+                })
+            commits = []
+            sha = repo.resolve(head)
+            while sha and sha != repo.resolve(base):
+                commits.append(self._commit_json(repo, sha))
+                sha = repo.commits[sha]["parent"]
+            self._send(200, {
+                "status": "ahead" if commits else "identical",
+                "ahead_by": len(commits),
+                "behind_by": 0,
+                "total_commits": len(commits),
+                "commits": list(reversed(commits)),
+                "files": changed,
+                "url": f"{self.base}/repos/{OWNER}/{repo.name}/compare/{base}...{head}",
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return FakeGitHubHandler
+
+
+class FakeGitHubServer:
+    """
+    Runs a FakeGitHub on a background thread; `url` is the GITHUB_API_URL to use.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, **options):
+        self.fake = FakeGitHub(**options)
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.fake))
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def repo_url(self, name):
+        return f"https://github.com/{OWNER}/{name}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8092)
+    parser.add_argument("--repos", default="small:20,medium:200,large:1000", help="Comma separated name:file_count specs")
+    parser.add_argument("--file-lines", type=int, default=60)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every response")
+    args = parser.parse_args()
+
+    server = FakeGitHubServer(port=args.port, repos=args.repos, file_lines=args.file_lines, latency_ms=args.latency_ms)
+    print(f"Fake GitHub listening on {server.url}; repositories: {', '.join(server.fake.repositories)}")
+    server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Measure cold-start import cost of the Django app with `python -X importtime`.
+
+Boots Django and imports the URLconf (which imports every view module) in a fresh
+interpreter, then reports the total import time, the slowest modules and whether any
+of the heavy AI / GCP SDKs were loaded eagerly.
+
+    python -m benchmarks.import_time --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+from .common import write_report
+
+# SDKs that must only be imported on first use, never while booting a worker
+HEAVY_MODULES = [
+    "vertexai",
+    "google.cloud.aiplatform",
+    "google.genai",
+    "langchain_core",
+    "langchain_google_vertexai",
+    "googleapiclient.discovery",
+    "google.cloud.storage",
+    "github",
+]
+
+BOOT_SCRIPT = """
+import os, sys
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+import django
+django.setup()
+import api.urls
+print(",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` output into a list of (module, self_us, cumulative_us, top_level).
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        # Nested imports are indented by two spaces per level after the leading separator space
+        top_level = not module[1:].startswith(" ")
+        rows.append((module.strip(), int(self_us), int(cumulative_us), top_level))
+    return rows
+
+
+def measure_cold_start(top=10):
+    """
+    Boot Django in a fresh interpreter and return a cold-start import report.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", BOOT_SCRIPT.format(heavy=HEAVY_MODULES)],
+        cwd=BACKEND_DIR,
+        env=os.environ.copy(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = parse_importtime(result.stderr)
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    total_us = sum(cumulative for _, _, cumulative, top_level in rows if top_level)
+    slowest = sorted(rows, key=lambda row: row[1], reverse=True)[:top]
+    return {
+        "total_import_ms": round(total_us / 1000, 1),
+        "heavy_modules_loaded": loaded,
+        "slowest_modules": [
+            {"module": module, "self_ms": round(self_us / 1000, 1), "cumulative_ms": round(cumulative_us / 1000, 1)}
+            for module, self_us, cumulative_us, _ in slowest
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest modules to report")
+    parser.add_argument("--output", help="Optional path for the JSON report")
+    args = parser.parse_args()
+    write_report({"benchmark": "import_time", **measure_cold_start(args.top)}, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Concurrent load driver for the project board APIs.
+
+Sends a weighted mix of requests to a running backend from N worker threads for a fixed
+duration, once per concurrency level, and reports throughput and p50 / p95 latency per
+endpoint and level, so the point where latency climbs or errors start shows the board's
+scaling limit. Project, task and employee ids are drawn from the database the server uses
+(run from the backend root with the same environment); load it first with
+
+    python manage.py generate_load_data --employees 50000 --projects 10000 --tasks 1000000
+
+then, with the server running:
+
+    python -m benchmarks.load_board --base-url http://127.0.0.1:8000 --concurrency 1,8,32 --duration 30
+    python -m benchmarks.load_board --mix details:1,tasks:1 --output bench_board_load.json
+
+Endpoints in the mix: list (GET /project/), details (GET /project/<id>/),
+tasks (GET /project/<id>/tasks/) and update (PATCH /tasks/<id>/update/).
+GET /project/ returns every project with its tasks, so expect it to dominate at volume.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+
+from .common import setup_django, summarize_latencies, write_report
+
+DEFAULT_MIX = "list:1,details:4,tasks:4,update:1"
+
+
+def id_ranges():
+    """
+    Return (min, max) id ranges for projects, tasks and employees from the database.
+    """
+    setup_django()
+    from django.db.models import Max, Min
+    from api.models import Employee, Project, Task
+
+    ranges = {}
+    for name, model in (("project", Project), ("task", Task), ("employee", Employee)):
+        bounds = model.objects.aggregate(low=Min("id"), high=Max("id"))
+        if bounds["low"] is None:
+            raise SystemExit(f"No {name} rows found; run `python manage.py generate_load_data` first.")
+        ranges[name] = (bounds["low"], bounds["high"])
+    return ranges
+
+
+def build_request(endpoint, base_url, ranges, rng):
+    """
+    Return (method, url, body) for one request to `endpoint`.
+    """
+    if endpoint == "list":
+        return "GET", f"{base_url}/project/", None
+    if endpoint == "details":
+        return "GET", f"{base_url}/project/{rng.randint(*ranges['project'])}/", None
+    if endpoint == "tasks":
+        return "GET", f"{base_url}/project/{rng.randint(*ranges['project'])}/tasks/", None
+    if endpoint == "update":
+        body = {"status": rng.choice(["pending", "in_progress", "done"]), "employee_id": rng.randint(*ranges["employee"])}
+        return "PATCH", f"{base_url}/tasks/{rng.randint(*ranges['task'])}/update/", json.dumps(body).encode("utf-8")
+    raise ValueError(f"Unknown endpoint {endpoint}")
+
+
+def send(method, url, body, timeout):
+    request = urllib.request.Request(url, data=body, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except Exception as e:
+        return type(e).__name__
+
+
+def run_level(concurrency, duration, mix, base_url, ranges, timeout, seed):
+    """
+    Drive the mix from `concurrency` threads for `duration` seconds.
+    """
+    endpoints, weights = zip(*mix.items())
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(endpoints, weights)[0]
+            method, url, body = build_request(endpoint, base_url, ranges, rng)
+            start = time.perf_counter()
+            status = send(method, url, body, timeout)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies[endpoint].append(elapsed_ms)
+                statuses[endpoint][str(status)] += 1
+
+    wall_start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - wall_start
+
+    report = {"concurrency": concurrency, "wall_time_s": round(wall_time, 2), "endpoints": {}}
+    total = 0
+    for endpoint in endpoints:
+        summary = summarize_latencies(latencies[endpoint], wall_time)
+        summary["statuses"] = dict(statuses[endpoint])
+        report["endpoints"][endpoint] = summary
+        total += len(latencies[endpoint])
+    report["throughput_rps"] = round(total / wall_time, 2) if wall_time else 0.0
+    report["error_rate"] = round(
+        sum(count for counter in statuses.values() for status, count in counter.items() if status != "200") / total, 4
+    ) if total else 0.0
+    return report
+
+
+def parse_mix(value):
+    mix = {}
+    for entry in value.split(","):
+        name, _, weight = entry.partition(":")
+        if float(weight or 1) > 0:
+            mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma separated worker counts, one run each")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per concurrency level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint:weight pairs (list, details, tasks, update)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Optional path for the JSON report")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    ranges = id_ranges()
+    levels = [run_level(int(level), args.duration, mix, args.base_url.rstrip("/"), ranges, args.timeout, args.seed)
+              for level in args.concurrency.split(",")]
+
+    write_report({
+        "benchmark": "load_board",
+        "base_url": args.base_url,
+        "mix": mix,
+        "id_ranges": ranges,
+        "levels": levels,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
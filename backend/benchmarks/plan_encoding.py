@@ -0,0 +1,96 @@
+"""
+Compare the JSON and the compact (KAGE_PLAN_FORMAT=compact) Kage plan encodings.
+
+For each plan size, runs Kage end to end against the fake Gemini server in both formats and
+reports the model's output tokens and the plan generation latency, plus the reduction the
+compact format gives. The fake server's delay grows with the reply length (`--token-rate`
+output tokens per second), like a real model's decoding time.
+
+    python -m benchmarks.plan_encoding --tasks 10,25,50 --iterations 3 --token-rate 80
+"""
+import argparse
+import os
+import time
+
+from .common import setup_django, summarize_latencies, write_report
+from .fake_gemini import FakeGeminiServer
+
+TEAM = [
+    {"name": "Ada Analyst", "level": "Analyst", "department": "AI and Data"},
+    {"name": "Cole Consultant", "level": "Consultant", "department": "Cloud"},
+    {"name": "Sam Senior", "level": "Senior Consultant", "department": "Fullstack"},
+    {"name": "Mia Manager", "level": "Manager", "department": "Fullstack"},
+]
+PROJECT_DESCRIPTION = "Build a customer portal with single sign-on, billing history and a support ticket inbox."
+
+
+def run_format(plan_format, plan_tasks, iterations, latency_ms, token_rate):
+    from api.utils.kage import Kage
+
+    gemini = FakeGeminiServer(latency_ms=latency_ms, token_rate=token_rate, plan_tasks=plan_tasks).start()
+    os.environ.update({"GEMINI_BASE_URL": gemini.url, "KAGE_PLAN_FORMAT": plan_format})
+    try:
+        kage = Kage()
+        latencies, tasks = [], 0
+        for _ in range(iterations):
+            started = time.perf_counter()
+            plan = kage.generate_project_plan("Plan encoding", PROJECT_DESCRIPTION, TEAM)
+            latencies.append((time.perf_counter() - started) * 1000)
+            tasks = len(plan["tasks"])
+        stats = gemini.fake.stats()
+    finally:
+        gemini.stop()
+    return {
+        "tasks": tasks,
+        "output_tokens_per_plan": stats["response_tokens"] // max(1, stats["requests"]),
+        "model_requests": stats["requests"],
+        "latency": summarize_latencies(latencies),
+    }
+
+
+def reduction(json_value, compact_value):
+    return round(100.0 * (json_value - compact_value) / json_value, 1) if json_value else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", default="10,25,50", help="Comma-separated plan sizes")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--model-latency-ms", type=float, default=300.0)
+    parser.add_argument("--token-rate", type=float, default=80.0)
+    parser.add_argument("--output", help="Optional path for the JSON report")
+    args = parser.parse_args()
+
+    os.environ.update({
+        "KAGE_GCP_PROJECT_ID": "kage-benchmark",
+        "KAGE_GOOGLE_APPLICATION_CREDENTIALS": "",
+        "KAGE_LOG_LEVEL": "WARNING",
+        "KAGE_CONTEXT_CACHE": "off",
+        "ARTIFACT_BACKEND": "none",
+    })
+    setup_django()
+
+    results = {}
+    for plan_tasks in [int(value) for value in args.tasks.split(",")]:
+        formats = {
+            plan_format: run_format(plan_format, plan_tasks, args.iterations, args.model_latency_ms, args.token_rate)
+            for plan_format in ("json", "compact")
+        }
+        json_result, compact_result = formats["json"], formats["compact"]
+        results[str(plan_tasks)] = {
+            **formats,
+            "output_token_reduction_pct": reduction(json_result["output_tokens_per_plan"], compact_result["output_tokens_per_plan"]),
+            "p50_latency_reduction_pct": reduction(json_result["latency"]["p50_ms"], compact_result["latency"]["p50_ms"]),
+        }
+
+    write_report({
+        "benchmark": "plan_encoding",
+        "iterations": args.iterations,
+        "model_latency_ms": args.model_latency_ms,
+        "token_rate": args.token_rate,
+        "plans": results,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()